@@ -0,0 +1,343 @@
+import os
+import sys
+sys.path.append('./')
+
+import re
+import glob
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import threading
+import contextlib
+import tracemalloc
+import statistics
+
+import webMCTS.task as task_module
+from webMCTS.task import MCTS_Task
+from utils.logger import configure_logging
+from utils.state_store import tree_memory, release_tree
+
+"""
+用合成延迟的LLM替身端到端运行 MCTS_Task.run()，可重复地度量并发与缓存改动的效果
+python3 benchmark.py --indices 17 23 --repeats 3 --engine=async --parallel_workers=4 \
+    --latency_policy=lognormal:2.0,0.4 --latency_world=lognormal:4.0,0.4 --time_scale=0.01
+"""
+
+INTERACTIVE_RE = re.compile(r"\[(\d+)\] (?:link|button|menuitem|tab|checkbox|img) '")
+
+
+class Latency(object):
+    """
+        延迟分布(秒)：const:x | uniform:a,b | lognormal:median,sigma | exp:mean
+    """
+    def __init__(self, spec: str, time_scale=1.0) -> None:
+        self.spec = spec
+        self.kind, _, params = spec.partition(':')
+        self.params = [float(p) for p in params.split(',')] if params else []
+        self.time_scale = time_scale
+        if self.kind not in ('const', 'uniform', 'lognormal', 'exp'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random):
+        if self.kind == 'const':
+            seconds = self.params[0]
+        elif self.kind == 'uniform':
+            seconds = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == 'lognormal':
+            seconds = self.params[0] * rng.lognormvariate(0, self.params[1])
+        else:  # exp
+            seconds = rng.expovariate(1 / self.params[0])
+        return seconds * self.time_scale
+
+
+class FakeBackends(object):
+    """
+        替换 webMCTS.task 中的 policy/world/reward 调用：
+        :: policy 从当前页面的可交互元素中随机点击(以stop_p的概率stop)
+        :: world  从config_files的页面状态池中随机返回一个页面
+        :: reward 以solve_p的概率给出满分5，否则在1~4中均匀取值
+        同时统计各角色的请求数与在途请求数
+    """
+    def __init__(self, states, latencies, seed=0, stop_p=0.05, solve_p=0.02) -> None:
+        self.states = states
+        self.latencies = latencies          # dict{str: Latency}, [role: latency]
+        self.rng = random.Random(seed)
+        self.stop_p = stop_p
+        self.solve_p = solve_p
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = {'policy': 0, 'world': 0, 'reward': 0}
+        self.requests = 0
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.inflight_area = 0.0            # float, 在途请求数对时间的积分
+        self.last_change = time.time()
+
+    def _change_inflight(self, delta):
+        now = time.time()
+        self.inflight_area += self.inflight * (now - self.last_change)
+        self.last_change = now
+        self.inflight += delta
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+
+    def _begin(self, role, n=1):
+        with self.lock:
+            self.calls[role] += n
+            self.requests += 1
+            self._change_inflight(1)
+            return self.latencies[role].sample(self.rng)
+
+    def _end(self):
+        with self.lock:
+            self._change_inflight(-1)
+
+    def _policy_response(self, prompt):
+        observation = prompt[-1]['content'].split('\nOBSERVATION:\n')[-1]
+        with self.lock:
+            ids = INTERACTIVE_RE.findall(observation)
+            if not ids or self.rng.random() < self.stop_p:
+                action = "stop [N/A]"
+            else:
+                action = f"click [{self.rng.choice(ids)}]"
+        return f"Let's think step-by-step. The page shows the element I need. In summary, the next action I will perform is ```{action}```"
+
+    def _world_response(self):
+        with self.lock:
+            state = self.rng.choice(self.states)
+        return f"<a11y>\n{state}\n</a11y>"
+
+    def _reward_response(self):
+        with self.lock:
+            score = 5 if self.rng.random() < self.solve_p else self.rng.randint(1, 4)
+        return f"Reason: The trajectory makes progress toward the objective. Score: {score}"
+
+    def _respond(self, role, prompt):
+        if role == 'policy':
+            return self._policy_response(prompt)
+        if role == 'world':
+            return self._world_response()
+        return self._reward_response()
+
+    def call(self, role, prompt, n=None):
+        latency = self._begin(role, n or 1)
+        try:
+            time.sleep(latency)
+        finally:
+            self._end()
+        if n is None:
+            return self._respond(role, prompt)
+        return [self._respond(role, prompt) for _ in range(n)]
+
+    async def call_async(self, role, prompt, n=None):
+        latency = self._begin(role, n or 1)
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            self._end()
+        if n is None:
+            return self._respond(role, prompt)
+        return [self._respond(role, prompt) for _ in range(n)]
+
+    def install(self):
+        task_module.get_proposal = lambda prompt, *args, **kwargs: self.call('policy', prompt)
+        task_module.get_proposals = lambda prompt, model, n=1, **kwargs: self.call('policy', prompt, n)
+        task_module.get_state = lambda prompt, *args, **kwargs: self.call('world', prompt)
+        task_module.get_value = lambda prompt, *args, **kwargs: self.call('reward', prompt)
+        task_module.get_proposal_async = lambda prompt, *args, **kwargs: self.call_async('policy', prompt)
+        task_module.get_proposals_async = lambda prompt, model, n=1, **kwargs: self.call_async('policy', prompt, n)
+        task_module.get_state_async = lambda prompt, *args, **kwargs: self.call_async('world', prompt)
+        task_module.get_value_async = lambda prompt, *args, **kwargs: self.call_async('reward', prompt)
+        # 模糊匹配只做精确比较，不计入LLM请求
+        task_module.is_same_action = lambda action1, action2, n=1: action1 == action2
+
+
+class ThreadSampler(object):
+    """后台线程周期性采样存活线程数"""
+    def __init__(self, interval=0.01) -> None:
+        self.interval = interval
+        self.peak_threads = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def load_states(limit):
+    states = []
+    for config_file in sorted(glob.glob("./config_files/*.json"))[:limit]:
+        with open(config_file, 'r') as file:
+            states.append(json.load(file)['state'])
+    return states
+
+
+def build_task(args, data):
+    task = MCTS_Task(
+        data=data['intent'],
+        state=data['state'],
+        policy_method=args.policy_method,
+        reward_method=args.reward_method,
+        world_method=args.world_method,
+        time_limit=args.time_limit * 1000 if args.time_limit else None,
+        iteration_limit=None if args.time_limit else args.iterations,
+        branch=args.branch,
+        roll_branch=args.roll_branch,
+        roll_forward_steps=args.roll_forward_steps,
+        end_gate=args.end_gate,
+        use_reflection='common',
+        engine=args.engine,
+        parallel_workers=args.parallel_workers,
+        batch_proposals=args.batch_proposals,
+        use_transposition=args.use_transposition,
+        value_cache_path=args.value_cache_path,
+        world_cache_path=args.world_cache_path,
+        world_cache_samples=args.world_cache_samples,
+    )
+    task.save_llm_cache = lambda: None      # 替身不产生模糊匹配结果，避免改写fuzzy_match.json
+    return task
+
+
+def run_once(args, backends, index, data, seed):
+    random.seed(seed)
+    backends.rng.seed(seed)
+    backends.reset()
+    task = build_task(args, data)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    time_start = time.time()
+    with ThreadSampler() as sampler, open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            root, node, finish = task.run()
+    wall = time.time() - time_start
+    cpu = time.process_time() - cpu_start
+    with backends.lock:
+        backends._change_inflight(0)
+    peak_memory = tracemalloc.get_traced_memory()[1] / 2 ** 20 if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    rounds = max(root.numVisits, 1)
+    solved = finish != -1
+    result = {
+        'index': index,
+        'seed': seed,
+        'wall_s': wall,
+        'rounds': root.numVisits,
+        'rounds_per_s': root.numVisits / wall,
+        'solved': solved,
+        'time_to_solution_s': wall if solved else None,
+        'best_V': node.V,
+        'policy_calls_per_round': backends.calls['policy'] / rounds,
+        'world_calls_per_round': backends.calls['world'] / rounds,
+        'reward_calls_per_round': backends.calls['reward'] / rounds,
+        'value_cache_hit_rate': task.value_cache.stats()['hit_rate'],
+        'world_cache_hit_rate': task.world_cache.stats()['hit_rate'],
+        'requests_per_round': backends.requests / rounds,
+        'cpu_utilization': cpu / wall,
+        'avg_inflight': backends.inflight_area / wall,
+        'peak_inflight': backends.peak_inflight,
+        'peak_threads': sampler.peak_threads,
+        'peak_traced_mb': peak_memory,
+        'tree_bytes_per_node': tree_memory(root)['bytes_per_node'],
+    }
+    release_tree(root)
+    return result
+
+
+def summarize(results):
+    keys = ['wall_s', 'rounds_per_s', 'requests_per_round', 'policy_calls_per_round', 'world_calls_per_round',
+            'reward_calls_per_round', 'value_cache_hit_rate', 'world_cache_hit_rate',
+            'cpu_utilization', 'avg_inflight', 'peak_inflight', 'peak_threads', 'peak_traced_mb',
+            'tree_bytes_per_node']
+    summary = {'runs': len(results), 'solved': sum(r['solved'] for r in results)}
+    for key in keys:
+        values = [r[key] for r in results if r[key] is not None]
+        if values:
+            summary[key] = statistics.mean(values)
+    solved_times = [r['time_to_solution_s'] for r in results if r['solved']]
+    summary['time_to_solution_s'] = statistics.mean(solved_times) if solved_times else None
+    summary['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--indices', type=int, nargs='+', default=[17])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policy_method', type=str, default='gpt-4o')
+    parser.add_argument('--reward_method', type=str, default='gpt-4o')
+    parser.add_argument('--world_method', type=str, default='gpt-4o')
+    parser.add_argument('--engine', type=str, default='thread', choices=['thread', 'async'])
+    parser.add_argument('--parallel_workers', type=int, default=1)
+    parser.add_argument('--batch_proposals', action='store_true')
+    parser.add_argument('--use_transposition', action='store_true')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--time_limit', type=float, default=None, help='seconds; overrides --iterations')
+    parser.add_argument('--branch', type=int, default=2)
+    parser.add_argument('--roll_branch', type=int, default=0)
+    parser.add_argument('--roll_forward_steps', type=int, default=0)
+    parser.add_argument('--end_gate', type=float, default=4.75)
+    parser.add_argument('--latency_policy', type=str, default='lognormal:2.0,0.4')
+    parser.add_argument('--latency_world', type=str, default='lognormal:4.0,0.4')
+    parser.add_argument('--latency_reward', type=str, default='lognormal:2.0,0.4')
+    parser.add_argument('--time_scale', type=float, default=0.01, help='multiplier applied to every sampled latency')
+    parser.add_argument('--stop_p', type=float, default=0.05, help='probability that the fake policy issues stop')
+    parser.add_argument('--solve_p', type=float, default=0.02, help='probability that the fake reward gives score 5')
+    parser.add_argument('--state_pool', type=int, default=50, help='number of config states the fake world samples from')
+    parser.add_argument('--value_cache_path', type=str, default=None, help='on-disk reward cache (default: memory only, fresh per run)')
+    parser.add_argument('--world_cache_path', type=str, default=None, help='on-disk world transition cache (default: memory only, fresh per run)')
+    parser.add_argument('--world_cache_samples', type=int, default=1)
+    parser.add_argument('--tracemalloc', action='store_true', help='report traced peak memory (slows the search)')
+    parser.add_argument('--output', type=str, default=None, help='append per-run results as JSONL')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    latencies = {
+        'policy': Latency(args.latency_policy, args.time_scale),
+        'world': Latency(args.latency_world, args.time_scale),
+        'reward': Latency(args.latency_reward, args.time_scale),
+    }
+    backends = FakeBackends(load_states(args.state_pool), latencies, seed=args.seed, stop_p=args.stop_p, solve_p=args.solve_p)
+    backends.install()
+    if not args.verbose:
+        # 搜索日志不输出到终端，级别与JSONL日志仍按 WEBMCTS_LOG_* 环境变量配置
+        configure_logging(
+            level=os.environ.get("WEBMCTS_LOG_LEVEL", "INFO"),
+            sample=os.environ.get("WEBMCTS_LOG_SAMPLE", ""),
+            jsonl=os.environ.get("WEBMCTS_LOG_JSONL"),
+            stdout=False,
+        )
+
+    results = []
+    for index in args.indices:
+        with open(f"./config_files/{index}.json", 'r') as file:
+            data = json.load(file)
+        for repeat in range(args.repeats):
+            result = run_once(args, backends, index, data, seed=args.seed + repeat)
+            results.append(result)
+            print(json.dumps(result))
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(json.dumps({**vars(args), **result}) + '\n')
+
+    print('=' * 40)
+    for key, value in summarize(results).items():
+        print(f"{key:>24}: {value:.3f}" if isinstance(value, float) else f"{key:>24}: {value}")
@@ -13,6 +13,8 @@ from utils.prune_mcts import prune_traj_tree, LLM_CACHE
 from utils.traj_utils import extract_valuable_trajectories
 from webMCTS.prompt import webarena_cot_id_actrees2str_no_na_prompt as policy_agent_prompt
 from utils.obs_opt import get_obs_highlight
+from utils.state_store import tree_memory
+from utils.tree_file import TreeReader
 
 
 MAX_RETRY=5
@@ -145,9 +147,15 @@ def saving_traceable_traj(intent: str, trajectory):
 def main(file_path):
     file_name = file_path.split('/')[-1]
     data = read_json_file(file_path)
-    root = build_tree_from_json(data['trace'])
+    if 'tree_file' in data:
+        with TreeReader(os.path.join(os.path.dirname(file_path), data['tree_file'])) as reader:
+            tree, states = reader.subtree(reader.root_id)
+    else:
+        tree, states = data['trace'], data.get('states')
+    root = build_tree_from_json(tree, states=states)
     print('>>> 完成json格式数据向treeNode轨迹树结构数据转化')
     print('>>> 一共得到{}个节点'.format(root.get_visible_node_number()))
+    print('>>> 轨迹树内存: {}'.format(tree_memory(root)))
     
     prune_traj_tree(root)
     print('>>> 完成treeNode轨迹树的合并/剪枝')
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import inspect
+import functools
+import contextvars
+from threading import Lock
+from utils.logger import get_logger
+
+"""
+    LLM录制/回放(cassette)层：
+    :: record  正常请求LLM，同时把 prompt hash -> response (以及耗时) 追加到cassette文件(JSONL)
+    :: replay  不访问网络，按录制顺序返回同一prompt hash的response，可按录制耗时sleep以复现墙钟时间
+    环境变量：
+    :: LLM_CASSETTE_MODE      off | record | replay，默认off
+    :: LLM_CASSETTE_PATH      cassette文件路径，默认 ./data/cassette.jsonl
+    :: LLM_CASSETTE_LATENCY   回放耗时缩放系数，默认0(不sleep)，1为按录制耗时回放
+    搜索本身含有随机性(UCB并列时随机选择、流水线扩展取最先返回的提案)，完全复现需固定 `random` 的种子并按录制耗时回放；
+    回放偏离录制路径时，缺失的请求按该函数请求失败处理并计入misses
+"""
+
+logger = get_logger('cassette')
+_inside_cassette = contextvars.ContextVar('inside_cassette', default=False)
+
+
+class Cassette(object):
+    def __init__(self, mode='off', path='./data/cassette.jsonl', latency_scale=0.0) -> None:
+        self.lock = Lock()
+        self.configure(mode, path, latency_scale)
+
+    def configure(self, mode='off', path='./data/cassette.jsonl', latency_scale=0.0):
+        if mode not in ('off', 'record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.latency_scale = latency_scale
+        self.tapes: dict = {}           # dict{str: list[dict]}, [key: 按录制顺序的记录]
+        self.cursor: dict = {}          # dict{str: int}, [key: 下一条回放的位置]
+        self.hits = 0
+        self.misses = 0
+        if mode == 'replay':
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette {self.path} does not exist")
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # 录制中途退出时最后一行可能不完整
+                self.tapes.setdefault(record['key'], []).append(record)
+        logger.info(">>> 从%s加载了%d条LLM录制记录", self.path, sum(len(tape) for tape in self.tapes.values()))
+
+    def record(self, key, name, response, latency):
+        line = json.dumps({'key': key, 'fn': name, 'response': response, 'latency': latency}, ensure_ascii=False) + '\n'
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def play(self, key, name):
+        """
+            返回 (命中, 录制记录)；同一key被多次请求时按录制顺序依次返回，用完后从头循环
+        """
+        with self.lock:
+            tape = self.tapes.get(key)
+            if not tape:
+                self.misses += 1
+                logger.warning("[Cassette] %s 没有对应的录制记录: %s", name, key)
+                return False, None
+            self.hits += 1
+            position = self.cursor.get(key, 0)
+            self.cursor[key] = position + 1
+            return True, tape[position % len(tape)]
+
+
+CASSETTE = Cassette(
+    mode=os.environ.get("LLM_CASSETTE_MODE", "off"),
+    path=os.environ.get("LLM_CASSETTE_PATH", "./data/cassette.jsonl"),
+    latency_scale=float(os.environ.get("LLM_CASSETTE_LATENCY", "0")),
+)
+
+def set_cassette(mode='off', path='./data/cassette.jsonl', latency_scale=0.0):
+    CASSETTE.configure(mode, path, latency_scale)
+
+
+def _cassette_key(name, signature, skip_self, args, kwargs):
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    if skip_self:
+        arguments.pop(next(iter(signature.parameters)))
+    payload = json.dumps([name, arguments], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def cassette(name, empty=None, skip_self=False):
+    """
+        给LLM调用函数(同步或协程)加上录制/回放
+        :: name: str, 录制名，同步与协程版本使用同一个name，录制结果可以跨引擎回放
+        :: empty: 回放缺失时的返回值，与该函数请求失败时的返回值一致
+        :: skip_self: bool, 被装饰的是方法时不把self计入key
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if CASSETTE.mode == 'off' or _inside_cassette.get():
+                    return await func(*args, **kwargs)
+                key = _cassette_key(name, signature, skip_self, args, kwargs)
+                if CASSETTE.mode == 'replay':
+                    hit, record = CASSETTE.play(key, name)
+                    if not hit:
+                        return empty
+                    if CASSETTE.latency_scale > 0:
+                        await asyncio.sleep(record['latency'] * CASSETTE.latency_scale)
+                    return record['response']
+                # 协程版本可能在线程中退化调用同步版本，标记后内层不再重复录制(to_thread会复制contextvars)
+                token = _inside_cassette.set(True)
+                try:
+                    time_start = time.time()
+                    response = await func(*args, **kwargs)
+                    CASSETTE.record(key, name, response, time.time() - time_start)
+                finally:
+                    _inside_cassette.reset(token)
+                return response
+            return wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if CASSETTE.mode == 'off' or _inside_cassette.get():
+                return func(*args, **kwargs)
+            key = _cassette_key(name, signature, skip_self, args, kwargs)
+            if CASSETTE.mode == 'replay':
+                hit, record = CASSETTE.play(key, name)
+                if not hit:
+                    return empty
+                if CASSETTE.latency_scale > 0:
+                    time.sleep(record['latency'] * CASSETTE.latency_scale)
+                return record['response']
+            token = _inside_cassette.set(True)
+            try:
+                time_start = time.time()
+                response = func(*args, **kwargs)
+                CASSETTE.record(key, name, response, time.time() - time_start)
+            finally:
+                _inside_cassette.reset(token)
+            return response
+        return wrapper
+
+    return decorator
@@ -0,0 +1,81 @@
+import os
+import asyncio
+import weakref
+from threading import Lock
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+"""
+    按 (base_url, api_key) 共享的 OpenAI 客户端，同一服务的所有请求复用同一个 keep-alive 连接池：
+    :: `models/models.py` 的各服务商、`utils/query_llm.py` 的 LLMAPI(模糊匹配/反思)与 merge.py 都从这里取客户端，
+    ::     不再为每次 `is_same_action` 新建客户端(新连接池意味着每个短请求都重新建立TCP/TLS连接)
+    :: 异步客户端的连接池绑定在事件循环上，因此按事件循环分别缓存
+    :: 客户端自身的重试关闭(max_retries=0)，重试统一由 `models/retry.py` 负责
+    环境变量 WEBMCTS_HTTP_POOL(每个服务的最大连接数，默认64)、WEBMCTS_HTTP_TIMEOUT(读取超时秒数，默认120)、
+    WEBMCTS_HTTP_CONNECT_TIMEOUT(连接超时秒数，默认10)
+"""
+
+
+class ClientRegistry(object):
+    def __init__(self, max_connections=64, timeout=120.0, connect_timeout=10.0) -> None:
+        self.lock = Lock()
+        self.clients: dict = {}                             # dict{(base_url, api_key): OpenAI}
+        self.async_clients = weakref.WeakKeyDictionary()    # {event_loop: {(base_url, api_key): AsyncOpenAI}}
+        self.configure(max_connections, timeout, connect_timeout)
+
+    def configure(self, max_connections=None, timeout=None, connect_timeout=None):
+        """
+            之后新建的客户端使用新的连接池大小与超时；已创建的客户端被丢弃，下次请求时重建
+        """
+        with self.lock:
+            if max_connections is not None:
+                self.max_connections = max_connections
+            if timeout is not None:
+                self.timeout = timeout
+            if connect_timeout is not None:
+                self.connect_timeout = connect_timeout
+            self.clients.clear()
+            self.async_clients = weakref.WeakKeyDictionary()
+
+    def _limits(self):
+        # keep-alive 连接数与最大连接数一致，并发的短请求结束后连接都留在池中复用
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        return {'limits': limits, 'timeout': httpx.Timeout(self.timeout, connect=self.connect_timeout)}
+
+    def get(self, base_url, api_key) -> OpenAI:
+        key = (base_url, api_key or '')
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = OpenAI(
+                    api_key=api_key, base_url=base_url, max_retries=0, http_client=httpx.Client(**self._limits())
+                )
+            return self.clients[key]
+
+    def get_async(self, base_url, api_key) -> AsyncOpenAI:
+        """返回当前事件循环下的异步客户端"""
+        loop = asyncio.get_running_loop()
+        key = (base_url, api_key or '')
+        with self.lock:
+            clients = self.async_clients.setdefault(loop, {})
+            if key not in clients:
+                clients[key] = AsyncOpenAI(
+                    api_key=api_key, base_url=base_url, max_retries=0, http_client=httpx.AsyncClient(**self._limits())
+                )
+            return clients[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.clients),
+                'async_clients': sum(len(clients) for clients in self.async_clients.values()),
+                'max_connections': self.max_connections,
+                'timeout': self.timeout,
+            }
+
+
+CLIENTS = ClientRegistry(
+    max_connections=int(os.environ.get("WEBMCTS_HTTP_POOL", "64")),
+    timeout=float(os.environ.get("WEBMCTS_HTTP_TIMEOUT", "120")),
+    connect_timeout=float(os.environ.get("WEBMCTS_HTTP_CONNECT_TIMEOUT", "10")),
+)
@@ -1,13 +1,25 @@
 import re
+import asyncio
 
 from models.models import *
+from models.cassette import cassette
 from utils.text_utils import *
 from utils.obs_opt import *
+from utils.logger import get_logger
+
+llm_logger = get_logger('llm')
+parse_logger = get_logger('parse')
 
 prefix_string_world = "In summary, the next web page observation is "
 prefix_string_policy = "In summary, the next action I will perform is"
 
+# 流式回复的结束条件，分别与 parse_action_thinking / extract_a11y_prediction / washing_value_4_reward_model 的正则匹配同一段内容
+POLICY_CLOSURE = StreamClosure(r"In summary, the next action I will perform is\s*```.*?```", triggers='`', flags=re.DOTALL | re.IGNORECASE)
+WORLD_CLOSURE = StreamClosure(r"<a11y>[\s\S]*?</a11y>", triggers='>')
+REWARD_CLOSURE = StreamClosure(r"Reason:\s*.*?\s*Score:\s*\d+\D")     # 分数之后出现非数字字符，分数才完整
+
 
+@cassette('proposal', empty=[])
 def get_proposal(
     prompt: str, 
     policy_model: str, 
@@ -19,49 +31,72 @@ def get_proposal(
     do_sample: bool = True, 
     max_new_tokens: int = 4096
     ):
-    response = []
-    cnt = 2
-    
     if policy_model == 'deepseek-chat':
-        while not response and cnt:
-            response = deepseek(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = deepseek(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, until=POLICY_CLOSURE)
         if not response:
-            print(f'obtain<{policy_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', policy_model)
             return []
         else:
             return response
     elif 'qwen' in policy_model:
-        while not response and cnt:
-            response = qwen(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = qwen(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, until=POLICY_CLOSURE)
         if not response:
-            print(f'obtain<{policy_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', policy_model)
             return []
         else:
             return response
     elif 'gpt' in policy_model or 'claude' in policy_model:
-        while not response and cnt:
-            response = gpt(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = gpt(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, until=POLICY_CLOSURE)
         if not response:
-            print(f'obtain<{policy_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', policy_model)
             return []
         else:
             return response
     elif policy_model == 'Qwen/Qwen2.5-72B-Instruct':
-        while not response and cnt:
-            response = siliconflow(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = siliconflow(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens)
         if not response:
-            print(f'obtain<{policy_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', policy_model)
             return []
         else:
             return response
     else:
-        print('This method of getting responses is not yet supported!\n')
+        llm_logger.warning('This method of getting responses is not yet supported!\n')
         return []
 
+@cassette('proposals', empty=[])
+def get_proposals(
+    prompt: str, 
+    policy_model: str, 
+    n: int = 1, 
+    temperature: float = 0.7, 
+    max_tokens: int = 4096, 
+    seed: int = 170, 
+    max_length: int = 8192, 
+    truncation: bool = True,
+    do_sample: bool = True, 
+    max_new_tokens: int = 4096
+    ):
+    """
+        单次请求(n=k)采样多个策略回复，few-shot prompt只发送一次；返回回复列表
+    """
+    if policy_model == 'deepseek-chat':
+        response = deepseek_n(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, n=n)
+    elif 'qwen' in policy_model:
+        response = qwen_n(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, n=n)
+    elif 'gpt' in policy_model or 'claude' in policy_model:
+        response = gpt_n(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, n=n)
+    else:
+        # 不支持n采样的后端，逐个请求
+        response = [get_proposal(
+            prompt, policy_model, temperature=temperature, max_tokens=max_tokens, seed=seed, 
+            max_length=max_length, truncation=truncation, do_sample=do_sample, max_new_tokens=max_new_tokens
+        ) for _ in range(n)]
+        response = [r for r in response if r]
+    if not response:
+        llm_logger.warning('obtain<%s>response fail!\n', policy_model)
+    return response
+
+@cassette('state', empty=[])
 def get_state(
     prompt: str, 
     world_method: str, 
@@ -73,66 +108,54 @@ def get_state(
     do_sample: bool = True, 
     max_new_tokens: int = 4096
     ):
-    response = []
-    cnt = 2
-    
     if world_method == 'deepseek-chat':
-        while not response and cnt:
-            response = deepseek(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = deepseek(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens, until=WORLD_CLOSURE)
         if not response:
-            print(f'obtain<{world_method}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', world_method)
             return []
         else:
             return response
     
     elif 'gpt' in world_method:
-        while not response and cnt:
-            response = gpt(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = gpt(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens, until=WORLD_CLOSURE)
         if not response:
-            print(f'obtain<{world_method}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', world_method)
             return []
         else:
             return response
     
     elif 'qwen' in world_method:
-        while not response and cnt:
-            response = qwen(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = qwen(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens, until=WORLD_CLOSURE)
         if not response:
-            print(f'obtain<{world_method}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', world_method)
             return []
         else:
             return response
     
     elif world_method == 'Qwen/Qwen2.5-72B-Instruct':
-        while not response and cnt:
-            response = siliconflow(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = siliconflow(prompt, model=world_method, temperature=temperature, max_tokens=max_tokens)
         if not response:
-            print(f'obtain<{world_method}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', world_method)
             return []
         else:
             return response
     
     elif world_method == 'local':
-        while not response and cnt:
-            response = local_inference_model(
-                prompt, max_length=max_length, truncation=truncation, do_sample=do_sample,
-                max_new_tokens=max_new_tokens, temperature=temperature
-            )
-            cnt -= 1
+        response = local_inference_model(
+            prompt, max_length=max_length, truncation=truncation, do_sample=do_sample,
+            max_new_tokens=max_new_tokens, temperature=temperature
+        )
         if not response:
-            print(f'obtain<{world_method}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', world_method)
             return []
         else:
             return response
     
     else:
-        print('This method of getting responses is not yet supported!\n')
+        llm_logger.warning('This method of getting responses is not yet supported!\n')
         return []
 
+@cassette('value', empty=[])
 def get_value(
     prompt: str, 
     reward_model: str, 
@@ -144,50 +167,148 @@ def get_value(
     do_sample: bool = True, 
     max_new_tokens: int = 4096
     ):
-    response = []
-    cnt = 2
-    
     if reward_model == 'deepseek-chat':
-        while not response and cnt:
-            response = deepseek(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = deepseek(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens, until=REWARD_CLOSURE)
         if not response:
-            print(f'obtain<{reward_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', reward_model)
             return []
         else:
             return response
     elif 'qwen' in reward_model:
-        while not response and cnt:
-            response = qwen(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = qwen(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens, until=REWARD_CLOSURE)
         if not response:
-            print(f'obtain<{reward_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', reward_model)
             return []
         else:
             return response
     
     elif 'gpt' in reward_model:
-        while not response and cnt:
-            response = gpt(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = gpt(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens, until=REWARD_CLOSURE)
         if not response:
-            print(f'obtain<{reward_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', reward_model)
             return []
         else:
             return response
     
     elif reward_model == 'Qwen/Qwen2.5-72B-Instruct':
-        while not response and cnt:
-            response = siliconflow(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens)
-            cnt -= 1
+        response = siliconflow(prompt, model=reward_model, temperature=temperature, max_tokens=max_tokens)
         if not response:
-            print(f'obtain<{reward_model}>response fail!\n')
+            llm_logger.warning('obtain<%s>response fail!\n', reward_model)
             return []
         else:
             return response
     else:
-        print('This method of getting responses is not yet supported!\n')
+        llm_logger.warning('This method of getting responses is not yet supported!\n')
+        return []
+
+# --------------------------- asyncio 版本的响应获取 ---------------------------
+
+def _async_backend(method: str, allow_claude: bool = False):
+    """按与同步版本一致的规则选择异步调用函数，不支持的后端返回None"""
+    if method == 'deepseek-chat':
+        return deepseek_async
+    elif 'qwen' in method:
+        return qwen_async
+    elif 'gpt' in method or (allow_claude and 'claude' in method):
+        return gpt_async
+    return None
+
+async def _request_async(backend, prompt, method, temperature, max_tokens, until=None):
+    response = await backend(prompt, model=method, temperature=temperature, max_tokens=max_tokens, until=until)
+    if not response:
+        llm_logger.warning('obtain<%s>response fail!\n', method)
         return []
+    return response
+
+@cassette('proposal', empty=[])
+async def get_proposal_async(
+    prompt: str, 
+    policy_model: str, 
+    temperature: float = 0.7, 
+    max_tokens: int = 4096, 
+    seed: int = 170, 
+    max_length: int = 8192, 
+    truncation: bool = True,
+    do_sample: bool = True, 
+    max_new_tokens: int = 4096
+    ):
+    backend = _async_backend(policy_model, allow_claude=True)
+    if backend is None:
+        # 没有异步客户端的后端（siliconflow等）退化为在线程中执行同步调用
+        return await asyncio.to_thread(
+            get_proposal, prompt, policy_model, temperature, max_tokens, 
+            seed, max_length, truncation, do_sample, max_new_tokens
+        )
+    return await _request_async(backend, prompt, policy_model, temperature, max_tokens, until=POLICY_CLOSURE)
+
+@cassette('proposals', empty=[])
+async def get_proposals_async(
+    prompt: str, 
+    policy_model: str, 
+    n: int = 1, 
+    temperature: float = 0.7, 
+    max_tokens: int = 4096, 
+    seed: int = 170, 
+    max_length: int = 8192, 
+    truncation: bool = True,
+    do_sample: bool = True, 
+    max_new_tokens: int = 4096
+    ):
+    if policy_model == 'deepseek-chat':
+        response = await deepseek_n_async(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, n=n)
+    elif 'qwen' in policy_model:
+        response = await qwen_n_async(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, n=n)
+    elif 'gpt' in policy_model or 'claude' in policy_model:
+        response = await gpt_n_async(prompt, model=policy_model, temperature=temperature, max_tokens=max_tokens, n=n)
+    else:
+        return await asyncio.to_thread(
+            get_proposals, prompt, policy_model, n, temperature, max_tokens, 
+            seed, max_length, truncation, do_sample, max_new_tokens
+        )
+    if not response:
+        llm_logger.warning('obtain<%s>response fail!\n', policy_model)
+    return response
+
+@cassette('state', empty=[])
+async def get_state_async(
+    prompt: str, 
+    world_method: str, 
+    temperature: float = 0.7, 
+    max_tokens: int = 4096, 
+    seed: int = 170, 
+    max_length: int = 8192, 
+    truncation: bool = True,
+    do_sample: bool = True, 
+    max_new_tokens: int = 4096
+    ):
+    backend = _async_backend(world_method)
+    if backend is None:
+        # siliconflow / local 推理等后端退化为在线程中执行同步调用
+        return await asyncio.to_thread(
+            get_state, prompt, world_method, temperature, max_tokens, 
+            seed, max_length, truncation, do_sample, max_new_tokens
+        )
+    return await _request_async(backend, prompt, world_method, temperature, max_tokens, until=WORLD_CLOSURE)
+
+@cassette('value', empty=[])
+async def get_value_async(
+    prompt: str, 
+    reward_model: str, 
+    temperature: float = 0.7, 
+    max_tokens: int = 4096, 
+    seed: int = 170, 
+    max_length: int = 8192, 
+    truncation: bool = True,
+    do_sample: bool = True, 
+    max_new_tokens: int = 4096
+    ):
+    backend = _async_backend(reward_model)
+    if backend is None:
+        return await asyncio.to_thread(
+            get_value, prompt, reward_model, temperature, max_tokens, 
+            seed, max_length, truncation, do_sample, max_new_tokens
+        )
+    return await _request_async(backend, prompt, reward_model, temperature, max_tokens, until=REWARD_CLOSURE)
 
 def extract_a11y_prediction(text: str) -> str:
     """
@@ -208,17 +329,15 @@ def washing_response_4_world_model(response: str) -> str:
     
     # 如果模型调用没有返回结果，直接返回空字符串
     if not response:
-        print("[ERROR] 模型调用没有返回结果!")
+        parse_logger.warning("[ERROR] 模型调用没有返回结果!")
         return ''
     
     # 将```<content>```中的content提取出来
     state = extract_a11y_prediction(response)
     
     if not state:
-        print("[ERROR] 世界模型指令跟随能力失败")
-        print("="*100)
-        print(response)
-        print("="*100)
+        parse_logger.warning("[ERROR] 世界模型指令跟随能力失败")
+        parse_logger.debug("%s\n%s\n%s", "="*100, response, "="*100)
         return ''    
     
     return state
@@ -227,15 +346,13 @@ def washing_action_4_policy_model(response: str, state: str) -> str:
     
     # 如果模型调用没有返回结果，直接返回空字符串
     if not response:
-        print("[ERROR] 模型调用没有返回结果!")
+        parse_logger.warning("[ERROR] 模型调用没有返回结果!")
         return '', ''
     
     thinking, exec_action = parse_action_thinking(raw_action=response)
     if thinking == '' or exec_action == '':
-        print("[ERROR] 策略模型指令跟随能力失败")
-        print("="*100)
-        print(response)
-        print("="*100)
+        parse_logger.warning("[ERROR] 策略模型指令跟随能力失败")
+        parse_logger.debug("%s\n%s\n%s", "="*100, response, "="*100)
         return '', ''
     
     try:
@@ -244,25 +361,25 @@ def washing_action_4_policy_model(response: str, state: str) -> str:
         # 从根节点开始将树上的所有节点设置为不可见
         parse_node_descendants(node=browser_node, action=action_set_invisible)
     except:
-        print("[ERROR] 页面结构解析失败")
+        parse_logger.warning("[ERROR] 页面结构解析失败")
         return '', ''
     
     try:
         # 提取action_str中确定的节点信息
         target_node_id, action_str = parse_action(exec_action, browser_node)    
     except:
-        print(f"[Error] 不合法操作导致无法解析 {exec_action}")
+        parse_logger.warning("[Error] 不合法操作导致无法解析 %s", exec_action)
         return '', ''
     
     # 处理scroll, goto, go_back, stop等情况
     if target_node_id is None:
-        print(f"None Id-type action {action_str}")
+        parse_logger.debug("None Id-type action %s", action_str)
         return response, exec_action
     else:
         # 由行动确定目标节点, target_node_id非空
         node = browser_node.search_node_by_id(target_node_id)
         if node is None:
-            print(f"[Error] ID不在当前页面 {action_str}")
+            parse_logger.warning("[Error] ID不在当前页面 %s", action_str)
             return '', ''
     
     return response, exec_action
@@ -270,12 +387,12 @@ def washing_action_4_policy_model(response: str, state: str) -> str:
 def washing_value_4_reward_model(response: str, low=0.0, high=5.0) -> str:
     # 如果模型调用没有返回结果，直接返回空字符串
     if not response:
-        print("模型调用没有返回结果!")
+        parse_logger.warning("模型调用没有返回结果!")
         return '', low
     
     # 如果前缀不在response中，说明没有遵循指令，直接返回空字符串
     if "Reason" not in response or "Score" not in response:
-        print("前缀不在回复中!")
+        parse_logger.warning("前缀不在回复中!")
         return '', low
     else:
         pattern = r"Reason:\s*(.*?)\s*Score:\s*(\d+)"
@@ -284,7 +401,7 @@ def washing_value_4_reward_model(response: str, low=0.0, high=5.0) -> str:
         if match:
             reason_content = match.group(1).strip()
         else:
-            print("无理由返回!")
+            parse_logger.warning("无理由返回!")
             reason_content = ""
         
         if match:
@@ -293,10 +410,10 @@ def washing_value_4_reward_model(response: str, low=0.0, high=5.0) -> str:
                 score = float(score_content)
                 score = min(max(low, score), high)
             except Exception as e:
-                print(f'分数输出有误！错误类型:{e}\n')
+                parse_logger.warning('分数输出有误！错误类型:%s\n', e)
                 return reason_content, low
         else:
-            print("无分数输出!")
+            parse_logger.warning("无分数输出!")
             return reason_content, low
     
     return reason_content, score
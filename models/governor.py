@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import openai
+
+from models.waiting import HybridCondition
+from utils.logger import get_logger
+
+"""
+    按服务商(deepseek/qwen/gpt/webSimulator)的自适应并发与token速率控制(AIMD)：
+    :: 并发上限：请求成功时加性增长(每完成约limit个请求 +increase)，遇到限流(429)/超时时乘性下降(x decrease)
+    ::     在上一次下降之前发出的请求再失败不重复下降，避免同一波限流把上限一路降到底
+    :: token速率：tokens_per_minute 的令牌桶，请求前按 prompt字符数/4 + max_tokens 预留，返回后按实际用量多退少补
+    :: 全局的 `inflight_limiter` 仍是所有服务商合计的上限；每个 `*_call` 先取得服务商名额，再占用全局名额
+    环境变量 WEBMCTS_PROVIDER_LIMITS="gpt=64/90000,qwen=32" (最大并发/每分钟token数，token数可省略)
+"""
+
+logger = get_logger('llm.client')
+
+OVERLOAD_STATUS = (429, 503, 529)
+
+
+def is_overload_error(error) -> bool:
+    """限流或超时：说明服务商已接近上限，应降低并发"""
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, 'status_code', None) in OVERLOAD_STATUS
+
+
+def estimate_tokens(messages, max_tokens, n=1) -> int:
+    chars = sum(len(message.get('content') or '') for message in messages) if isinstance(messages, list) else len(messages)
+    return chars // 4 + max_tokens * n
+
+
+class _Slot(object):
+    def __init__(self, governor, tokens) -> None:
+        self.governor = governor
+        self.tokens = tokens
+        self.used_tokens = None
+        self.started = None
+
+    def used(self, usage):
+        """记录回复中的实际token用量(usage为None时按预留量计)"""
+        if usage is not None:
+            self.used_tokens = usage.prompt_tokens + usage.completion_tokens
+
+    def __enter__(self):
+        self.governor.acquire(self.tokens)
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.governor.release(self, exc)
+
+    async def __aenter__(self):
+        await self.governor.acquire_async(self.tokens)
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.governor.release(self, exc)
+
+
+class ProviderGovernor(object):
+    def __init__(self, name, initial=8, min_limit=1, max_limit=64, increase=1.0, decrease=0.5, tokens_per_minute=None) -> None:
+        """
+            :: initial / min_limit / max_limit: 并发上限的初始值与范围
+            :: increase: float, 每完成约limit个成功请求，上限增加的量
+            :: decrease: float, 限流/超时时上限乘以的系数
+            :: tokens_per_minute: int | None, token速率上限，None不限制
+        """
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = float(tokens_per_minute or 0)
+        self.refilled = time.monotonic()
+        self.inflight = 0
+        self.last_cut = 0.0
+        self.successes = 0
+        self.throttles = 0
+        self.condition = HybridCondition()
+
+    def configure(self, max_limit=None, tokens_per_minute=None):
+        with self.condition:
+            if max_limit is not None:
+                self.max_limit = max_limit
+                self.limit = min(self.limit, max_limit)
+            if tokens_per_minute is not None:
+                self.tokens_per_minute = tokens_per_minute or None
+                self.tokens = float(tokens_per_minute or 0)
+            self.condition.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute, self.tokens + (now - self.refilled) * self.tokens_per_minute / 60)
+        self.refilled = now
+
+    def _admit(self, tokens):
+        if self.inflight >= int(self.limit):
+            return False
+        if self.tokens_per_minute:
+            self._refill()
+            # 超过桶容量的请求在桶满时放行
+            if self.tokens < min(tokens, self.tokens_per_minute):
+                return False
+            self.tokens -= tokens
+        self.inflight += 1
+        return True
+
+    def acquire(self, tokens):
+        with self.condition:
+            # 等待令牌时定期醒来重新计算桶内令牌
+            while not self._admit(tokens):
+                self.condition.wait(timeout=0.05 if self.tokens_per_minute else None)
+
+    async def acquire_async(self, tokens):
+        """与 `InflightLimiter` 共用 `HybridCondition`：名额释放时被唤醒，不轮询事件循环"""
+        await self.condition.wait_async(lambda: self._admit(tokens), timeout=0.05 if self.tokens_per_minute else None)
+
+    def release(self, slot, error=None):
+        with self.condition:
+            self.inflight -= 1
+            if self.tokens_per_minute and slot.used_tokens is not None:
+                self.tokens = min(self.tokens_per_minute, self.tokens + slot.tokens - slot.used_tokens)
+            if error is None:
+                self.successes += 1
+                self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1.0))
+            elif is_overload_error(error):
+                self.throttles += 1
+                if slot.started >= self.last_cut:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self.last_cut = time.monotonic()
+                    logger.info("[governor] %s 限流/超时(%s)，并发上限降为%d", self.name, type(error).__name__, int(self.limit))
+            self.condition.notify_all()
+
+    def request(self, tokens=0):
+        """
+            >>> with governor.request(estimate_tokens(messages, max_tokens)) as slot:
+            ...     res = client.chat.completions.create(...)
+            ...     slot.used(res.usage)
+        """
+        return _Slot(self, tokens)
+
+    def stats(self):
+        with self.condition:
+            self._refill()
+            return {
+                'limit': int(self.limit),
+                'inflight': self.inflight,
+                'max_limit': self.max_limit,
+                'tokens_per_minute': self.tokens_per_minute,
+                'available_tokens': int(self.tokens) if self.tokens_per_minute else None,
+                'successes': self.successes,
+                'throttles': self.throttles,
+            }
+
+
+GOVERNORS = {name: ProviderGovernor(name) for name in ('deepseek', 'qwen', 'gpt', 'webSimulator')}
+
+
+def parse_provider_limits(spec):
+    """ "gpt=64/90000,qwen=32" -> {'gpt': (64, 90000), 'qwen': (32, None)} """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, value = item.split('=', 1)
+        max_limit, _, tokens_per_minute = value.partition('/')
+        limits[name.strip()] = (int(max_limit), int(tokens_per_minute) if tokens_per_minute else None)
+    return limits
+
+
+def set_provider_limits(spec):
+    for name, (max_limit, tokens_per_minute) in parse_provider_limits(spec).items():
+        GOVERNORS[name].configure(max_limit=max_limit, tokens_per_minute=tokens_per_minute)
+
+
+def governor_limits():
+    """各服务商当前的并发上限、在途请求数与token余量"""
+    return {name: governor.stats() for name, governor in GOVERNORS.items()}
+
+
+set_provider_limits(os.environ.get("WEBMCTS_PROVIDER_LIMITS", ""))
@@ -8,143 +8,251 @@ qwen_base_url = os.environ.get("qwen_base_url")
 openai_base_url = os.environ.get("openai_base_url")
 webSimulator_port = os.environ.get("webSimulator_port", 8000)
 
-from openai import OpenAI
+import re
+import asyncio
+from types import SimpleNamespace
 from threading import Lock  # 新增：导入线程锁
+from utils.logger import get_logger
+from models.governor import GOVERNORS, estimate_tokens
+from models.retry import RETRY, BadReplyError
+from models.clients import CLIENTS
+from models.waiting import HybridCondition
+
+client_logger = get_logger('llm.client')
+usage_logger = get_logger('llm.usage')
 
 completion_tokens = prompt_tokens = 0
 tokens_lock = Lock()  # 新增：创建令牌计数器锁
 
-deepseek_client = OpenAI(api_key=API_KEY_DEEPSEEK, base_url=deepseek_base_url)
-qwen_client = OpenAI(api_key=API_KEY_QWEN, base_url=qwen_base_url)
-gpt_client = OpenAI(api_key=API_KEY_OPENAI, base_url=openai_base_url)
-webSimulator_client = OpenAI(api_key="", base_url=f"http://localhost:{webSimulator_port}/v1")
+
+class InflightLimiter(object):
+    """
+        进程内全局的在途LLM请求上限，线程(with)与协程(async with)共享同一个计数
+        :: limit: int | None, None表示不限制；运行中修改立即生效
+        协程等待时不阻塞事件循环(见 `models/waiting.py`)；各服务商自适应的并发与token速率上限见 `models/governor.py`
+    """
+    def __init__(self, limit=None) -> None:
+        self.condition = HybridCondition()
+        self.inflight = 0
+        self.set_limit(limit)
+    
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = limit
+            self.condition.notify_all()
+    
+    def _admit(self):
+        if self.limit and self.inflight >= self.limit:
+            return False
+        self.inflight += 1
+        return True
+    
+    def __enter__(self):
+        with self.condition:
+            self.condition.wait_for(self._admit)
+        return self
+    
+    def __exit__(self, *exc):
+        with self.condition:
+            self.inflight -= 1
+            self.condition.notify_all()
+    
+    async def __aenter__(self):
+        await self.condition.wait_async(self._admit)
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.__exit__(*exc)
+
+
+inflight_limiter = InflightLimiter()
+
+def set_max_inflight(limit):
+    inflight_limiter.set_limit(limit)
+
+# 客户端与连接池由 `models/clients.py` 按服务地址共享，首次请求时创建
+ENDPOINTS = {
+    'deepseek': (API_KEY_DEEPSEEK, deepseek_base_url),
+    'qwen': (API_KEY_QWEN, qwen_base_url),
+    'gpt': (API_KEY_OPENAI, openai_base_url),
+    'webSimulator': ("", f"http://localhost:{webSimulator_port}/v1"),
+}
+
+
+def get_client(name):
+    api_key, base_url = ENDPOINTS[name]
+    return CLIENTS.get(base_url, api_key)
+
+
+# --------------------------- 流式请求与提前结束 ---------------------------
+# 只需要回复开头一段的请求(策略的行动、世界模型的<a11y>、奖励的Score)以流式接收，所需内容完整后立即关闭连接，
+# 不再等待模型生成到 max_tokens；WEBMCTS_STREAM=0 时退回普通请求
+stream_responses = os.environ.get("WEBMCTS_STREAM", "1") != "0"
+
+def set_streaming(enabled):
+    global stream_responses
+    stream_responses = enabled
 
 
-def deepseek(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1, stop=None) -> list:
-    out = []
-    cnt = 5
-    while cnt:
+class StreamClosure(object):
+    """
+        流式回复的结束条件：已接收的文本能匹配 pattern 时结束
+        :: triggers: str | None, 只有新收到的片段包含其中的字符时才重新匹配(如 '`'、'>')，None 表示每个片段都匹配
+        截断后的回复与完整回复的解析结果相同，pattern 需与对应的解析正则匹配到同一段内容
+    """
+    def __init__(self, pattern, triggers=None, flags=re.DOTALL) -> None:
+        self.pattern = re.compile(pattern, flags)
+        self.triggers = triggers
+
+    def closed(self, text, delta) -> bool:
+        if self.triggers is not None and not any(c in delta for c in self.triggers):
+            return False
+        return self.pattern.search(text) is not None
+
+
+def _stream_request(messages, model, temperature, max_tokens):
+    return dict(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={'include_usage': True},
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+
+def _stream_chunk(chunk):
+    """return: (文本片段, usage | None)"""
+    delta = chunk.choices[0].delta.content if chunk.choices else None
+    return delta or '', chunk.usage
+
+def _stream_done(name, messages, text, usage, slot, early):
+    global completion_tokens, prompt_tokens
+    if usage is None:
+        # 提前关闭的流收不到用量，按字符数估计
+        usage = SimpleNamespace(prompt_tokens=estimate_tokens(messages, 0), completion_tokens=len(text) // 4)
+    slot.used(usage)
+    if name != 'webSimulator':
+        with tokens_lock:
+            completion_tokens += usage.completion_tokens
+            prompt_tokens += usage.prompt_tokens
+    if early:
+        client_logger.debug("[stream] %s 回复在%d个字符处已完整，提前关闭", name, len(text))
+
+def _stream_call(name, messages, model, temperature, max_tokens, until) -> str:
+    text, usage, early = '', None, False
+    with GOVERNORS[name].request(estimate_tokens(messages, max_tokens)) as slot, inflight_limiter:
+        stream = get_client(name).chat.completions.create(**_stream_request(messages, model, temperature, max_tokens))
         try:
-            out = deepseek_call(messages, model=model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)[0]
-            break
-        except Exception as e:
-            print(f"Error occurred when getting deepseek reply!\nError type:{e}\n")
-            cnt -= 1
+            for chunk in stream:
+                delta, chunk_usage = _stream_chunk(chunk)
+                usage = chunk_usage or usage
+                text += delta
+                if delta and until.closed(text, delta):
+                    early = True
+                    break
+        finally:
+            stream.close()
+        _stream_done(name, messages, text, usage, slot, early)
+    return text
+
+
+def deepseek(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1, stop=None, until=None) -> list:
+    out = _chat('deepseek', deepseek_call, messages, model, temperature, max_tokens, n, stop, until)
     deepseek_usage(backend=model)
     return out
 
-def qwen(messages, model='qwen-plus', temperature=0.7, max_tokens=1000, n=1, stop=None) -> list:
-    out = []
-    cnt = 5
-    while cnt:
-        try:
-            out = qwen_call(messages, model=model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)[0]
-            break
-        except Exception as e:
-            print(f"Error occurred when getting qwen reply!\nError type:{e}\n")
-            cnt -= 1
+def qwen(messages, model='qwen-plus', temperature=0.7, max_tokens=1000, n=1, stop=None, until=None) -> list:
+    out = _chat('qwen', qwen_call, messages, model, temperature, max_tokens, n, stop, until)
     qwen_usage(backend=model)
     return out
 
-def gpt(messages, model='gpt-4o', temperature=0.7, max_tokens=2048, n=1, stop=None) -> list:
-    out = []
-    cnt = 5
-    while cnt:
-        try:
-            out = gpt_call(messages, model=model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)[0]
-            break
-        except Exception as e:
-            print(f"Error occurred when getting openai reply!\nError type:{e}\n")
-            cnt -= 1
+def gpt(messages, model='gpt-4o', temperature=0.7, max_tokens=2048, n=1, stop=None, until=None) -> list:
+    out = _chat('gpt', gpt_call, messages, model, temperature, max_tokens, n, stop, until)
     gpt_usage(backend=model)
     return out
 
-def deepseek_call(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1, stop=None) -> list:
+def _chat_call(client_name, messages, model, temperature=0.7, max_tokens=1000, n=1, stop=None, count_usage=True) -> list:
     global completion_tokens, prompt_tokens
+    client = get_client(client_name)
     outputs = []
     while n > 0:
         cnt = min(n, 20)
         n -= cnt
-        res = deepseek_client.chat.completions.create(
-            model=model,
-            messages=messages, 
-            stream=False, 
-            temperature=temperature, 
-            max_tokens=max_tokens
-        )
+        with GOVERNORS[client_name].request(estimate_tokens(messages, max_tokens, cnt)) as slot, inflight_limiter:
+            res = client.chat.completions.create(
+                model=model,
+                messages=messages, 
+                stream=False, 
+                temperature=temperature, 
+                max_tokens=max_tokens, 
+                **({'n': cnt} if cnt > 1 else {})
+            )
+            slot.used(res.usage)
         outputs.extend([choice.message.content for choice in res.choices])
-        # 修改：使用锁保护全局变量更新
-        with tokens_lock:
-            completion_tokens += res.usage.completion_tokens
-            prompt_tokens += res.usage.prompt_tokens
+        # 部分后端会忽略n参数，只返回一个choice，此时补足剩余的采样数
+        if res.choices:
+            n += max(cnt - len(res.choices), 0)
+        if count_usage:
+            with tokens_lock:
+                completion_tokens += res.usage.completion_tokens
+                prompt_tokens += res.usage.prompt_tokens
     return outputs
 
+def deepseek_call(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1, stop=None) -> list:
+    return _chat_call('deepseek', messages, model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)
+
 def qwen_call(messages, model='qwen-plus', temperature=0.7, max_tokens=1000, n=1, stop=None) -> list:
-    global completion_tokens, prompt_tokens
-    outputs = []
-    while n > 0:
-        cnt = min(n, 20)
-        n -= cnt
-        res = qwen_client.chat.completions.create(
-            model=model,
-            messages=messages, 
-            stream=False, 
-            temperature=temperature, 
-            max_tokens=max_tokens
-        )
-        outputs.extend([choice.message.content for choice in res.choices])
-        # 修改：使用锁保护全局变量更新
-        with tokens_lock:
-            completion_tokens += res.usage.completion_tokens
-            prompt_tokens += res.usage.prompt_tokens
-    return outputs
+    return _chat_call('qwen', messages, model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)
 
 def gpt_call(messages, model='gpt-4o', temperature=0.7, max_tokens=1000, n=1, stop=None) -> list:
-    global completion_tokens, prompt_tokens
-    outputs = []
-    while n > 0:
-        cnt = min(n, 20)
-        n -= cnt
-        res = gpt_client.chat.completions.create(
-            model=model,
-            messages=messages, 
-            stream=False, 
-            temperature=temperature, 
-            max_tokens=max_tokens
-        )
-        outputs.extend([choice.message.content for choice in res.choices])
-        # 修改：使用锁保护全局变量更新
-        with tokens_lock:
-            completion_tokens += res.usage.completion_tokens
-            prompt_tokens += res.usage.prompt_tokens
-    return outputs
+    return _chat_call('gpt', messages, model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)
 
-def webSimulator(messages, model='qwen2_5_world-model', temperature=0.7, max_tokens=2048, n=1, stop=None) -> list:
-    out = []
-    cnt = 5
-    while cnt:
-        try:
-            out = webSimulator_call(messages, model=model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)[0]
-            break
-        except Exception as e:
-            print(f"Error occurred when getting webSimulator reply!\nError type:{e}\n")
-            cnt -= 1
+def webSimulator(messages, model='qwen2_5_world-model', temperature=0.7, max_tokens=2048, n=1, stop=None, until=None) -> list:
+    return _chat('webSimulator', webSimulator_call, messages, model, temperature, max_tokens, n, stop, until)
+
+def _chat(name, call, messages, model, temperature, max_tokens, n, stop, until=None) -> list:
+    """返回第一个回复（失败返回空列表），重试、退避与熔断见 `models/retry.py`"""
+    def first():
+        if until is not None and n == 1 and stream_responses:
+            out = _stream_call(name, messages, model, temperature, max_tokens, until)
+        else:
+            outs = call(messages, model=model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop)
+            out = outs[0] if outs else None
+        if not out:
+            raise BadReplyError(f"empty {name} reply")  # 空回复同样按暂时性错误退避重试
+        return out
+    try:
+        return RETRY.call(name, first)
+    except Exception as e:
+        client_logger.warning("Error occurred when getting %s reply!\nError type:%s\n", name, e)
+        return []
+
+def _sample(name, call, messages, model, temperature, max_tokens, n) -> list:
+    """单次请求中采样 n 个回复，返回全部回复（失败返回空列表）"""
+    try:
+        out = RETRY.call(name, lambda: call(messages, model=model, temperature=temperature, max_tokens=max_tokens, n=n))
+    except Exception as e:
+        client_logger.warning("Error occurred when getting %s reply!\nError type:%s\n", name, e)
+        out = []
+    return [o for o in out if o]
+
+def deepseek_n(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1) -> list:
+    out = _sample('deepseek', deepseek_call, messages, model, temperature, max_tokens, n)
+    deepseek_usage(backend=model)
+    return out
+
+def qwen_n(messages, model='qwen-plus', temperature=0.7, max_tokens=1000, n=1) -> list:
+    out = _sample('qwen', qwen_call, messages, model, temperature, max_tokens, n)
+    qwen_usage(backend=model)
+    return out
+
+def gpt_n(messages, model='gpt-4o', temperature=0.7, max_tokens=2048, n=1) -> list:
+    out = _sample('gpt', gpt_call, messages, model, temperature, max_tokens, n)
+    gpt_usage(backend=model)
     return out
 
 def webSimulator_call(messages, model='qwen2_5_world-model', temperature=0.7, max_tokens=2048, n=1, stop=None) -> list:
-    outputs = []
-    while n > 0:
-        cnt = min(n, 20)
-        n -= cnt
-        res = webSimulator_client.chat.completions.create(
-            model=model,
-            messages=messages, 
-            stream=False, 
-            temperature=temperature, 
-            max_tokens=max_tokens
-        )
-        outputs.extend([choice.message.content for choice in res.choices])
-    return outputs
+    return _chat_call('webSimulator', messages, model, temperature=temperature, max_tokens=max_tokens, n=n, stop=stop, count_usage=False)
 
 def deepseek_usage(backend='deepseek-chat'):
     global completion_tokens, prompt_tokens
@@ -152,8 +260,9 @@ def deepseek_usage(backend='deepseek-chat'):
         cost = completion_tokens / 1000000 * 0.1 + prompt_tokens / 1000000 * 2
     else:
         cost = -1
-    print({"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost})
-    return {"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost}
+    usage = {"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost}
+    usage_logger.debug("%s", usage)
+    return usage
 
 def qwen_usage(backend='qwen-plus'):
     global completion_tokens, prompt_tokens
@@ -161,8 +270,9 @@ def qwen_usage(backend='qwen-plus'):
         cost = completion_tokens / 1000000 * 0.8 + prompt_tokens / 1000000 * 2
     else:
         cost = -1
-    print({"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost})
-    return {"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost}
+    usage = {"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost}
+    usage_logger.debug("%s", usage)
+    return usage
 
 def gpt_usage(backend='gpt-4o'):
     global completion_tokens, prompt_tokens
@@ -182,5 +292,111 @@ def gpt_usage(backend='gpt-4o'):
         cost = 1 * 7.5 * (prompt_tokens + completion_tokens * 5) / 500000
     else:
         cost = -1
-    print({"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost})
-    return {"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost}
+    usage = {"completion_tokens": completion_tokens, "prompt_tokens": prompt_tokens, "cost": cost}
+    usage_logger.debug("%s", usage)
+    return usage
+
+
+# --------------------------- asyncio 版本的模型调用 ---------------------------
+
+def get_async_client(name):
+    """返回当前事件循环下 `name` 对应的 AsyncOpenAI 客户端"""
+    api_key, base_url = ENDPOINTS[name]
+    return CLIENTS.get_async(base_url, api_key)
+
+async def _chat_call_async(client_name, messages, model, temperature=0.7, max_tokens=1000, n=1, stop=None, count_usage=True) -> list:
+    global completion_tokens, prompt_tokens
+    client = get_async_client(client_name)
+    outputs = []
+    while n > 0:
+        cnt = min(n, 20)
+        n -= cnt
+        async with GOVERNORS[client_name].request(estimate_tokens(messages, max_tokens, cnt)) as slot, inflight_limiter:
+            res = await client.chat.completions.create(
+                model=model,
+                messages=messages, 
+                stream=False, 
+                temperature=temperature, 
+                max_tokens=max_tokens, 
+                **({'n': cnt} if cnt > 1 else {})
+            )
+            slot.used(res.usage)
+        outputs.extend([choice.message.content for choice in res.choices])
+        # 与 `_chat_call` 相同，补足后端忽略n参数时缺少的采样数
+        if res.choices:
+            n += max(cnt - len(res.choices), 0)
+        if count_usage:
+            with tokens_lock:
+                completion_tokens += res.usage.completion_tokens
+                prompt_tokens += res.usage.prompt_tokens
+    return outputs
+
+async def _stream_call_async(name, messages, model, temperature, max_tokens, until) -> str:
+    text, usage, early = '', None, False
+    async with GOVERNORS[name].request(estimate_tokens(messages, max_tokens)) as slot, inflight_limiter:
+        stream = await get_async_client(name).chat.completions.create(**_stream_request(messages, model, temperature, max_tokens))
+        try:
+            async for chunk in stream:
+                delta, chunk_usage = _stream_chunk(chunk)
+                usage = chunk_usage or usage
+                text += delta
+                if delta and until.closed(text, delta):
+                    early = True
+                    break
+        finally:
+            await stream.close()
+        _stream_done(name, messages, text, usage, slot, early)
+    return text
+
+ASYNC_USAGE = {'deepseek': deepseek_usage, 'qwen': qwen_usage, 'gpt': gpt_usage}  # webSimulator 不计入用量
+
+async def _chat_async(name, messages, model, temperature, max_tokens, n=1, stop=None, until=None) -> list:
+    """`_chat` 的异步版本：各服务商共用，按 name 取客户端、调速器与用量统计"""
+    async def first():
+        if until is not None and n == 1 and stream_responses:
+            out = await _stream_call_async(name, messages, model, temperature, max_tokens, until)
+        else:
+            outs = await _chat_call_async(name, messages, model, temperature, max_tokens, n, stop, count_usage=name in ASYNC_USAGE)
+            out = outs[0] if outs else None
+        if not out:
+            raise BadReplyError(f"empty {name} reply")
+        return out
+    try:
+        out = await RETRY.call_async(name, first)
+    except Exception as e:
+        client_logger.warning("Error occurred when getting %s reply!\nError type:%s\n", name, e)
+        out = []
+    if name in ASYNC_USAGE:
+        ASYNC_USAGE[name](backend=model)
+    return out
+
+async def _sample_async(name, messages, model, temperature, max_tokens, n) -> list:
+    """单次请求中采样 n 个回复，返回全部回复（失败返回空列表）"""
+    try:
+        out = await RETRY.call_async(name, lambda: _chat_call_async(name, messages, model, temperature, max_tokens, n))
+    except Exception as e:
+        client_logger.warning("Error occurred when getting %s reply!\nError type:%s\n", name, e)
+        out = []
+    ASYNC_USAGE[name](backend=model)
+    return [o for o in out if o]
+
+async def deepseek_n_async(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1) -> list:
+    return await _sample_async('deepseek', messages, model, temperature, max_tokens, n)
+
+async def qwen_n_async(messages, model='qwen-plus', temperature=0.7, max_tokens=1000, n=1) -> list:
+    return await _sample_async('qwen', messages, model, temperature, max_tokens, n)
+
+async def gpt_n_async(messages, model='gpt-4o', temperature=0.7, max_tokens=2048, n=1) -> list:
+    return await _sample_async('gpt', messages, model, temperature, max_tokens, n)
+
+async def deepseek_async(messages, model='deepseek-chat', temperature=0.7, max_tokens=1000, n=1, stop=None, until=None) -> list:
+    return await _chat_async('deepseek', messages, model, temperature, max_tokens, n, stop, until)
+
+async def qwen_async(messages, model='qwen-plus', temperature=0.7, max_tokens=1000, n=1, stop=None, until=None) -> list:
+    return await _chat_async('qwen', messages, model, temperature, max_tokens, n, stop, until)
+
+async def gpt_async(messages, model='gpt-4o', temperature=0.7, max_tokens=2048, n=1, stop=None, until=None) -> list:
+    return await _chat_async('gpt', messages, model, temperature, max_tokens, n, stop, until)
+
+async def webSimulator_async(messages, model='qwen2_5_world-model', temperature=0.7, max_tokens=2048, n=1, stop=None, until=None) -> list:
+    return await _chat_async('webSimulator', messages, model, temperature, max_tokens, n, stop, until)
@@ -0,0 +1,246 @@
+import os
+import time
+import random
+import asyncio
+from threading import Lock
+
+import openai
+
+from utils.logger import get_logger
+
+"""
+    LLM请求的统一重试策略，替代各层各自的立即重试循环(原先一个失败的服务最多被连续请求30次)：
+    :: 错误分类: rate_limit(限流) | context_overflow(输入超长) | transient(超时/连接/5xx) | bad_reply(`BadReplyError`) | fatal(其余错误)
+    ::     context_overflow 与 fatal 不重试；rate_limit 优先使用服务端给出的 Retry-After；
+    ::     本地代码错误(TypeError/KeyError等)属于fatal，不重试也不计入熔断
+    ::     bad_reply(回复为空或无法解析)会重试，但服务已正常回复，不计入熔断
+    :: 退避: 指数退避 + full jitter，delay ~ U(0, min(max_delay, base_delay * 2^(attempt-1)))
+    :: 重试预算: 每个服务成功一次存入 budget_ratio 次重试额度(上限 budget_reserve)，预算耗尽后失败直接返回，
+    ::     持续故障时重试请求最多约为正常请求的 budget_ratio 倍
+    :: 熔断: 同一服务连续 failure_threshold 次限流/暂时性失败后熔断 reset_timeout 秒，期间请求不发出直接失败；
+    ::     到期后只放行一个探测请求：成功，或以 bad_reply/不可重试的错误结束(说明服务可达)则恢复，限流/暂时性失败则重新熔断；
+    ::     熔断前已发出的其他请求以不可重试的错误结束时不改变熔断状态，只有探测请求的结果决定是否恢复；
+    ::     探测请求被取消或抛出其他异常时也会结束探测，下一个请求重新探测
+    退避使用独立的随机数生成器，不影响搜索的随机种子
+"""
+
+logger = get_logger('llm.client')
+
+CONTEXT_OVERFLOW_MARKERS = (
+    'context_length_exceeded', 'maximum context length', 'context length', 'range of input length',
+    'reduce the length', 'too many tokens', 'prompt is too long',
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间不发出请求"""
+
+
+class BadReplyError(ValueError):
+    """回复为空或无法解析，重新采样可能成功"""
+
+
+RETRYABLE_KINDS = ('rate_limit', 'transient', 'bad_reply')
+BREAKER_KINDS = ('rate_limit', 'transient')            # 计入熔断的连续失败
+
+
+def classify_error(error) -> str:
+    if isinstance(error, BadReplyError):
+        return 'bad_reply'
+    if isinstance(error, CircuitOpenError):
+        return 'fatal'
+    message = str(error).lower()
+    if any(marker in message for marker in CONTEXT_OVERFLOW_MARKERS):
+        return 'context_overflow'
+    if isinstance(error, openai.RateLimitError) or getattr(error, 'status_code', None) == 429:
+        return 'rate_limit'
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError, TimeoutError, asyncio.TimeoutError)):
+        return 'transient'      # APITimeoutError 是 APIConnectionError 的子类
+    if isinstance(error, openai.APIStatusError):
+        return 'transient' if error.status_code >= 500 or error.status_code == 408 else 'fatal'
+    # 客户端配置错误(如未设置api_key)与本地代码错误，重试不会成功
+    return 'fatal'
+
+
+def retry_after(error):
+    """限流回复中的 Retry-After(秒)"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Endpoint(object):
+    """一个服务(deepseek/qwen/gpt/...)的重试预算与熔断状态"""
+    def __init__(self, name, policy) -> None:
+        self.name = name
+        self.policy = policy
+        self.lock = Lock()
+        self.budget = float(policy.budget_reserve)
+        self.failures = 0                   # int, 连续失败次数
+        self.opened_at = None               # float | None, 熔断开始时间
+        self.probing = False                # bool, 半开状态下是否已有探测请求
+        self.probes = 0                     # int, 已放行的探测请求数(当前探测请求的编号)
+        self.stats = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'budget_exhausted': 0}
+
+    def admit(self):
+        """
+            return: int, 0为熔断关闭时的普通请求，>0为半开状态下放行的探测请求编号(结束后调用 `end_probe`)
+            熔断期间抛出 CircuitOpenError
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            if time.monotonic() - self.opened_at < self.policy.reset_timeout or self.probing:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError(f"circuit for {self.name} is open")
+            self.probing = True
+            self.probes += 1
+            return self.probes
+
+    def end_probe(self, probe):
+        """探测请求以任何方式结束(含被取消)后调用；熔断状态已由 success/failure 更新"""
+        with self.lock:
+            if probe == self.probes:
+                self.probing = False
+
+    def success(self):
+        with self.lock:
+            self.stats['calls'] += 1
+            self.budget = min(self.policy.budget_reserve, self.budget + self.policy.budget_ratio)
+            self.failures = 0
+            if self.opened_at is not None:
+                logger.info("[retry] %s 探测请求成功，熔断恢复", self.name)
+            self.opened_at, self.probing = None, False
+
+    def failure(self, kind, probe=0):
+        """
+            :: probe: int, `admit` 返回的探测请求编号，0表示普通请求
+        """
+        with self.lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += 1
+            is_probe = bool(probe) and probe == self.probes and self.probing
+            if kind not in BREAKER_KINDS:
+                # 服务可达(已回复或错误与服务状态无关)：不计入连续失败，只有探测请求的结果能恢复熔断
+                if is_probe:
+                    logger.info("[retry] %s 探测请求结束(%s)，服务可达，熔断恢复", self.name, kind)
+                    self.failures, self.opened_at, self.probing = 0, None, False
+                return
+            self.failures += 1
+            if is_probe or (self.opened_at is None and self.failures >= self.policy.failure_threshold):
+                logger.warning("[retry] %s 连续失败%d次，熔断%.0f秒", self.name, self.failures, self.policy.reset_timeout)
+                self.opened_at, self.probing = time.monotonic(), False
+
+    def withdraw(self):
+        with self.lock:
+            if self.budget < 1:
+                self.stats['budget_exhausted'] += 1
+                return False
+            self.budget -= 1
+            self.stats['retries'] += 1
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            state = 'closed' if self.opened_at is None else ('half-open' if self.probing else 'open')
+            return {**self.stats, 'budget': round(self.budget, 2), 'state': state}
+
+
+class RetryPolicy(object):
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=20.0, budget_ratio=0.2, budget_reserve=10,
+                 failure_threshold=5, reset_timeout=30.0) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_reserve = budget_reserve
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.endpoints: dict = {}           # dict{str: Endpoint}
+        self.lock = Lock()
+        self.rng = random.Random()
+
+    def endpoint(self, name) -> Endpoint:
+        with self.lock:
+            if name not in self.endpoints:
+                self.endpoints[name] = Endpoint(name, self)
+            return self.endpoints[name]
+
+    def delay(self, attempt, kind, error):
+        if kind == 'rate_limit':
+            hinted = retry_after(error)
+            if hinted is not None:
+                return min(self.max_delay, hinted)
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _next(self, endpoint, attempt, attempts, error, probe):
+        """
+            记录一次失败，返回下一次重试前的等待秒数；不应重试时重新抛出异常
+        """
+        kind = classify_error(error)
+        endpoint.failure(kind, probe)
+        logger.warning("[retry] %s 第%d次请求失败(%s): %s", endpoint.name, attempt, kind, error)
+        if kind not in RETRYABLE_KINDS or attempt >= attempts:
+            raise error
+        if not endpoint.withdraw():
+            logger.warning("[retry] %s 重试预算耗尽，不再重试", endpoint.name)
+            raise error
+        return self.delay(attempt, kind, error)
+
+    def call(self, name, func, max_attempts=None):
+        """
+            :: func: 无参数的可调用对象，每次重试重新调用
+            :: max_attempts: int | None, 覆盖默认的最大尝试次数
+            :: return: func() 的结果；重试结束仍失败时抛出最后一次的异常
+        """
+        endpoint = self.endpoint(name)
+        attempts = max_attempts or self.max_attempts
+        for attempt in range(1, attempts + 1):
+            probe = endpoint.admit()
+            try:
+                result = func()
+            except Exception as e:
+                delay = self._next(endpoint, attempt, attempts, e, probe)
+            else:
+                endpoint.success()
+                return result
+            finally:
+                if probe:
+                    endpoint.end_probe(probe)
+            time.sleep(delay)
+
+    async def call_async(self, name, factory, max_attempts=None):
+        """
+            :: factory: 无参数、返回协程的可调用对象
+        """
+        endpoint = self.endpoint(name)
+        attempts = max_attempts or self.max_attempts
+        for attempt in range(1, attempts + 1):
+            probe = endpoint.admit()
+            try:
+                result = await factory()
+            except Exception as e:
+                delay = self._next(endpoint, attempt, attempts, e, probe)
+            else:
+                endpoint.success()
+                return result
+            finally:
+                # 探测请求被取消(CancelledError不是Exception)时同样结束探测，熔断不会停留在半开状态
+                if probe:
+                    endpoint.end_probe(probe)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self.lock:
+            endpoints = list(self.endpoints.values())
+        return {endpoint.name: endpoint.snapshot() for endpoint in endpoints}
+
+
+RETRY = RetryPolicy(
+    max_attempts=int(os.environ.get("WEBMCTS_RETRY_ATTEMPTS", "5")),
+    base_delay=float(os.environ.get("WEBMCTS_RETRY_BASE_DELAY", "0.5")),
+    reset_timeout=float(os.environ.get("WEBMCTS_CIRCUIT_RESET", "30")),
+)
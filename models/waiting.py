@@ -0,0 +1,50 @@
+import asyncio
+from threading import Condition
+
+"""
+    线程与协程共用的条件变量：
+    :: 线程按 `threading.Condition` 的方式 wait / wait_for
+    :: 协程通过 `await wait_async(predicate)` 等待，不阻塞事件循环，也不轮询；
+    ::     notify_all 时通过 call_soon_threadsafe 唤醒等待中的协程，协程被唤醒后重新检查 predicate
+    唤醒不转移名额(被唤醒的一方自己重新检查并占用)，等待中的协程被取消时不会泄漏名额
+"""
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class HybridCondition(Condition):
+    def __init__(self, lock=None) -> None:
+        super().__init__(lock)
+        self._async_waiters = []            # list[(event_loop, Future)]
+
+    def notify_all(self):
+        """与 `threading.Condition` 相同，需在持有锁时调用"""
+        super().notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass        # 事件循环已关闭
+
+    async def wait_async(self, predicate, timeout=None):
+        """
+            :: predicate: 在持有锁时调用，返回True表示条件满足(可在其中占用名额)
+            :: timeout: float | None, 每次等待的最长秒数；条件依赖时间(如令牌桶补充)时用于定期重新检查
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self:
+                if predicate():
+                    return
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            try:
+                await asyncio.wait([future], timeout=timeout)
+            finally:
+                with self:
+                    if (loop, future) in self._async_waiters:
+                        self._async_waiters.remove((loop, future))
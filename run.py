@@ -3,10 +3,16 @@ import sys
 sys.path.append('./')
 
 import json
+import asyncio
 import argparse
 
 from utils.search_utils import save_tree
+from utils.tree_file import write_tree
+from utils.state_store import release_tree
 from webMCTS.task import MCTS_Task
+from webMCTS.journal import discard_journal
+from utils.profiler import set_profiler
+from utils.logger import configure_logging
 
 """
 index=811
@@ -16,11 +22,10 @@ python3 run.py --policy_method=gpt-4o \
             --index=${index}
 """
 
-def main(args, data):
-
-    task = MCTS_Task(
-        data=intent, 
-        state=state, 
+def build_task(args, data):
+    return MCTS_Task(
+        data=data['intent'], 
+        state=data['state'], 
         policy_method=args.policy_method, 
         reward_method=args.reward_method, 
         world_method=args.world_method, 
@@ -33,23 +38,91 @@ def main(args, data):
         roll_forward_steps=0, 
         chat_mode='chat', 
         end_gate=4.75, 
-        use_reflection='common'
+        use_reflection='common', 
+        engine=args.engine, 
+        parallel_workers=args.parallel_workers, 
+        root_workers=args.root_workers, 
+        journal_path=None if args.no_journal else journal_path(args.index), 
+        resume=args.resume, 
+        value_cache_path=args.value_cache_path, 
+        world_cache_path=args.world_cache_path, 
+        world_cache_samples=args.world_cache_samples
     )
-    root, node, finish = task.run()
 
-    tree_dict = save_tree(root)
-    data.update({'trace': tree_dict})
+def journal_path(index):
+    return f"./data/journal/{index}.jsonl"
 
+def save_result(args, data, root):
+    if args.tree_format == 'tree':
+        # 搜索树逐个节点流式写入带索引的 .tree 文件，json中只记录文件名
+        write_tree(root, f"./data/{args.index}.tree")
+        data.update({'tree_file': f"{args.index}.tree"})
+    else:
+        # 页面在 states 中按hash只保存一次(压缩)，节点以 state_ref 引用
+        states = {}
+        tree_dict = save_tree(root, states)
+        data.update({'trace': tree_dict, 'states': states})
+
+    # json最后写出，作为任务完成的标记；之后不再需要恢复，删除搜索日志
     with open(f"./data/{args.index}.json", 'w') as f:
         json.dump(data, f, indent=2)
+    discard_journal(journal_path(args.index))
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--index', type=int, default=100)
+def main(args, data):
+
+    task = build_task(args, data)
+    root, node, finish = task.run()
+    save_result(args, data, root)
+    release_tree(root)
+
+async def main_async(args, data):
+    """
+        在调用方的事件循环中运行单个任务(`run_batch.py` 中多个任务共享同一个事件循环)
+    """
+    task = build_task(args, data)
+    root, node, finish = await task.run_async()
+    # 序列化搜索树与写出json是同步的CPU/磁盘工作，在线程中执行，不阻塞同一事件循环上其余任务的搜索
+    await asyncio.to_thread(save_result, args, data, root)
+    await asyncio.to_thread(release_tree, root)
+
+def is_finished(index):
+    return os.path.exists(f"./data/{index}.json")
+
+def add_task_args(parser):
     parser.add_argument('--policy_method', type=str, default='Qwen/Qwen2.5-72B-Instruct')
     parser.add_argument('--reward_method', type=str, default='Qwen/Qwen2.5-72B-Instruct')
     parser.add_argument('--world_method', type=str, default='Qwen/Qwen2.5-72B-Instruct')
-    args = parser.parse_args()
+    parser.add_argument('--engine', type=str, default='thread', choices=['thread', 'async'])
+    parser.add_argument('--parallel_workers', type=int, default=1)
+    parser.add_argument('--root_workers', type=int, default=1, help='independent search trees in separate processes, merged at the end')
+    parser.add_argument('--resume', action='store_true', help='continue from ./data/journal/{index}.jsonl')
+    parser.add_argument('--no_journal', action='store_true', help='do not write the crash-recovery journal ./data/journal/{index}.jsonl')
+    parser.add_argument('--value_cache_path', type=str, default=None, help='on-disk reward cache reused across runs, e.g. ./data/value_cache.sqlite (default: memory only)')
+    parser.add_argument('--world_cache_path', type=str, default=None, help='on-disk world-model transition cache shared across tasks and runs, e.g. ./data/world_cache.sqlite (default: memory only)')
+    parser.add_argument('--world_cache_samples', type=int, default=1, help='sampled predictions kept per (state, action); 1 makes transitions deterministic')
+    parser.add_argument('--tree_format', type=str, default='json', choices=['json', 'tree'], help='json: nested tree inside ./data/{index}.json (data["trace"]); tree: streamed, indexed ./data/{index}.tree')
+    parser.add_argument('--profile', type=str, default=None, help='write timing spans to a Chrome trace (.json) or JSONL (.jsonl) file')
+    parser.add_argument('--log_level', type=str, default=None, help='e.g. INFO or "INFO,llm.world=DEBUG" (default: $WEBMCTS_LOG_LEVEL or INFO)')
+    parser.add_argument('--log_sample', type=str, default=None, help='per-category sampling rates, e.g. "ucb=0.01,llm.policy=0.1"')
+    parser.add_argument('--log_jsonl', type=str, default=None, help='also write compact JSONL log records to this file')
+    return parser
+
+def apply_log_args(args):
+    if args.log_level or args.log_sample or args.log_jsonl:
+        configure_logging(
+            level=args.log_level or os.environ.get("WEBMCTS_LOG_LEVEL", "INFO"),
+            sample=args.log_sample if args.log_sample is not None else os.environ.get("WEBMCTS_LOG_SAMPLE", ""),
+            jsonl=args.log_jsonl or os.environ.get("WEBMCTS_LOG_JSONL"),
+            max_chars=int(os.environ.get("WEBMCTS_LOG_MAX_CHARS", "0")),
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--index', type=int, default=100)
+    args = add_task_args(parser).parse_args()
+    apply_log_args(args)
+    if args.profile:
+        set_profiler(args.profile)
 
     with open(f"./config_files/{args.index}.json", 'r') as file:
         data = json.load(file)
@@ -58,7 +131,7 @@ if __name__ == "__main__":
     print(state)
     
     if 'shopping' in sites or 'shopping_admin' in sites:
-        if os.path.exists(f"./data/{args.index}.json"):
+        if is_finished(args.index):
             print(f"Task{args.index} has been finished!")
         else:
             main(args, data)
@@ -0,0 +1,122 @@
+import os
+import sys
+sys.path.append('./')
+
+import glob
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from models.models import set_max_inflight, set_streaming
+from models.governor import set_provider_limits, governor_limits
+from models.retry import RETRY
+from models.clients import CLIENTS
+from utils.profiler import set_profiler
+from run import add_task_args, apply_log_args, main, main_async, is_finished
+
+"""
+在同一个进程中并发运行多个任务，替代 run.sh 逐个启动解释器的串行循环
+python3 run_batch.py --policy_method=gpt-4o \
+    --reward_method=gpt-4o \
+        --world_method=gpt-4o \
+            --max_tasks=8 --max_inflight=32
+"""
+
+def load_tasks(args):
+    """
+        读取 config_files 下的任务配置，保留与 run.py 相同的筛选与跳过规则：
+        :: 只运行 shopping / shopping_admin 站点的任务
+        :: ./data/{index}.json 已存在的任务视为已完成
+    """
+    indices = []
+    for config_file in glob.glob("./config_files/*.json"):
+        index = os.path.basename(config_file)[:-len(".json")]
+        if index.isdigit():
+            indices.append(int(index))
+    indices = sorted(indices)
+    if args.indices:
+        indices = [index for index in indices if index in set(args.indices)]
+    
+    tasks = []
+    for index in indices:
+        with open(f"./config_files/{index}.json", 'r') as file:
+            data = json.load(file)
+        if not ('shopping' in data['sites'] or 'shopping_admin' in data['sites']):
+            continue
+        if is_finished(index):
+            print(f"Task{index} has been finished!")
+            continue
+        tasks.append((index, data))
+    return tasks
+
+def task_args(args, index):
+    return argparse.Namespace(**{**vars(args), 'index': index})
+
+def run_one(args, index, data):
+    print(f"开始处理 Task{index}: {data['intent']}\n")
+    try:
+        main(task_args(args, index), data)
+        print(f"Task{index} 处理完成")
+        return True
+    except Exception as e:
+        print(f"Task{index} 处理失败\nError type:{e}\n")
+        return False
+
+async def run_one_async(args, index, data, task_semaphore):
+    async with task_semaphore:
+        print(f"开始处理 Task{index}: {data['intent']}\n")
+        try:
+            await main_async(task_args(args, index), data)
+            print(f"Task{index} 处理完成")
+            return True
+        except Exception as e:
+            print(f"Task{index} 处理失败\nError type:{e}\n")
+            return False
+
+async def run_all_async(args, tasks):
+    # 所有任务共享同一个事件循环与AsyncOpenAI连接池
+    task_semaphore = asyncio.Semaphore(args.max_tasks)
+    return await asyncio.gather(*[run_one_async(args, index, data, task_semaphore) for index, data in tasks])
+
+def run_all(args, tasks):
+    with ThreadPoolExecutor(max_workers=args.max_tasks) as executor:
+        futures = [executor.submit(run_one, args, index, data) for index, data in tasks]
+        return [future.result() for future in futures]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--indices', type=int, nargs='*', default=None, help='run only these config indices')
+    parser.add_argument('--max_tasks', type=int, default=8, help='number of searches running concurrently')
+    parser.add_argument('--max_inflight', type=int, default=32, help='global cap on in-flight LLM requests (0: unlimited)')
+    parser.add_argument('--http_pool', type=int, default=None, help='max pooled keep-alive connections per LLM endpoint (default WEBMCTS_HTTP_POOL or 64)')
+    parser.add_argument('--http_timeout', type=float, default=None, help='LLM request read timeout in seconds (default WEBMCTS_HTTP_TIMEOUT or 120)')
+    parser.add_argument('--no_stream', action='store_true', help='disable streaming LLM responses with early termination (also WEBMCTS_STREAM=0)')
+    parser.add_argument('--provider_limits', type=str, default=None, help='per-provider max concurrency[/tokens per minute], e.g. "gpt=64/90000,qwen=32"')
+    args = add_task_args(parser).parse_args()
+
+    os.makedirs("./data", exist_ok=True)
+    set_max_inflight(args.max_inflight or None)
+    CLIENTS.configure(max_connections=args.http_pool, timeout=args.http_timeout)
+    if args.no_stream:
+        set_streaming(False)
+    if args.provider_limits:
+        set_provider_limits(args.provider_limits)
+    apply_log_args(args)
+    if args.profile:
+        set_profiler(args.profile)
+    tasks = load_tasks(args)
+    print(f"共{len(tasks)}个待处理任务，同时运行{args.max_tasks}个，在途LLM请求上限{args.max_inflight or '不限'}\n")
+    
+    time_start = time.time()
+    if args.engine == 'async':
+        results = asyncio.run(run_all_async(args, tasks))
+    else:
+        results = run_all(args, tasks)
+    print(f"所有任务处理完毕: 成功{sum(results)}个，失败{len(results) - sum(results)}个，耗时{time.time() - time_start:.1f}s")
+    for name, limits in governor_limits().items():
+        if limits['successes'] or limits['throttles']:
+            print(f"[governor] {name}: {limits}")
+    for name, stats in RETRY.stats().items():
+        print(f"[retry] {name}: {stats}")
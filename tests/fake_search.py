@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import glob
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import FakeBackends, Latency
+from webMCTS.task import MCTS_Task
+
+"""
+    测试用的小规模搜索：LLM请求由 benchmark.py 的 FakeBackends 代替(不访问网络、不计费)
+    :: 页面池取自 config_files 的前几个任务，池越小置换表命中越多
+"""
+
+CONFIG = os.path.join(ROOT, 'config_files', '21.json')
+
+
+def load_pages(limit):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'config_files', '*.json')))[:limit]:
+        with open(path, 'r') as file:
+            pages.append(json.load(file)['state'])
+    return pages
+
+
+def install_backends(pages=5, seed=0):
+    """return: FakeBackends, 其 `calls` 记录各角色的请求次数"""
+    latencies = {role: Latency('const:1', 0.0001) for role in ('policy', 'world', 'reward')}
+    backends = FakeBackends(load_pages(pages), latencies, seed=seed, stop_p=0.0, solve_p=0.0)
+    backends.install()
+    return backends
+
+
+def make_task(iterations=8, seed=0, **options):
+    with open(CONFIG, 'r') as file:
+        data = json.load(file)
+    random.seed(seed)
+    settings = dict(
+        data=data['intent'], state=data['state'],
+        policy_method='gpt-4o', reward_method='gpt-4o', world_method='gpt-4o',
+        iteration_limit=iterations, branch=3, roll_branch=0, roll_forward_steps=0, end_gate=99,
+    )
+    settings.update(options)
+    task = MCTS_Task(**settings)
+    task.save_llm_cache = lambda: None       # 不写出 fuzzy_match.json
+    return task
+
+
+def unique_nodes(root):
+    """DAG中的全部节点(共享节点只出现一次)与置换表引入的额外父边数"""
+    seen, nodes, links, stack = set(), [], 0, [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        nodes.append(node)
+        links += len(node.parents)
+        stack.extend(node.children.values())
+    return nodes, links
+
+
+def signature(root):
+    """按trace比较两棵树：{trace: (numVisits, V, 子节点数)}"""
+    nodes, _ = unique_nodes(root)
+    return {node.trace: (node.numVisits, round(node.V, 9), len(node.children)) for node in nodes}
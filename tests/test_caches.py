@@ -0,0 +1,136 @@
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import fake_search  # noqa: F401  (把仓库根目录加入 sys.path)
+from webMCTS.value_cache import ValueCache
+from webMCTS.world_cache import WorldCache
+
+"""
+    奖励模型缓存与世界模型转移缓存: 按字节淘汰、批量写入磁盘、跨实例可见、pickle只携带路径与配置
+    python -m unittest discover tests
+"""
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache', 'cache.db')
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.dir)
+
+    def open(self, cls, **options):
+        cache = cls(self.path, **options)
+        self.caches.append(cache)
+        return cache
+
+    def rows(self, sql, params=()):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute(sql, params).fetchall()
+
+
+class ValueCacheTest(CacheTest):
+    def test_memory_is_bounded_by_bytes(self):
+        cache = self.open(ValueCache, max_bytes=4096)
+        for i in range(50):
+            cache.put(f"key {i}", 1.0, 'reason ' * 20)
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 4096)
+        self.assertGreater(stats['evictions'], 0)
+        self.assertEqual(stats['entries'], len(cache.memory))
+        # 被淘汰的条目从磁盘读回
+        cache.flush()
+        self.assertEqual(cache.get('key 0'), (1.0, 'reason ' * 20))
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_writes_are_batched(self):
+        cache = self.open(ValueCache, commit_every=4, commit_interval=3600)
+        for i in range(3):
+            cache.put(f"key {i}", 0.5, 'reason')
+        self.assertEqual(self.rows("SELECT COUNT(*) FROM step_value"), [(0,)])
+        cache.put('key 3', 0.5, 'reason')
+        self.assertEqual(self.rows("SELECT COUNT(*) FROM step_value"), [(4,)])
+
+    def test_visible_to_other_instances(self):
+        writer, reader = self.open(ValueCache), self.open(ValueCache)
+        self.assertIsNone(reader.get('key'))
+        writer.put('key', 2.0, 'reason')
+        writer.put('empty', 2.0, '')            # 无法解析的打分不缓存
+        writer.flush()
+        self.assertEqual(reader.get('key'), (2.0, 'reason'))
+        self.assertIsNone(reader.get('empty'))
+        self.assertEqual(reader.stats()['misses'], 2)
+
+    def test_pickle_ships_path_and_config_only(self):
+        cache = self.open(ValueCache, max_bytes=1 << 20, commit_every=1000, commit_interval=3600)
+        cache.put('key', 3.0, 'reason')
+        copy = pickle.loads(pickle.dumps(cache))
+        self.caches.append(copy)
+        self.assertEqual(copy.config(), cache.config())
+        self.assertEqual(len(copy.memory), 0)
+        self.assertEqual(copy.get('key'), (3.0, 'reason'))
+        self.assertEqual(copy.stats()['disk_hits'], 1)
+
+
+class WorldCacheTest(CacheTest):
+    def test_single_sample_is_deterministic(self):
+        cache = self.open(WorldCache)
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', 'page 1')
+        cache.put('key', 'page 2')              # 已有 samples_per_key 个采样，不再追加
+        self.assertEqual([cache.get('key') for _ in range(3)], ['page 1'] * 3)
+
+    def test_samples_rotate_once_full(self):
+        cache = self.open(WorldCache, samples_per_key=2)
+        cache.put('key', 'page 1')
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', 'page 2')
+        self.assertEqual([cache.get('key') for _ in range(3)], ['page 1', 'page 2', 'page 1'])
+
+    def test_miss_is_not_cached(self):
+        writer, reader = self.open(WorldCache), self.open(WorldCache)
+        self.assertIsNone(reader.get('key'))
+        self.assertNotIn('key', reader.memory)
+        writer.put('key', 'page')
+        writer.flush()
+        self.assertEqual(reader.get('key'), 'page')
+        self.assertEqual(reader.stats()['disk_hits'], 1)
+
+    def test_memory_hit_touches_last_used(self):
+        cache = self.open(WorldCache)
+        cache.put('key', 'page')
+        cache.flush()
+        self.rows("UPDATE transition SET last_used = 0")
+        self.assertEqual(cache.get('key'), 'page')
+        cache.flush()
+        self.assertGreater(self.rows("SELECT last_used FROM transition")[0][0], 0)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_disk_keeps_most_recently_used_keys(self):
+        cache = self.open(WorldCache, max_disk_keys=2)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, f"page {key}")
+        cache.flush()
+        for order, key in enumerate(('a', 'b', 'c')):
+            self.rows("UPDATE transition SET last_used = ? WHERE key = ?", (order, key))
+        cache.get('a')
+        cache.flush()
+        cache._trim_disk()
+        self.assertEqual(sorted(key for (key,) in self.rows("SELECT key FROM transition")), ['a', 'c'])
+
+    def test_pickle_keeps_world_options(self):
+        cache = self.open(WorldCache, samples_per_key=3, max_disk_keys=10)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.caches.append(copy)
+        self.assertEqual((copy.samples_per_key, copy.max_disk_keys), (3, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
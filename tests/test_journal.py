@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from fake_search import install_backends, make_task, unique_nodes, signature
+from webMCTS.journal import SearchJournal, rotated_journals, discard_journal
+
+"""
+    搜索日志: 写出 -> 从日志重建的搜索树与原树一致；恢复后不重复请求LLM；旧日志的保留与删除
+    python -m unittest discover tests
+"""
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'journal', '21.jsonl')
+        self.backends = install_backends()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def restore(self, **options):
+        task = make_task(journal_path=self.path, resume=True, **options)
+        journal = SearchJournal(self.path, task.question, resume=True)
+        try:
+            return journal.restore(task), journal
+        finally:
+            journal.close()
+
+    def test_restore_rebuilds_the_same_tree(self):
+        root, _, _ = make_task(iterations=15, use_transposition=True, journal_path=self.path).run()
+        restored, journal = self.restore(use_transposition=True)
+        self.assertEqual(signature(restored), signature(root))
+        self.assertEqual(unique_nodes(restored)[1], unique_nodes(root)[1])
+        self.assertEqual(journal.rounds, 15)
+        for node in unique_nodes(restored)[0]:
+            children = node.children.values()
+            self.assertEqual(node.childVisitSum, sum(child.numVisits for child in children))
+            self.assertAlmostEqual(node.childValueSum, sum(child.V * child.numVisits for child in children))
+
+    def test_resume_finished_search_makes_no_requests(self):
+        root, _, _ = make_task(iterations=6, journal_path=self.path).run()
+        self.backends.reset()
+        resumed, _, _ = make_task(iterations=6, journal_path=self.path, resume=True).run()
+        self.assertEqual(sum(self.backends.calls.values()), 0)
+        self.assertEqual(signature(resumed), signature(root))
+
+    def test_torn_last_line_is_dropped(self):
+        make_task(iterations=4, journal_path=self.path).run()
+        with open(self.path, 'r') as file:
+            lines = file.read().splitlines()
+        with open(self.path, 'a') as file:
+            file.write('{"type": "node", "id"')
+        self.restore()
+        with open(self.path, 'r') as file:
+            self.assertEqual(file.read().splitlines(), lines)
+
+    def test_other_task_is_rejected(self):
+        SearchJournal(self.path, 'intent a').close()
+        with self.assertRaises(ValueError):
+            SearchJournal(self.path, 'intent b', resume=True)
+
+    def test_rotate_and_discard(self):
+        start = os.path.getmtime(self.dir) - 100
+        for i in range(3):
+            SearchJournal(self.path, 'intent').close()
+            # 改名时以修改时间(秒)为后缀，错开各份日志的修改时间
+            os.utime(self.path, (start + 10 * i, start + 10 * i))
+        kept = rotated_journals(self.path)
+        self.assertEqual(len(kept), 1)
+        self.assertTrue(kept[0].endswith(time.strftime('%Y%m%d-%H%M%S', time.localtime(start + 10))))
+        with open(self.path, 'r') as file:
+            self.assertEqual(json.loads(file.readline()), {'type': 'meta', 'intent': 'intent'})
+
+        worker = os.path.join(self.dir, 'journal', '21.w0.jsonl')
+        SearchJournal(worker, 'intent').close()
+        other = os.path.join(self.dir, 'journal', '22.jsonl')
+        SearchJournal(other, 'intent').close()
+        discard_journal(self.path)
+        self.assertEqual(os.listdir(os.path.join(self.dir, 'journal')), ['22.jsonl'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.retry import RetryPolicy, BadReplyError, CircuitOpenError, classify_error
+
+"""
+    熔断器状态机: closed -> open -> half-open(只放行一个探测请求) -> closed | open
+    python -m unittest discover tests
+"""
+
+
+class Transient(TimeoutError):
+    pass
+
+
+def failing(error, calls):
+    def func():
+        calls.append(1)
+        raise error
+    return func
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=1, base_delay=0, failure_threshold=3, reset_timeout=60)
+        self.endpoint = self.policy.endpoint('test')
+
+    def trip(self):
+        for _ in range(self.policy.failure_threshold):
+            with self.assertRaises(Transient):
+                self.policy.call('test', failing(Transient('timeout'), []))
+        self.assertEqual(self.endpoint.snapshot()['state'], 'open')
+
+    def expire(self):
+        self.endpoint.opened_at -= self.policy.reset_timeout
+
+    def test_opens_after_threshold_and_rejects(self):
+        self.trip()
+        calls = []
+        with self.assertRaises(CircuitOpenError):
+            self.policy.call('test', failing(Transient('timeout'), calls))
+        self.assertEqual(calls, [])
+        self.assertEqual(self.endpoint.snapshot()['rejected'], 1)
+
+    def test_single_probe_then_close_on_success(self):
+        self.trip()
+        self.expire()
+        probe = self.endpoint.admit()
+        self.assertGreater(probe, 0)
+        self.assertEqual(self.endpoint.snapshot()['state'], 'half-open')
+        with self.assertRaises(CircuitOpenError):
+            self.endpoint.admit()
+        self.endpoint.end_probe(probe)
+        self.assertEqual(self.policy.call('test', lambda: 'ok'), 'ok')
+        self.assertEqual(self.endpoint.snapshot()['state'], 'closed')
+
+    def test_probe_transient_failure_reopens(self):
+        self.trip()
+        self.expire()
+        with self.assertRaises(Transient):
+            self.policy.call('test', failing(Transient('timeout'), []))
+        self.assertEqual(self.endpoint.snapshot()['state'], 'open')
+        self.assertFalse(self.endpoint.probing)
+
+    def test_probe_non_retryable_failure_closes(self):
+        self.trip()
+        self.expire()
+        with self.assertRaises(ValueError):
+            self.policy.call('test', failing(ValueError('maximum context length exceeded'), []))
+        self.assertEqual(self.endpoint.snapshot()['state'], 'closed')
+        self.assertEqual(self.policy.call('test', lambda: 'ok'), 'ok')
+
+    def test_cancelled_probe_does_not_stick_half_open(self):
+        self.trip()
+        self.expire()
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(self.policy.call_async('test', cancelled))
+        self.assertFalse(self.endpoint.probing)
+
+        async def ok():
+            return 'ok'
+
+        self.assertEqual(asyncio.run(self.policy.call_async('test', ok)), 'ok')
+        self.assertEqual(self.endpoint.snapshot()['state'], 'closed')
+
+    def test_bad_replies_do_not_trip(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0, failure_threshold=2)
+        for _ in range(5):
+            with self.assertRaises(BadReplyError):
+                policy.call('test', failing(BadReplyError('empty reply'), []))
+        self.assertEqual(policy.endpoint('test').snapshot()['state'], 'closed')
+
+    def test_probe_bad_reply_closes(self):
+        self.trip()
+        self.expire()
+        with self.assertRaises(BadReplyError):
+            self.policy.call('test', failing(BadReplyError('empty reply'), []))
+        self.assertEqual(self.endpoint.snapshot()['state'], 'closed')
+
+    def test_only_probe_outcome_closes(self):
+        self.trip()
+        self.expire()
+        probe = self.endpoint.admit()
+        # 熔断前发出的普通请求此时以不可重试的错误结束
+        self.endpoint.failure('fatal', 0)
+        self.assertEqual(self.endpoint.snapshot()['state'], 'half-open')
+        self.endpoint.failure('transient', probe)
+        self.endpoint.end_probe(probe)
+        self.assertEqual(self.endpoint.snapshot()['state'], 'open')
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_local_errors_are_not_retried(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=0, failure_threshold=1)
+        for error in (TypeError('bad argument'), KeyError('missing'), IndexError('out of range')):
+            calls = []
+            with self.assertRaises(type(error)):
+                policy.call('local', failing(error, calls))
+            self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.endpoint('local').snapshot()['state'], 'closed')
+
+    def test_bad_reply_is_retried(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0)
+        calls = []
+        with self.assertRaises(BadReplyError):
+            policy.call('reply', failing(BadReplyError('empty reply'), calls))
+        self.assertEqual(len(calls), 3)
+
+    def test_classes(self):
+        self.assertEqual(classify_error(BadReplyError('empty reply')), 'bad_reply')
+        self.assertEqual(classify_error(Transient('timeout')), 'transient')
+        self.assertEqual(classify_error(ValueError('prompt is too long')), 'context_overflow')
+        self.assertEqual(classify_error(TypeError('bad argument')), 'fatal')
+
+
+if __name__ == '__main__':
+    unittest.main()
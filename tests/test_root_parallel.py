@@ -0,0 +1,84 @@
+import unittest
+
+from fake_search import install_backends, make_task, unique_nodes, signature
+from webMCTS.base import treeNode
+from webMCTS.root_parallel import export_tree, merge_trees
+from utils.state_store import release_tree
+
+"""
+    根并行: export_tree 的记录 -> merge_trees；置换表共享的节点只导出/计数一次
+    python -m unittest discover tests
+"""
+
+
+def diamond():
+    """root -> a, b；a 与 b 都指向同一个节点 c(置换表命中)"""
+    root = treeNode('')
+    root.update_state('page root ' * 20)
+    for action in ('click [1]', 'click [2]'):
+        root.append_children(action, f"step {action}\n")
+        child = root.children[action]
+        child.update_state(f"page {action} " * 20)
+    a, b = root.children['click [1]'], root.children['click [2]']
+    a.append_children('click [3]', 'step 3\n')
+    shared = a.children['click [3]']
+    shared.update_state('page shared ' * 20)
+    b.add_shared_child('click [3]', shared)
+    shared.numVisits, shared.V = 4, 1.0
+    a.numVisits, a.V = 3, 0.5
+    b.numVisits, b.V = 2, 0.5
+    root.numVisits = 6
+    return root, shared
+
+
+class ExportTest(unittest.TestCase):
+    def test_shared_node_is_exported_once(self):
+        root, shared = diamond()
+        records, ids = export_tree(root)
+        nodes = [record for record in records if record['type'] == 'node']
+        links = [record for record in records if record['type'] == 'link']
+        self.assertEqual(len(nodes), 4)
+        self.assertEqual(len(links), 1)
+        self.assertEqual(links[0]['id'], ids[id(shared)])
+        self.assertEqual(records[ids[id(shared)]]['parent'], ids[id(shared.parent)])
+        # 父节点总在子节点之前，link在全部节点之后
+        for record in nodes:
+            if record['parent'] is not None:
+                self.assertLess(record['parent'], record['id'])
+        self.assertEqual(records[-1]['type'], 'link')
+        release_tree(root)
+
+
+class MergeTest(unittest.TestCase):
+    def test_merge_single_dag_keeps_visits(self):
+        root, shared = diamond()
+        merged, _ = merge_trees([export_tree(root)[0]])
+        self.assertEqual(signature(merged), signature(root))
+        nodes, links = unique_nodes(merged)
+        self.assertEqual((len(nodes), links), (4, 1))
+        merged_shared = merged.children['click [2]'].children['click [3]']
+        self.assertIs(merged_shared, merged.children['click [1]'].children['click [3]'])
+        self.assertEqual(merged_shared.numVisits, 4)
+        self.assertEqual(merged.children['click [2]'].childVisitSum, 4)
+        release_tree(root)
+        release_tree(merged)
+
+    def test_merge_searched_trees(self):
+        install_backends()
+        trees = [make_task(iterations=15, seed=seed, use_transposition=True).run()[0] for seed in range(2)]
+        merged, _ = merge_trees([export_tree(trees[0])[0]])
+        self.assertEqual(signature(merged), signature(trees[0]))
+        self.assertEqual(unique_nodes(merged)[1], unique_nodes(trees[0])[1])
+
+        merged, mapping = merge_trees([export_tree(tree)[0] for tree in trees])
+        self.assertEqual(merged.numVisits, sum(tree.numVisits for tree in trees))
+        nodes, _ = unique_nodes(merged)
+        self.assertEqual(sum(node.numVisits for node in nodes), sum(
+            node.numVisits for tree in trees for node in unique_nodes(tree)[0]
+        ))
+        for tree in trees + [merged]:
+            release_tree(tree)
+
+
+if __name__ == '__main__':
+    unittest.main()
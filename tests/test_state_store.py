@@ -0,0 +1,122 @@
+import unittest
+
+from fake_search import load_pages, install_backends, make_task, unique_nodes
+from utils.state_store import StateStore, STATE_STORE, state_key, release_tree
+from utils.treeNode import build_tree_from_json
+from utils.search_utils import save_tree
+
+"""
+    页面存储: 相同页面只保存一次；持有数降为0的页面才会被清理；树文件中的页面在节点引用时才放入存储
+    python -m unittest discover tests
+"""
+
+PAGE = 'RootWebArea "Shop" focused: True\n' + 'link "item" ' * 50
+OTHER = 'RootWebArea "Cart" focused: True\n' + 'button "buy" ' * 50
+
+
+class OwnershipTest(unittest.TestCase):
+    def setUp(self):
+        self.store = StateStore(cache_entries=1)
+
+    def test_same_page_is_stored_once(self):
+        first, second = self.store.put(PAGE), self.store.put(PAGE)
+        self.assertIs(first, second)
+        self.assertEqual(first, state_key(PAGE))
+        self.assertEqual(self.store.stats()['states'], 1)
+        self.assertEqual(self.store.owners[first], 2)
+
+    def test_get_decompresses_after_lru_eviction(self):
+        for codec in ('zlib', 'lzma'):
+            self.store.codec = codec
+            key = self.store.put(PAGE + codec)
+            self.store.put(OTHER)
+            self.assertEqual(self.store.get(key), PAGE + codec)
+
+    def test_compact_keeps_owned_pages(self):
+        kept, dropped = self.store.put(PAGE), self.store.put(OTHER)
+        self.store.put(OTHER)
+        self.store.release(dropped)
+        self.store.compact()
+        self.assertIn(dropped, self.store.blobs)
+        self.store.release(dropped)
+        self.store.release(dropped)         # 多余的release不会使持有数为负
+        self.store.compact()
+        self.assertNotIn(dropped, self.store.blobs)
+        self.assertEqual(self.store.get(kept), PAGE)
+        self.assertEqual(self.store.stats()['compressed_bytes'], len(self.store.blobs[kept][2]))
+
+    def test_compaction_runs_when_store_doubles(self):
+        self.store.min_compact = self.store.next_compact = 4
+        for i in range(20):
+            self.store.release(self.store.put(f"{PAGE} {i}"))
+        self.assertLess(self.store.stats()['states'], 8)
+
+    def test_empty_state_is_not_stored(self):
+        self.assertEqual(self.store.put(''), '')
+        self.assertIsNone(self.store.put(None))
+        self.assertEqual(self.store.stats()['states'], 0)
+
+
+class TableTest(unittest.TestCase):
+    def setUp(self):
+        source = StateStore()
+        self.key = source.put(PAGE)
+        self.table = source.export([self.key])
+        self.store = StateStore()
+
+    def test_get_does_not_store_unclaimed_page(self):
+        self.assertEqual(self.store.get(self.key, self.table), PAGE)
+        self.assertEqual(self.store.stats()['states'], 0)
+        with self.assertRaises(KeyError):
+            self.store.get(self.key)
+
+    def test_ref_stores_page_on_first_claim(self):
+        key = self.store.ref(self.key, self.table)
+        self.assertIs(self.store.ref(self.key, self.table), key)
+        self.assertEqual(self.store.owners[key], 2)
+        self.assertEqual(self.store.get(key), PAGE)
+        with self.assertRaises(KeyError):
+            self.store.ref(state_key(OTHER), self.table)
+
+
+class TreeTest(unittest.TestCase):
+    def setUp(self):
+        STATE_STORE.compact()
+        self.before = STATE_STORE.stats()['states']
+
+    def assertReleased(self, *roots):
+        for root in roots:
+            release_tree(root)
+        STATE_STORE.compact()
+        self.assertEqual(STATE_STORE.stats()['states'], self.before)
+
+    def test_filtered_children_do_not_leak_pages(self):
+        page, other = load_pages(2)
+        short = 'too short'                 # build_tree_from_json 跳过页面过短的子节点
+        source = StateStore()
+        table = source.export([source.put(page), source.put(other), source.put(short)])
+        tree = {
+            'action': '', 'state_ref': state_key(page), 'depth': 0, 'children': [
+                {'action': 'click [1]', 'state_ref': state_key(other), 'depth': 1},
+                {'action': 'click [2]', 'state_ref': state_key(short), 'depth': 1},
+            ],
+        }
+        root = build_tree_from_json(tree, states=table)
+        self.assertEqual([(child.action, child.state) for child in root.children.values()], [('click [1]', other)])
+        self.assertNotIn(state_key(short), STATE_STORE.blobs)
+        self.assertReleased(root)
+
+    def test_saved_search_tree_round_trip(self):
+        install_backends()
+        root, _, _ = make_task(iterations=6).run()
+        states = {}
+        saved = save_tree(root, states)
+        pages = {node.state_key for node in unique_nodes(root)[0]}
+        self.assertEqual(set(states), pages)
+        loaded = build_tree_from_json(saved, states=states)
+        self.assertEqual(loaded.state, root.state)
+        self.assertReleased(root, loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fake_search import install_backends, make_task, unique_nodes
+from utils.tree_file import write_tree, TreeReader
+from utils.search_utils import save_tree
+from utils.state_store import release_tree
+
+"""
+    树文件: write_tree 写出 -> TreeReader 按索引读取的节点、trace与页面与原树一致
+    python -m unittest discover tests
+"""
+
+
+def strip(tree):
+    """嵌套dict中只保留两种格式共有的字段"""
+    keys = ('action', 'state_ref', 'trace', 'numVisits', 'V', 'V_desc', 'depth', 'isTerminal', 'isFullyExpanded', 'isTransposition')
+    record = {key: tree[key] for key in keys}
+    record['children'] = {action: strip(child) for action, child in tree['children'].items()}
+    return record
+
+
+class TreeFileTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        install_backends()
+        cls.root, _, _ = make_task(iterations=15, use_transposition=True).run()
+        cls.dir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.dir, 'tree', '21.tree')
+        cls.count = write_tree(cls.root, cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        release_tree(cls.root)
+        shutil.rmtree(cls.dir)
+
+    def test_subtree_matches_save_tree(self):
+        states = {}
+        expected = save_tree(self.root, states)
+        with TreeReader(self.path) as reader:
+            self.assertEqual(len(reader), self.count)
+            tree, pages = reader.subtree(reader.root_id)
+        self.assertEqual(strip(tree), strip(expected))
+        self.assertEqual(pages, states)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_path_rebuilds_traces(self):
+        nodes, links = unique_nodes(self.root)
+        traces = {node.trace for node in nodes}
+        with TreeReader(self.path) as reader:
+            self.assertEqual(self.count, len(nodes) + links)
+            for node_id in range(len(reader)):
+                records = reader.path(node_id)
+                self.assertEqual([record['id'] for record in records], reader.ancestors(node_id))
+                self.assertIn(records[-1]['trace'], traces)
+
+    def test_subtree_of_inner_node(self):
+        with TreeReader(self.path) as reader:
+            child_id = reader.children[reader.root_id][0]
+            tree, pages = reader.subtree(child_id)
+            self.assertEqual(tree['trace'], reader.path(child_id)[-1]['trace'])
+            self.assertEqual(set(pages), set(self._refs(tree)))
+
+    def _refs(self, tree):
+        yield tree['state_ref']
+        for child in tree['children'].values():
+            yield from self._refs(child)
+
+    def test_truncated_file_is_rejected(self):
+        broken = os.path.join(self.dir, 'broken.tree')
+        with open(self.path, 'rb') as source, open(broken, 'wb') as target:
+            target.write(source.read()[:-4])
+        with self.assertRaises(ValueError):
+            TreeReader(broken)
+        with open(broken, 'wb') as target:
+            target.write(b'{"trace": {}}')
+        with self.assertRaises(ValueError):
+            TreeReader(broken)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+
+"""
+    基于标准库logging的日志子系统，logger名称为 `webmcts.<分类>`：
+    :: search(搜索轮次/阶段)  select/ucb/backprop(选择与回溯)  rollout
+    :: llm.policy/llm.world/llm.reward(三个LLM角色)  llm.client/llm.usage(请求与用量)
+    :: parse(回复清洗)  a11y(页面解析与摘要)  fuzzy(动作模糊匹配)  cache/journal/cassette
+    环境变量(也可调用 `configure_logging`)：
+    :: WEBMCTS_LOG_LEVEL      默认级别及分类级别，如 "INFO,llm.world=WARNING"；默认INFO，DEBUG输出完整的页面状态与回复
+    :: WEBMCTS_LOG_SAMPLE     分类采样率，如 "ucb=0.01,llm.policy=0.1"(每100/10条保留1条)，WARNING及以上不采样
+    :: WEBMCTS_LOG_JSONL      额外写入紧凑的JSONL日志文件
+    :: WEBMCTS_LOG_MAX_CHARS  单条消息的最大字符数，超出部分截断，默认0(不截断)
+    :: WEBMCTS_LOG_STDOUT     设为0时不输出到标准输出
+    日志记录在调用线程中只做级别与采样判断，消息格式化与写出都在后台线程完成
+"""
+
+ROOT_NAME = 'webmcts'
+
+
+def get_logger(category):
+    return logging.getLogger(f"{ROOT_NAME}.{category}")
+
+
+class SamplingFilter(logging.Filter):
+    """按分类采样：rate=0.1 表示每10条保留1条(确定性计数，不消耗random的随机数)"""
+    def __init__(self, rates) -> None:
+        super().__init__()
+        self.periods = {category: max(int(round(1 / rate)), 1) if rate > 0 else 0 for category, rate in rates.items()}
+        self.counters: dict = {}
+
+    def period(self, name):
+        # 按最长前缀匹配分类，例如 llm 的采样率作用于 llm.world
+        category = name[len(ROOT_NAME) + 1:]
+        while category:
+            if category in self.periods:
+                return self.periods[category]
+            category = category.rpartition('.')[0]
+        return 1
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        period = self.period(record.name)
+        if period == 1:
+            return True
+        if period == 0:
+            return False
+        counter = self.counters.setdefault(record.name, itertools.count())
+        return next(counter) % period == 0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """不在调用线程中格式化消息，原样放入队列，由后台线程的handler格式化"""
+    def prepare(self, record):
+        return record
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, fmt=None, max_chars=0) -> None:
+        super().__init__(fmt)
+        self.max_chars = max_chars
+
+    def truncate(self, message):
+        if self.max_chars and len(message) > self.max_chars:
+            return f"{message[:self.max_chars]}...(+{len(message) - self.max_chars} chars)"
+        return message
+
+    def format(self, record):
+        return self.truncate(super().format(record))
+
+
+class JsonlFormatter(TruncatingFormatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'cat': record.name[len(ROOT_NAME) + 1:],
+            'pid': record.process,
+            'thread': record.threadName,
+            'msg': self.truncate(record.getMessage()),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_listener = None
+_settings: dict = {}
+
+
+def parse_levels(spec):
+    """ "INFO,llm.world=WARNING" -> ('INFO', {'llm.world': 'WARNING'}) """
+    default, levels = 'INFO', {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        if '=' in item:
+            category, level = item.split('=', 1)
+            levels[category.strip()] = level.strip().upper()
+        else:
+            default = item.upper()
+    return default, levels
+
+
+def parse_rates(spec):
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        category, rate = item.split('=', 1)
+        rates[category.strip()] = float(rate)
+    return rates
+
+
+def configure_logging(level='INFO', sample='', jsonl=None, max_chars=0, stdout=True):
+    """
+        (重新)配置 `webmcts` 下的全部logger
+        :: level: str, 见 WEBMCTS_LOG_LEVEL
+        :: sample: str | dict, 见 WEBMCTS_LOG_SAMPLE
+        :: jsonl: str | None, JSONL日志文件路径
+        :: max_chars: int, 单条消息最大字符数(0不截断)
+        :: stdout: bool, 是否输出到标准输出
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    _settings.update(level=level, sample=sample, jsonl=jsonl, max_chars=max_chars, stdout=stdout)
+
+    root = logging.getLogger(ROOT_NAME)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    default, levels = parse_levels(level)
+    root.setLevel(default)
+    for name, child in logging.root.manager.loggerDict.items():
+        if name.startswith(f"{ROOT_NAME}.") and isinstance(child, logging.Logger):
+            child.setLevel(logging.NOTSET)
+    for category, category_level in levels.items():
+        get_logger(category).setLevel(category_level)
+
+    handlers = []
+    if stdout:
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(TruncatingFormatter('%(message)s', max_chars=max_chars))
+        handlers.append(console)
+    if jsonl:
+        os.makedirs(os.path.dirname(jsonl) or '.', exist_ok=True)
+        sink = logging.FileHandler(jsonl, encoding='utf-8')
+        sink.setFormatter(JsonlFormatter(max_chars=max_chars))
+        handlers.append(sink)
+    if not handlers:
+        root.addHandler(logging.NullHandler())
+        return
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    rates = parse_rates(sample) if isinstance(sample, str) else dict(sample)
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+    root.addHandler(handler)
+    _listener = QueueListener(records, *handlers)
+    _listener.start()
+
+
+def logging_settings():
+    """当前配置，子进程中以 `configure_logging(**settings)` 复现同样的日志配置"""
+    return dict(_settings)
+
+
+def flush_logging():
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+configure_logging(
+    level=os.environ.get("WEBMCTS_LOG_LEVEL", "INFO"),
+    sample=os.environ.get("WEBMCTS_LOG_SAMPLE", ""),
+    jsonl=os.environ.get("WEBMCTS_LOG_JSONL"),
+    max_chars=int(os.environ.get("WEBMCTS_LOG_MAX_CHARS", "0")),
+    stdout=os.environ.get("WEBMCTS_LOG_STDOUT", "1") != "0",
+)
+atexit.register(flush_logging)
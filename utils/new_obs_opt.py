@@ -1,9 +1,13 @@
 import re
 import random
+from threading import Lock
 
 from utils.obs_opt import *
+from utils.profiler import profiled, text_size
+from utils.logger import get_logger
 from typing import Optional, Dict, List, Tuple
 
+a11y_logger = get_logger('a11y')
 
 MAX_NODE_NUMS = 10
 
@@ -277,6 +281,23 @@ def tree_to_text(root) -> str:
     dfs(root)
     return "\n".join(lines)
 
+def visible_tree_to_text(root) -> str:
+    """
+    只输出可见的子树，结果与 prune_invisible_subtrees(root) 后再 tree_to_text(root) 相同，但不修改树结构，
+    同一棵解析树可以反复重新打标、生成多份摘要。
+    """
+    lines: List[str] = []
+
+    def dfs(node: "TreeNode"):
+        indent = "\t" * node.depth
+        lines.append(indent + _render_line(node))
+        for child in node.children:
+            if child.visible:
+                dfs(child)
+
+    dfs(root)
+    return "\n".join(lines)
+
 
 # ============ 工具 ============
 def iter_tree(root):
@@ -320,7 +341,8 @@ def sample_subtree(
     root: "TreeNode",
     N: int,
     ratio_interactive: float = 0.65,
-    seed: int = None
+    seed: int = None,
+    prune: bool = True
     ):
     """
     参数
@@ -329,6 +351,7 @@ def sample_subtree(
     N     : int             目标采样节点数量
     ratio_interactive :     交互节点占比（例如 0.65）
     seed  : int | None      随机种子，便于复现
+    prune : bool            是否裁剪不可见子树；为False时保留树结构，用 visible_tree_to_text 输出
 
     返回
     ----
@@ -367,15 +390,30 @@ def sample_subtree(
         open_path_to_root(node)
 
     # 6) 可选：裁剪不可见子树，生成紧凑返回
-    prune_invisible_subtrees(root)
+    if prune:
+        prune_invisible_subtrees(root)
     return root
 
 
+def describe_state_summary(args, kwargs, result):
+    item = kwargs.get('item') or args[0]
+    return {'state_chars': text_size(item.get('state')), 'summary_chars': text_size(result)}
+
+
+@profiled('state_summary', cat='cpu', describe=describe_state_summary)
 def state_summary(item: dict, sample_strategy: str = 'random'):
     state, action_str = item['state'], item['output']
     
     #! Step1: root <- parse_text_to_tree(raw_text: A11y_data = state)
     root = parse_text_to_tree(state)
+    return summarize_tree(root, action_str, sample_strategy)
+
+
+def summarize_tree(root: TreeNode, action_str: str, sample_strategy: str = 'random'):
+    """
+        在已解析的a11y树上生成行动对应的摘要：只改写节点的可见性标记，不修改树结构，
+        因此同一页面的多个候选行动可以共享一次解析 (见 `ParsedState`)
+    """
     # 这里将全部的节点设置为不可见很重要，后续采样对应于打开可见节点
     parse_node_descendants(node=root, action=action_set_invisible)
     
@@ -384,7 +422,7 @@ def state_summary(item: dict, sample_strategy: str = 'random'):
     try:
         target_node_id, new_action_str = parse_action(action_str, root)
     except:
-        print(f"[ERROR]: 目标节点对应的行动```{action_str}```解析失败! 原因: 节点ID不存在")
+        a11y_logger.warning("[ERROR]: 目标节点对应的行动```%s```解析失败! 原因: 节点ID不存在", action_str)
         return None
     
     # 对action落在[scroll, goto, go_back, stop]的特殊情况(无target_node_id)，跳过2.1的剩余步骤
@@ -426,15 +464,36 @@ def state_summary(item: dict, sample_strategy: str = 'random'):
             # print(f"NODE ID:{node.node_id} | 父节点:{num_ancestors} | 兄弟节点:{num_siblings} | 子节点:{num_descendants}")
             
         except:
-            print(f"[ERROR]: 目标节点[{target_node_id}]的父节点、兄弟节点、子节点提取失败")
+            a11y_logger.warning("[ERROR]: 目标节点[%s]的父节点、兄弟节点、子节点提取失败", target_node_id)
             return None
     
     #! Step2.2: 将一棵部分可见的树进行余下部分的采样
     try:
-        root = sample_subtree(root, N=MAX_NODE_NUMS, seed=42)
+        root = sample_subtree(root, N=MAX_NODE_NUMS, seed=42, prune=False)
     except:
-        print('[ERROR] 采样剩余部分过程中出现错误，仅返回目标区域的摘要数据！')
+        a11y_logger.warning('[ERROR] 采样剩余部分过程中出现错误，仅返回目标区域的摘要数据！')
         return tree_to_text(root)
     
-    #! Step3: summary_contents <- tree_to_text(root: TreeNode = root)
-    return tree_to_text(root)
\ No newline at end of file
+    #! Step3: summary_contents <- visible_tree_to_text(root: TreeNode = root)
+    return visible_tree_to_text(root)
+
+
+class ParsedState(object):
+    """
+        同一父节点状态下的全部子节点共享一次a11y解析：第一次调用时解析，之后每个行动只重新打标并输出摘要
+        可见性标记是共享的，摘要之间用锁串行；该锁只保护这棵解析树，与搜索树的扩展锁无关
+    """
+    def __init__(self, state: str) -> None:
+        self.state = state
+        self.root = None
+        self.parsed = False
+        self.lock = Lock()
+
+    @profiled('state_summary', cat='cpu', describe=lambda args, kwargs, result: {
+        'state_chars': text_size(args[0].state), 'summary_chars': text_size(result)})
+    def summary(self, action_str: str, sample_strategy: str = 'random'):
+        with self.lock:
+            if not self.parsed:
+                self.root = parse_text_to_tree(self.state)
+                self.parsed = True
+            return summarize_tree(self.root, action_str, sample_strategy)
\ No newline at end of file
@@ -2,6 +2,11 @@ import re
 import random as rd
 from functools import partial
 
+from utils.profiler import profiled, text_size
+from utils.logger import get_logger
+
+a11y_logger = get_logger('a11y')
+
 RETAINED_PROPERTIES = ["required", "disabled", "checked", "valuemin", "valuemax", "valuetext", "selected", "page_dialog_message"]
 UNWANTED_PROPERTIES = ["focused", "autocomplete", "hasPopup", "expanded", "multiselectable", "orientation", "controls"]
 UNINTERACTIVE_ROLES = ["StaticText", "LabelText", "main", "heading", "LayoutTable", "tabpanel", "LayoutTableRow", "LayoutTableCell", "time", "list", "contentinfo", "table", "row", "rowheader", "columnheader", "gridcell", "caption", "DescriptionList", "DescriptionListTerm", "DescriptionListDetail", "RootWebArea", "rowgroup", "alert"]
@@ -463,7 +468,7 @@ def action_reformat_table(node:TreeNode):
                         row_element.visible = False
             dfs_merge_text(node)
     except Exception as e:
-        print("Table reformatting error:", e)
+        a11y_logger.warning("Table reformatting error: %s", e)
 
 def action_merge_duplicated_headings(node:TreeNode):
     if not node.visible or not node.all_children_invisible() or not node.parent or node.visible_siblings():
@@ -645,6 +650,11 @@ def parse_action(action_str, DOM_root_node):
     elif 'stop' in action:
         return None, action
 
+def describe_obs_highlight(args, kwargs, result):
+    a11y_data = kwargs['a11y_data'] if 'a11y_data' in kwargs else args[1]
+    return {'state_chars': text_size(a11y_data), 'summary_chars': text_size(result)}
+
+@profiled('get_obs_highlight', cat='cpu', describe=describe_obs_highlight)
 def get_obs_highlight(action_str, a11y_data, sample_strategy='random'):
     # 将文本web页面信息(A11y)转化为树结构
     root = parse_text_to_tree(a11y_data)
@@ -659,10 +669,10 @@ def get_obs_highlight(action_str, a11y_data, sample_strategy='random'):
         
         # 处理scroll, goto, go_back, stop等情况
         if target_node_id is None:
-            print(f"None Id-type action {action_str}")
+            a11y_logger.debug("None Id-type action %s", action_str)
             return ''
     except:
-        print(f"[Error] InValid action {action_str}")
+        a11y_logger.warning("[Error] InValid action %s", action_str)
         return None
         
     # 由行动确定目标节点, target_node_id非空
@@ -704,9 +714,9 @@ def get_obs_highlight(action_str, a11y_data, sample_strategy='random'):
             res_action = action_set_visible_if_with_name(sibling)
         
         num_siblings = browser_node.get_visible_node_number() - num_ancestors - num_descendants
-        print(f"NODE ID:{node.node_id} | 父节点:{num_ancestors} | 兄弟节点:{num_siblings} | 子节点:{num_descendants}")
+        a11y_logger.debug("NODE ID:%s | 父节点:%d | 兄弟节点:%d | 子节点:%d", node.node_id, num_ancestors, num_siblings, num_descendants)
     except:
-        print(f"[Error] InValid action id [{target_node_id}]")
+        a11y_logger.warning("[Error] InValid action id [%s]", target_node_id)
         return None
     
     # 构建新的summary树（根据当前action对于web page的summary）
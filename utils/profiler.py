@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import atexit
+import inspect
+import functools
+import itertools
+import threading
+import contextvars
+from threading import Lock
+
+from utils.logger import get_logger
+
+"""
+    搜索过程的计时span：
+    :: 每个span记录 name / cat / 开始时间 / 耗时 / 线程，以及 round、节点深度、prompt/response 字符数等附加信息
+    :: cat: 'phase' (MCTS各阶段) | 'llm' (等待LLM) | 'cpu' (a11y解析与摘要等Python侧计算)
+    :: WEBMCTS_PROFILE=xxx.json  输出Chrome trace-event文件(chrome://tracing 或 Perfetto 打开)
+    :: WEBMCTS_PROFILE=xxx.jsonl 每行一个span
+    未开启时装饰器与span只做一次布尔判断
+"""
+
+logger = get_logger('profile')
+
+_current_round = contextvars.ContextVar('profile_round', default=None)
+
+
+class Profiler(object):
+    def __init__(self, path=None) -> None:
+        self.lock = Lock()
+        self.rounds = itertools.count(1)
+        self.configure(path)
+
+    def configure(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.events: list = []
+        self.time_origin = time.perf_counter()
+
+    def next_round(self):
+        """开始新的一轮搜索，当前上下文(线程/协程)中之后的span都带上该轮次编号"""
+        if not self.enabled:
+            return None
+        round_id = next(self.rounds)
+        _current_round.set(round_id)
+        return round_id
+
+    def record(self, name, cat, start, end, args):
+        if _current_round.get() is not None:
+            args.setdefault('round', _current_round.get())
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start - self.time_origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def span(self, name, cat='phase', **args):
+        return _Span(self, name, cat, args)
+
+    def summary(self):
+        """按 (cat, name) 汇总span的次数与总耗时(秒)"""
+        totals: dict = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            key = (event['cat'], event['name'])
+            count, total = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, total + event['dur'] / 1e6)
+        return totals
+
+    def save(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            events = list(self.events)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if self.path.endswith('.jsonl'):
+            with open(self.path, 'w') as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        else:
+            with open(self.path, 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        logger.info("已将%d个span写入%s", len(events), self.path)
+        for (cat, name), (count, total) in sorted(self.summary().items(), key=lambda item: -item[1][1]):
+            logger.info("%5s %-28s count=%-6d total=%.3fs", cat, name, count, total)
+
+
+class _Span(object):
+    def __init__(self, profiler, name, cat, args) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __setitem__(self, key, value):
+        self.args[key] = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.enabled:
+            self.profiler.record(self.name, self.cat, self.start, time.perf_counter(), self.args)
+
+
+PROFILER = Profiler(os.environ.get("WEBMCTS_PROFILE"))
+atexit.register(PROFILER.save)
+
+def set_profiler(path):
+    PROFILER.configure(path)
+
+
+def text_size(content):
+    """prompt/response 的字符数，兼容字符串、chat消息列表与回复列表"""
+    if not content:
+        return 0
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, dict):
+        return len(content.get('content') or '')
+    if isinstance(content, (list, tuple)):
+        return sum(text_size(item) for item in content)
+    return 0
+
+
+def profiled(name, cat='phase', describe=None):
+    """
+        给函数(同步或协程)加上计时span
+        :: describe: callable(args, kwargs, result) -> dict | None, 生成span的附加信息
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not PROFILER.enabled:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                result = await func(*args, **kwargs)
+                PROFILER.record(name, cat, start, time.perf_counter(), describe(args, kwargs, result) if describe else {})
+                return result
+            return wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            PROFILER.record(name, cat, start, time.perf_counter(), describe(args, kwargs, result) if describe else {})
+            return result
+        return wrapper
+
+    return decorator
+
+
+def in_context(func):
+    """把当前上下文(轮次编号)带到线程池中执行的函数里"""
+    if not PROFILER.enabled:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
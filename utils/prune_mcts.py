@@ -1,24 +1,47 @@
 import os
 import re
 import json
+from threading import Lock
 from dataclasses import dataclass, asdict
 from typing import Optional, List, Union, Dict, Tuple
 
 from utils.treeNode import treeNode
 from utils.query_llm import LLMAPI
+from utils.logger import get_logger
+
+cache_logger = get_logger('cache')
+fuzzy_logger = get_logger('fuzzy')
+prune_logger = get_logger('prune')
 
 MAX_RETYR = 5
 
 
 if os.path.exists("fuzzy_match.json"):
     # Load the existing dictionary from the JSON file
-    print("Loading LLM_CACHE from fuzzy_match.json...")
+    cache_logger.info("Loading LLM_CACHE from fuzzy_match.json...")
     with open("fuzzy_match.json", "r") as f:
         loaded = json.load(f)
     LLM_CACHE = {tuple(k.split("|||")): v for k, v in loaded.items()}
 else:
     LLM_CACHE: Dict[Tuple[str, str], bool] = {}   # {(action1, action2): bool}
 
+LLM_CACHE_LOCK = Lock()
+
+# 模糊匹配共用一个LLMAPI，连接池见 `models/clients.py`
+llm = LLMAPI(base_url=os.environ.get("qwen_base_url"), api_key=os.environ.get("API_KEY_QWEN"))
+
+def save_llm_cache(path: str = "fuzzy_match.json") -> None:
+    """
+    将 LLM_CACHE 写回文件；多个任务在同一进程中并发保存时串行执行，
+    先写临时文件再原子替换，避免中途崩溃留下半个JSON
+    """
+    with LLM_CACHE_LOCK:
+        json_ready = {f"{k[0]}|||{k[1]}": v for k, v in list(LLM_CACHE.items())}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(json_ready, f, indent=4)
+        os.replace(tmp_path, path)
+
 def _cache_key(a1: str, a2: str) -> Tuple[str, str]:
     """
     构造对称不区分顺序的 key：
@@ -36,7 +59,7 @@ def prune_traj_tree(root: treeNode) -> None:
     # ============ 0. 先处理自身 children 中的 **格式非法** 节点 ============
     for child in list(root.children.values()):
         if judge_format(child.execute_action) is None:
-            print(f"[警告] 发现非法 action: {child.execute_action}, 正在尝试剪枝...")
+            prune_logger.warning("[警告] 发现非法 action: %s, 正在尝试剪枝...", child.execute_action)
             _splice_bad_node(child)
     
     # ============ 1. 递归剪枝子树 ============
@@ -102,10 +125,8 @@ def _merge_sibling_duplicates(node: treeNode) -> None:
 
 def is_same_action(action1, action2, n=1):
     
-    llm = LLMAPI(base_url=os.environ.get("qwen_base_url"), api_key=os.environ.get("API_KEY_QWEN"))
-    
     # 如果是完全一致的action，直接返回True
-    print(f"[判断] 处理 ```{action1}``` 和 ```{action2}``` 是否是相同的action...")
+    fuzzy_logger.debug("[判断] 处理 ```%s``` 和 ```%s``` 是否是相同的action...", action1, action2)
     if action1 == action2:
         return True
     
@@ -127,13 +148,12 @@ def is_same_action(action1, action2, n=1):
         #! 构造全局查询key
         key = _cache_key(text1, text2)
         if key in LLM_CACHE:                      # ① 命中缓存
-            print(f"[命中缓存Stop] ```{text1}``` 和 ```{text2}``` 是不同的action")
+            fuzzy_logger.debug("[命中缓存Stop] ```%s``` 和 ```%s``` 是不同的action", text1, text2)
             return LLM_CACHE[key]
         
-        print(f"[请求Stop] ```{text1}``` 和 ```{text2}``` 是不同的action，正在请求LLM进行判断...")
+        fuzzy_logger.debug("[请求Stop] ```%s``` 和 ```%s``` 是不同的action，正在请求LLM进行判断...", text1, text2)
         result = llm.llm_fuzzy_match(text1, text2, n=n)
-        print(f"[响应] {result}")
-        print('='*75)
+        fuzzy_logger.debug("[响应] %s\n%s", result, '='*75)
         LLM_CACHE[key] = result
         return LLM_CACHE[key]
     
@@ -154,13 +174,12 @@ def is_same_action(action1, action2, n=1):
         #! 构造全局查询key
         key = _cache_key(text1, text2)
         if key in LLM_CACHE:                      # ① 命中缓存
-            print(f"[命中缓存Type] ```{text1}``` 和 ```{text2}``` 是不同的action")
+            fuzzy_logger.debug("[命中缓存Type] ```%s``` 和 ```%s``` 是不同的action", text1, text2)
             return LLM_CACHE[key]
         
-        print(f"[请求Type] ```{text1}``` 和 ```{text2}``` 是不同的action，正在请求LLM进行判断...")
+        fuzzy_logger.debug("[请求Type] ```%s``` 和 ```%s``` 是不同的action，正在请求LLM进行判断...", text1, text2)
         result = llm.llm_fuzzy_match(text1, text2, n=n)
-        print(f"[响应] {result}")
-        print('='*75)
+        fuzzy_logger.debug("[响应] %s\n%s", result, '='*75)
         LLM_CACHE[key] = result
         return LLM_CACHE[key]
     
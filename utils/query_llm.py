@@ -1,6 +1,13 @@
 import json
-import time
-from openai import OpenAI
+from models.models import inflight_limiter
+from models.retry import RETRY, BadReplyError, classify_error
+from models.clients import CLIENTS
+from models.cassette import cassette
+from utils.logger import get_logger
+
+llm_logger = get_logger('llm')
+fuzzy_logger = get_logger('fuzzy')
+reflection_logger = get_logger('reflection')
 
 MAX_RETRY = 3
 
@@ -140,29 +147,29 @@ class LLMAPI:
     def __init__(self, base_url, api_key):
         self.base_url = base_url
         self.api_key = api_key
-        self.client = self.create_client()
+        self.endpoint = f"llmapi:{base_url}"     # 重试预算与熔断按服务地址区分
     
-    def create_client(self):
-        return OpenAI(
-            base_url=self.base_url,
-            api_key=self.api_key
-        )
+    @property
+    def client(self):
+        # 同一服务地址的所有LLMAPI实例共享客户端与连接池，创建LLMAPI不再新建连接
+        return CLIENTS.get(self.base_url, self.api_key)
     
     def generate(self, messages: list, model: str, temperature=0.7, max_tokens=8192):
-        return self.client.chat.completions.create(
-            messages=messages,
-            model=model,
-            stream=False,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        with inflight_limiter:
+            return self.client.chat.completions.create(
+                messages=messages,
+                model=model,
+                stream=False,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
     
     def _call_llm(self, prompt, n=1):
         outputs = []
         while n > 0:
             n -= 1
             try:
-                res = self.generate(
+                res = RETRY.call(self.endpoint, lambda: self.generate(
                     messages=[
                         {'role':'system', 'content': 'You are a helpful assistant.'},
                         {'role':'user', 'content': prompt}
@@ -170,14 +177,15 @@ class LLMAPI:
                     model='qwen-max-2025-01-25',
                     temperature=0.7,
                     max_tokens=256
-                )
+                ))
                 outputs.extend([choice.message.content for choice in res.choices])
             except Exception as e:
-                print(f"[Error] Error occurred when getting LLM reply!\nError type:{e}\n")
+                llm_logger.warning("[Error] Error occurred when getting LLM reply!\nError type:%s\n", e)
         
         result = outputs[0]
         return result
     
+    @cassette('fuzzy_match', empty=False, skip_self=True)
     def llm_fuzzy_match(self, pred, reference, n=1):
         messages=[
             {
@@ -197,27 +205,26 @@ class LLMAPI:
             }
         ]
 
-        try_times = 0
-        while try_times < MAX_RETRY:
-            try:
+        def judge():
+            with inflight_limiter:
                 completion = self.client.chat.completions.create(
                     model="qwen-max-2025-01-25",
                     messages=messages, 
                     response_format={"type": "json_object"},
                 )
-                json_string = completion.choices[0].message.content
-                parse_reuslt = json.loads(json_string)
-                judge, judge_score = parse_reuslt['similarity_binary'], parse_reuslt['similarity_score']
-                if judge == "yes" and float(judge_score) >= 0.5:
-                    return True
-                else:
-                    return False
-            
-            except Exception as e:
-                try_times += 1
-                print('>>> 第{}次解析结果失败:{}'.format(try_times, e))
-                if try_times == MAX_RETRY:
-                    return False
+            # 回复无法解析时按暂时性错误重新请求
+            try:
+                parse_reuslt = json.loads(completion.choices[0].message.content)
+                judge, judge_score = parse_reuslt['similarity_binary'], float(parse_reuslt['similarity_score'])
+            except (IndexError, KeyError, TypeError, ValueError) as e:
+                raise BadReplyError(f"unparsable fuzzy match reply: {e!r}") from e
+            return judge == "yes" and judge_score >= 0.5
+        
+        try:
+            return RETRY.call(self.endpoint, judge, max_attempts=MAX_RETRY)
+        except Exception as e:
+            fuzzy_logger.warning('>>> 解析结果失败:%s', e)
+            return False
     
     def llm_gen_reflection(self, objective, fnode_action, last_state, current_state):
         message = reflection_cot_prompt['intro'] + reflection_cot_prompt['template'].format(
@@ -227,28 +234,22 @@ class LLMAPI:
             current_state=current_state, 
         )
         
-        attempt = 0
-        while attempt < MAX_RETRY:
-            try:
+        def reflect():
+            with inflight_limiter:
                 completion = self.client.chat.completions.create(
                     model='gpt-4',
                     messages=[{'role': 'user', 'content': message}],
                     temperature=0.7, 
                     max_tokens=16384
                 )
-                return completion.choices[0].message.content
-            except Exception as e:
-                error_str = str(e)
-                print(f"Attempt {attempt + 1} failed with error: {e}")
-                
-                # 检查是否是输入长度超限错误
-                if "Range of input length should be [1, 30720]" in error_str:
-                    print(f"输入长度超过模型限制(30720)，跳过重试")
-                    # 直接返回错误信息，不再重试
-                    return f"ERROR: 输入长度超过模型限制(30720)"
-                
-                if attempt + 1 < MAX_RETRY:
-                    time.sleep(1)
-                else:
-                    print(f"Failed to process message after {MAX_RETRY} attempts. Error: {e}")
-                    return ''
\ No newline at end of file
+            return completion.choices[0].message.content
+        
+        try:
+            return RETRY.call(self.endpoint, reflect, max_attempts=MAX_RETRY)
+        except Exception as e:
+            # 输入长度超限不会重试(见 `models/retry.py` 的错误分类)
+            if classify_error(e) == 'context_overflow':
+                reflection_logger.warning("输入长度超过模型限制(30720)，跳过重试")
+                return f"ERROR: 输入长度超过模型限制(30720)"
+            reflection_logger.error("Failed to process message after %d attempts. Error: %s", MAX_RETRY, e)
+            return ''
@@ -1,3 +1,5 @@
+from utils.state_store import STATE_STORE
+
 
 def get_all_leaf_nodes(root):
     """深度优先搜索（DFS）"""
@@ -13,18 +15,36 @@ def get_all_leaf_nodes(root):
             stack.extend(current_node.children.values())
     return leaves
 
-def save_tree(root):
-    """将树保存为 JSON 文件"""
-    tree_dict = serialize_node(root)
+def save_tree(root, states=None):
+    """
+    将树保存为 JSON 文件
+    :: states: dict | None, 传入时节点以 state_ref 引用页面，用到的页面(压缩)写入该页面表；
+    ::     None时每个节点内嵌完整页面(旧格式)
+    """
+    refs = set() if states is not None else None
+    tree_dict = serialize_node(root, refs=refs)
+    if states is not None:
+        states.update(STATE_STORE.export(refs))
     return tree_dict
 
-def serialize_node(node):
-    """递归序列化单个节点及其子节点"""
+def serialize_node(node, parent=None, refs=None):
+    """
+    递归序列化单个节点及其子节点
+    置换表会使同一节点挂在多个父节点下(DAG)：子树只在主父节点(node.parent)下完整序列化，
+    其他父节点下只保存节点自身(不含children)，并标记 isTransposition=True
+    :: refs: set | None, 非None时只写出页面key(state_ref)并收集到refs中
+    """
     if not node:
         return None
+    is_transposition = parent is not None and node.parent is not parent
+    if refs is not None and node.state_key:
+        refs.add(node.state_key)
+        state = {"state_ref": node.state_key}
+    else:
+        state = {"state": node.state}
     return {
         "action": node.action,
-        "state": node.state,
+        **state,
         "trace": node.trace, 
         "numVisits": node.numVisits,
         "V": node.V,
@@ -32,6 +52,6 @@ def serialize_node(node):
         "depth": node.depth,
         "isTerminal": node.isTerminal,
         "isFullyExpanded": node.isFullyExpanded,
-        "children": {action: serialize_node(child) for action, child in node.children.items()}
+        "isTransposition": is_transposition,
+        "children": {} if is_transposition else {action: serialize_node(child, node, refs) for action, child in node.children.items()}
     }
-
@@ -0,0 +1,229 @@
+import sys
+import lzma
+import zlib
+import base64
+import hashlib
+from threading import Lock
+from collections import OrderedDict
+
+"""
+    按内容寻址的压缩页面存储：世界模型给出的每个a11y页面只以 sha1(页面) 为key保存一次压缩结果，节点只持有key
+    :: 世界模型经常给出完全相同的页面(如 stop/滚动后页面不变、转移缓存命中、合并多棵树时的公共前缀)
+    :: codec: 'zlib' | 'lzma'，读取时按保存时的codec解压；最近访问的页面以解压后的文本缓存在LRU中
+    :: 节点共享同一个key对象；节点的 state 赋值时登记对新key的持有并释放旧key，搜索结束后由 `release_tree(root)` 释放整棵树，
+    ::     存储增长一倍时只清理持有数降为0的页面(未释放的树只会让页面多保留一段时间，不会被误删)
+    树文件(`save_tree(root, states)` / `build_tree_from_json(..., states)`)中节点以 state_ref 引用页面，
+    页面表 {key: "codec:base64(压缩数据)"} 单独保存一次；读取时页面在节点登记持有(`ref(key, table)`)时才放入存储，
+    没有节点引用的页面(如被过滤掉的子节点)不会留在存储中
+"""
+
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def state_key(state) -> str:
+    return hashlib.sha1(state.encode('utf-8')).hexdigest()
+
+
+def _decode_page(value):
+    """页面表中的 "codec:base64" 解码为 (codec, 压缩数据)"""
+    codec, data = value.split(':', 1)
+    return codec, base64.b64decode(data)
+
+
+class StateStore(object):
+    def __init__(self, codec='zlib', cache_entries=256, min_compact=1024) -> None:
+        """
+            :: codec: str, 新页面的压缩方式
+            :: cache_entries: int, 解压后页面的LRU条目数
+        """
+        self.codec = codec
+        self.cache_entries = cache_entries
+        self.blobs: dict = {}               # dict{str: (str, str, bytes)}, [key: (key对象, codec, 压缩后的页面)]
+        self.owners: dict = {}              # dict{str: int}, [key: 持有该页面的节点数]
+        self.cache = OrderedDict()          # OrderedDict{str: str}, [key: 解压后的页面]
+        self.lock = Lock()
+        self.min_compact = min_compact
+        self.next_compact = min_compact
+        self.compressed_bytes = 0
+
+    def _canonical(self, key):
+        # 返回存储中的key对象本身，使所有节点共享同一个字符串
+        entry = self.blobs.get(key)
+        return entry[0] if entry is not None else None
+
+    def _own(self, key):
+        self.owners[key] = self.owners.get(key, 0) + 1
+        return key
+
+    def put(self, state):
+        """
+            登记一个新的持有者(节点)，不再使用时调用 `release`
+            return: str, 页面的key；None/空字符串原样返回
+        """
+        if not state:
+            return state
+        key = state_key(state)
+        with self.lock:
+            canonical = self._canonical(key)
+            if canonical is not None:
+                return self._own(canonical)
+        # 压缩在锁外进行，不阻塞其他线程读取页面
+        codec = self.codec
+        blob = CODECS[codec][0](state.encode('utf-8'))
+        with self.lock:
+            canonical = self._canonical(key)
+            if canonical is not None:
+                return self._own(canonical)
+            self.blobs[key] = (key, codec, blob)
+            self.compressed_bytes += len(blob)
+            self._remember(key, state)
+            if len(self.blobs) >= self.next_compact:
+                self._compact()
+            return self._own(key)
+
+    def release(self, key):
+        """一个持有者不再使用该页面"""
+        if not key:
+            return
+        with self.lock:
+            if self.owners.get(key, 0) > 0:
+                self.owners[key] -= 1
+
+    def get(self, key, table=None):
+        """
+            :: table: dict | None, 树文件中的页面表；key尚未被任何节点登记时从中解压，不放入存储
+        """
+        if not key:
+            return key
+        with self.lock:
+            state = self.cache.get(key)
+            if state is not None:
+                self.cache.move_to_end(key)
+                return state
+            entry = self.blobs.get(key)
+        if entry is None:
+            if table is None or key not in table:
+                raise KeyError(f"state {key} is not in the state store")
+            codec, blob = _decode_page(table[key])
+            return CODECS[codec][1](blob).decode('utf-8')
+        canonical, codec, blob = entry
+        # 解压在锁外进行，与 `put` 中的压缩相同
+        state = CODECS[codec][1](blob).decode('utf-8')
+        with self.lock:
+            self._remember(canonical, state)
+        return state
+
+    def _remember(self, key, state):
+        self.cache[key] = state
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_entries:
+            self.cache.popitem(last=False)
+
+    def ref(self, key, table=None):
+        """
+            树文件中读到的key换成存储中的key对象，并登记一个持有者
+            :: table: dict | None, 树文件中的页面表；页面不在存储中时从中取出(保持压缩状态)放入存储
+        """
+        if not key:
+            return key
+        with self.lock:
+            canonical = self._canonical(key)
+            if canonical is None:
+                if table is None or key not in table:
+                    raise KeyError(f"state {key} is not in the state store")
+                codec, blob = _decode_page(table[key])
+                self.blobs[key] = (key, codec, blob)
+                self.compressed_bytes += len(blob)
+                canonical = key
+            return self._own(canonical)
+
+    def _compact(self):
+        # 只清理持有者已全部释放的页面
+        unused = [key for key, count in self.owners.items() if count == 0]
+        for key in unused:
+            del self.owners[key]
+            _, _, blob = self.blobs.pop(key)
+            self.compressed_bytes -= len(blob)
+            self.cache.pop(key, None)
+        self.next_compact = max(self.min_compact, 2 * len(self.blobs))
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def export(self, keys):
+        """return: dict{key: "codec:base64"}, 树文件中的页面表"""
+        with self.lock:
+            return {
+                key: f"{codec}:{base64.b64encode(blob).decode('ascii')}"
+                for key, codec, blob in (self.blobs[key] for key in keys)
+            }
+
+    def stats(self):
+        with self.lock:
+            return {
+                'states': len(self.blobs),
+                'owned': sum(1 for count in self.owners.values() if count > 0),
+                'compressed_bytes': self.compressed_bytes,
+                'cached': len(self.cache),
+            }
+
+
+STATE_STORE = StateStore()
+
+
+def release_tree(root):
+    """
+        搜索树不再使用(结果已保存)时释放其中所有节点对页面的持有，置换表共享的节点只释放一次，
+        并清空整棵树共享的轨迹缓存与最大价值索引；之后不应再读取这棵树的 `state`
+    """
+    for shared in (getattr(root, 'traces', None), getattr(root, 'value_index', None)):
+        if shared is not None:
+            shared.clear()
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        STATE_STORE.release(node.state_key)
+        stack.extend(node.children.values())
+
+
+def tree_memory(root):
+    """
+        统计搜索树的内存占用(字节)，同一对象(共享的key与文本、置换表共享的子树)只计一次；
+        压缩页面的占用由 `STATE_STORE.stats()` 单独给出
+        :: return: dict, 节点数、节点对象/字符串/子节点字典各自的字节数与平均每个节点的字节数
+    """
+    seen, strings = set(), set()
+    report = {'nodes': 0, 'node_bytes': 0, 'string_bytes': 0, 'container_bytes': 0, 'unique_states': 0}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        report['nodes'] += 1
+        report['node_bytes'] += sys.getsizeof(node)
+        if hasattr(node, '__dict__'):
+            report['container_bytes'] += sys.getsizeof(node.__dict__)
+        report['container_bytes'] += sys.getsizeof(node.children)
+        for name in ('state', 'state_key', 'step_trace', 'trace', 'action', 'V_desc', 'v_desc', 'reflection', 'thinking', 'execute_action'):
+            if isinstance(getattr(type(node), name, None), property):
+                continue        # 按需拼接的trace与按key解压的state不属于节点本身
+            value = getattr(node, name, None)
+            if isinstance(value, str) and id(value) not in strings:
+                strings.add(id(value))
+                report['string_bytes'] += sys.getsizeof(value)
+                if name in ('state', 'state_key'):
+                    report['unique_states'] += 1
+        stack.extend(node.children.values())
+    total = report['node_bytes'] + report['string_bytes'] + report['container_bytes']
+    report['total_bytes'] = total
+    report['bytes_per_node'] = total / report['nodes'] if report['nodes'] else 0
+    return report
@@ -1,6 +1,10 @@
 import re
 import json
 
+from utils.logger import get_logger
+
+parse_logger = get_logger('parse')
+
 def read_json_file(file_path):
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
@@ -46,7 +50,7 @@ def action_completion(action_str, state):
         element_id = match.group(1)
         element_id = '['+element_id+']'
         if element_id not in state:
-            print(f"Invalid click action ID in {action_str}")
+            parse_logger.warning("Invalid click action ID in %s", action_str)
             return None
         return "```"+action_str+"```" + f", where {element_id} is '{nodes[element_id]['text']}'" 
     
@@ -57,7 +61,7 @@ def action_completion(action_str, state):
         element_id = match.group(1)
         element_id = '['+element_id+']'
         if element_id not in state:
-            print(f"Invalid hover action ID in {action_str}")
+            parse_logger.warning("Invalid hover action ID in %s", action_str)
             return None
         return "```"+action_str+"```" + f", where {element_id} is '{nodes[element_id]['text']}'" 
     
@@ -66,7 +70,7 @@ def action_completion(action_str, state):
             r"type ?\[(\d+)\] ?\[(.+)\] ?\[(\d+)\]", action_str
         )
         if not match:
-            print(f"Invalid type action {action_str}")
+            parse_logger.warning("Invalid type action %s", action_str)
             return None
         element_id, text, enter_flag = (
             match.group(1),
@@ -90,14 +94,14 @@ def action_completion(action_str, state):
         # up or down
         match = re.search(r"scroll ?\[?direction=(up|down)\]?", action_str)
         if not match:
-            print(f"Invalid scroll action {action_str}")
+            parse_logger.warning("Invalid scroll action %s", action_str)
         else:
             direction = match.group(1)
             return "scroll "+direction
         
         match = re.search(r"scroll ?\[?(up|down)\]?", action_str)
         if not match:
-            print(f"Invalid scroll action {action_str}")
+            parse_logger.warning("Invalid scroll action %s", action_str)
             return action_str
         else:
             direction = match.group(1)
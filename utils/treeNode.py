@@ -3,6 +3,7 @@ import re
 from collections import OrderedDict
 
 from utils.obs_opt import get_obs_highlight
+from utils.state_store import STATE_STORE
 
 MAX_POINT_NUM = 20
 MAX_SIBLING_NUM = 10
@@ -13,6 +14,11 @@ INPUTS_FORMAT = """OBSERVATION:\n{observation}\nREASON FOR ACTION:\n{reason}\nAC
 # --------------------------- 将json格式嵌套的GUI轨迹数据转化为treeNode结构数据 --------------------------- 
 
 class treeNode(object):
+    __slots__ = (
+        'action', 'parent', 'children', 'depth', 'trace', 'execute_action', 'state_key', 'numVisits', 'V',
+        'v_desc', 'isFullyExpanded', 'isTerminal', 'thinking', 'reflection',
+    )
+    
     def __init__(self, action, parent=None, depth=0) -> None:
         self.action = action
         self.parent: "treeNode | None" = parent
@@ -21,7 +27,7 @@ class treeNode(object):
         self.depth = depth
         self.trace = ''                     # str, trace, a set of `raw_action`
         self.execute_action = ''            # str, execute action generated by the Policy model
-        self.state = None                   # str, generated by the World model
+        self.state_key = None               # str, 页面在 STATE_STORE 中的key
         self.numVisits = 0                  # int, visiting frequency
         self.V = 0                          # float, value of node, generated by the World model
         self.v_desc = ''                    # string, the detailed reasons generated by the reward model
@@ -30,6 +36,16 @@ class treeNode(object):
         self.thinking = ''                  # string 节点当前的思考过程，//#! 通过请求thinking LLM得到一个response
         self.reflection = ''                # string 节点当前的状态反思，//#! 通过请求reflection LLM得到一个response
 
+    # str, generated by the World model；按key从 STATE_STORE 解压
+    @property
+    def state(self):
+        return STATE_STORE.get(self.state_key)
+
+    @state.setter
+    def state(self, state):
+        previous, self.state_key = self.state_key, STATE_STORE.put(state)
+        STATE_STORE.release(previous)
+
     # 便于添加孩子的辅助函数
     def add_child(self, child: "treeNode") -> None:
         self.children[id(child)] = child
@@ -103,7 +119,17 @@ class treeNode(object):
 
         return len(visible_ids)
 
-def build_tree_from_json(json_data, parent=None, depth=0):
+def json_state(json_data, states=None):
+    """节点的页面：新格式以 state_ref 引用页面表 states，旧格式直接内嵌 state"""
+    if 'state_ref' in json_data:
+        return STATE_STORE.get(json_data['state_ref'], states)
+    return json_data.get('state', '')
+
+def build_tree_from_json(json_data, parent=None, depth=0, states=None):
+    """
+        :: states: dict | None, 树文件中的页面表(`save_tree(root, states)` 写出)，节点以 state_ref 引用其中的页面，
+        ::     只有建出的节点引用的页面才放入 `STATE_STORE`
+    """
     # 创建当前节点
     node = treeNode(
         action=json_data.get('action', ''), 
@@ -111,7 +137,10 @@ def build_tree_from_json(json_data, parent=None, depth=0):
         depth=json_data.get("depth", parent.depth + 1 if parent else 0)
     )
     # 设置节点属性
-    node.state = json_data.get('state', '')
+    if 'state_ref' in json_data:
+        node.state_key = STATE_STORE.ref(json_data['state_ref'], states)
+    else:
+        node.state = json_data.get('state', '')
     node.depth = json_data.get('depth', '')
     node.thinking = json_data.get('thinking', '')
     node.execute_action = json_data.get('execute_action', '')
@@ -133,13 +162,13 @@ def build_tree_from_json(json_data, parent=None, depth=0):
     
     for child_data in iterable:
         # 过滤掉 state 过短的子节点（可能是状态生成中存在的错误）
-        state = child_data.get('state', '')
+        state = json_state(child_data, states)
         if not state:
             continue
         elif len(state) < 100:
             continue
         
-        child_node = build_tree_from_json(child_data, parent=node)
+        child_node = build_tree_from_json(child_data, parent=node, states=states)
         node.add_child(child_node)
     
     # 判断节点是否扩展
@@ -0,0 +1,186 @@
+import io
+import os
+import json
+import zlib
+import struct
+
+from utils.state_store import STATE_STORE
+
+"""
+    流式写出、按偏移索引读取的搜索树文件(.tree)：
+    :: 写出时按DFS顺序逐个节点压缩写入，不构造整棵树的嵌套dict；读取时只解压需要的节点
+    :: 文件结构:  MAGIC | 记录... | 索引 | 索引偏移(8字节) + END_MAGIC
+    ::     记录 = 4字节长度 + zlib(JSON)；节点记录与页面记录共用该格式
+    ::     索引 = {"nodes": [[偏移, 父节点编号, [子节点编号...]], ...], "pages": {key: 偏移}}
+    :: 节点记录: {"id", "parent", "action", "state_ref", "step_trace", "trace_is_absolute", "numVisits", "V", "V_desc",
+    ::            "depth", "isTerminal", "isFullyExpanded", "isTransposition"}
+    ::     完整trace不写入文件，读取时沿父节点拼接step_trace(与 `treeNode.trace` 一致)
+    :: 页面记录: {"key", "page": "codec:base64"}，每个页面只写一次(见 `utils/state_store.py`)
+    置换表共享的节点与 `serialize_node` 相同：只在主父节点下写出子树，其他父节点下只写节点本身
+"""
+
+MAGIC = b'WMTREE1\n'
+END_MAGIC = b'WMTREND\n'
+FOOTER = struct.Struct('>Q')
+LENGTH = struct.Struct('>I')
+
+
+def _encode(record) -> bytes:
+    data = zlib.compress(json.dumps(record, ensure_ascii=False).encode('utf-8'), 6)
+    return LENGTH.pack(len(data)) + data
+
+
+def write_tree(root, path):
+    """
+        :: return: int, 写出的节点数
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    nodes, pages = [], {}
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        stack = [(root, None)]
+        while stack:
+            node, parent_id = stack.pop()
+            node_id = len(nodes)
+            is_transposition = parent_id is not None and node.parent is not nodes[parent_id][3]
+            key = node.state_key
+            if key and key not in pages:
+                pages[key] = f.tell()
+                f.write(_encode({'key': key, 'page': STATE_STORE.export([key])[key]}))
+
+            nodes.append([f.tell(), parent_id, [], node])
+            if parent_id is not None:
+                nodes[parent_id][2].append(node_id)
+            f.write(_encode({
+                'id': node_id,
+                'parent': parent_id,
+                'action': node.action,
+                'state_ref': key,
+                # 共享节点的trace以主父节点为前缀，在其他父节点下保存为绝对轨迹
+                'step_trace': node.trace if is_transposition else node.step_trace,
+                'trace_is_absolute': is_transposition or node.trace_is_absolute,
+                'numVisits': node.numVisits,
+                'V': node.V,
+                'V_desc': node.V_desc,
+                'depth': node.depth,
+                'isTerminal': node.isTerminal,
+                'isFullyExpanded': node.isFullyExpanded,
+                'isTransposition': is_transposition,
+            }))
+            if not is_transposition:
+                # 逆序入栈，使子节点按插入顺序写出
+                stack.extend((child, node_id) for child in reversed(list(node.children.values())))
+
+        index_offset = f.tell()
+        index = {'nodes': [[offset, parent, children] for offset, parent, children, _ in nodes], 'pages': pages}
+        f.write(_encode(index))
+        f.write(FOOTER.pack(index_offset) + END_MAGIC)
+    os.replace(tmp_path, path)
+    return len(nodes)
+
+
+class TreeReader(object):
+    """
+        读取 `write_tree` 写出的文件：打开时只读取索引，节点与页面按需读取
+        >>> with TreeReader(path) as reader:
+        ...     tree, states = reader.subtree(reader.root_id)
+        ...     root = build_tree_from_json(tree, states=states)
+    """
+    root_id = 0
+
+    def __init__(self, path) -> None:
+        self.file_path = path
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a search tree file")
+        self.file.seek(-(FOOTER.size + len(END_MAGIC)), io.SEEK_END)
+        footer = self.file.read(FOOTER.size + len(END_MAGIC))
+        if footer[FOOTER.size:] != END_MAGIC:
+            raise ValueError(f"{path} is truncated (missing index)")
+        (index_offset,) = FOOTER.unpack(footer[:FOOTER.size])
+        index = self._read(index_offset)
+        self.offsets = [offset for offset, _, _ in index['nodes']]
+        self.parents = [parent for _, parent, _ in index['nodes']]
+        self.children = [children for _, _, children in index['nodes']]
+        self.pages = index['pages']
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _read(self, offset):
+        self.file.seek(offset)
+        (length,) = LENGTH.unpack(self.file.read(LENGTH.size))
+        return json.loads(zlib.decompress(self.file.read(length)).decode('utf-8'))
+
+    def node(self, node_id):
+        """单个节点记录(不含完整trace)"""
+        return self._read(self.offsets[node_id])
+
+    def page(self, key):
+        """return: str, "codec:base64" 形式的压缩页面"""
+        return self._read(self.pages[key])['page']
+
+    def states(self, keys):
+        """页面表 {key: "codec:base64"}，可直接传给 `build_tree_from_json(..., states=)`"""
+        return {key: self.page(key) for key in keys if key}
+
+    def ancestors(self, node_id):
+        """根节点到node_id的节点编号"""
+        ids = []
+        while node_id is not None:
+            ids.append(node_id)
+            node_id = self.parents[node_id]
+        return ids[::-1]
+
+    def path(self, node_id):
+        """
+            根节点到node_id的节点记录，每条记录带上拼接好的完整trace
+        """
+        records, trace = [], ''
+        for current in self.ancestors(node_id):
+            record = self.node(current)
+            trace = record['step_trace'] if record['trace_is_absolute'] else trace + record['step_trace']
+            record['trace'] = trace
+            records.append(record)
+        return records
+
+    def subtree(self, node_id):
+        """
+            以node_id为根的子树，与 `serialize_node` 相同的嵌套格式(页面以state_ref引用)
+            :: return: (嵌套dict, 子树用到的页面表)
+        """
+        parent = self.parents[node_id]
+        trace_prefix = self.path(parent)[-1]['trace'] if parent is not None else ''
+        refs = set()
+
+        def build(current, prefix):
+            record = self.node(current)
+            trace = record['step_trace'] if record['trace_is_absolute'] else prefix + record['step_trace']
+            if record['state_ref']:
+                refs.add(record['state_ref'])
+            return {
+                'action': record['action'],
+                'state_ref': record['state_ref'],
+                'trace': trace,
+                'numVisits': record['numVisits'],
+                'V': record['V'],
+                'V_desc': record['V_desc'],
+                'depth': record['depth'],
+                'isTerminal': record['isTerminal'],
+                'isFullyExpanded': record['isFullyExpanded'],
+                'isTransposition': record['isTransposition'],
+                'children': {child['action']: child for child in (build(child_id, trace) for child_id in self.children[current])},
+            }
+
+        tree = build(node_id, trace_prefix)
+        return tree, self.states(refs)
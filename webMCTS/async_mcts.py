@@ -0,0 +1,374 @@
+import time
+import random
+import asyncio
+
+from webMCTS.base import treeNode, build_step_trace
+from utils.new_obs_opt import ParsedState
+from webMCTS.mcts import selectNode, getBestChild, back_propagate, apply_virtual_loss, revert_virtual_loss, \
+    lookup_transposition, attach_child, log_round, init_root, describe_node, describe_rollout
+from utils.profiler import PROFILER, profiled
+from utils.logger import get_logger
+
+"""
+    asyncio 版本的 MCTS 搜索引擎：
+    :: 与 `webMCTS.mcts` 共享 treeNode、选择(UCB)与反向传播逻辑
+    :: 三个LLM角色(policy/world/reward)通过 `MCTS_Task.*_async` 协程调用，
+    :: 所有请求在同一个事件循环中并发等待，不再为每次扩展创建线程池
+"""
+
+logger = get_logger('search')
+rollout_logger = get_logger('rollout')
+
+
+# expand
+async def generate_action_async(trace, state, step, mcts_task):
+    raw_action, execute_action = '', ''
+    cnt = 3
+    while not raw_action and cnt:
+        raw_action, execute_action = await mcts_task.get_next_action_async(trace=trace, state=state, step=step)
+        cnt -= 1
+    return raw_action, execute_action
+
+
+async def is_duplicate_async(execute_action, execute_action_list, mcts_task) -> bool:
+    # duplicate_checker 可能请求LLM做模糊匹配，放到线程中执行以免阻塞事件循环
+    if hasattr(mcts_task, 'duplicate_checker') and callable(mcts_task.duplicate_checker):
+        return await asyncio.to_thread(mcts_task.duplicate_checker, execute_action, list(execute_action_list))
+    return execute_action in execute_action_list
+
+
+async def iter_proposals_async(node: treeNode, mcts_task, pending: list):
+    """
+        按返回顺序逐个产出 (raw_action, execute_action)，发出的请求记录在pending中以便调用方取消
+    """
+    if getattr(mcts_task, 'batch_proposals', False):
+        # 单次请求(n=2*branch)采样全部候选，few-shot prompt只发送一次
+        batch = asyncio.ensure_future(mcts_task.get_next_actions_async(
+            trace=node.trace, state=node.state, step=node.depth+1, n=mcts_task.branch * 2
+        ))
+        pending.append(batch)
+        for proposal in await batch:
+            yield proposal
+    else:
+        pending.extend(
+            asyncio.ensure_future(generate_action_async(node.trace, node.state, node.depth+1, mcts_task))
+            for _ in range(mcts_task.branch * 2)
+        )
+        for future in asyncio.as_completed(list(pending)):
+            yield await future
+
+
+@profiled('get_next_step_expand', describe=describe_node)
+async def get_next_step_expand_async(node: treeNode, mcts_task):
+
+    action_list = []
+    execute_action_list = []
+
+    # 全部子节点的轨迹片段共享父节点状态的一次a11y解析
+    parsed_state = ParsedState(node.state)
+
+    async def process_action(action):
+        # 观察摘要是纯CPU计算，放到线程中执行，不阻塞事件循环上的其余请求；
+        # 置换表命中时也需要(可能新建子节点)，挂接时不再解析页面
+        step_trace = await asyncio.to_thread(build_step_trace, action, node.depth+1, parsed_state)
+        # 置换表命中则复用已有结果，无需请求world/reward模型
+        entry = lookup_transposition(node, action, mcts_task)
+        if entry is not None:
+            return action, None, None, None, entry, step_trace
+        new_state = await mcts_task.get_next_state_predict_async(state=node.state, action=action)
+        value, reason = await mcts_task.get_step_value_async(node.trace + action, new_state)
+        return action, new_state, value, reason, None, step_trace
+
+    # 流水线扩展：并发生成2倍branch数量的Action，每个通过去重的Action立即开始状态预测和奖励计算；
+    # 收集到branch个不重复的Action后取消其余提案请求
+    evaluations = []
+    proposals = []
+    try:
+        async for raw_action, execute_action in iter_proposals_async(node, mcts_task, proposals):
+            if raw_action and not await is_duplicate_async(execute_action, execute_action_list, mcts_task):
+                action_list.append(raw_action)
+                execute_action_list.append(execute_action)
+                evaluations.append(asyncio.ensure_future(process_action(raw_action)))
+                if len(action_list) >= mcts_task.branch:
+                    break
+    except BaseException:
+        for evaluation in evaluations:
+            evaluation.cancel()
+        raise
+    finally:
+        for proposal in proposals:
+            proposal.cancel()
+
+    for future in asyncio.as_completed(evaluations):
+        action, new_state, value, reason, entry, step_trace = await future
+        attach_child(node, action, new_state, value, reason, mcts_task, entry, step_trace)
+
+    if not action_list:
+        node.update_reflection('<end>')
+        return node
+
+    node.isFullyExpanded = True
+    return node
+
+
+@profiled('expand', describe=describe_node)
+async def expand_async(node: treeNode, mcts_task):
+    # step1: reflection(正则匹配，无需等待LLM)
+    if not node.reflection:
+        if mcts_task.use_reflection == 'common':
+            contents = mcts_task.get_reflection(node.trace)
+        else:  # simple
+            contents = mcts_task.get_simple_reflection(node.trace)
+        if contents is not None:
+            node.update_reflection("<end>")
+
+    if node.reflection == '<end>':
+        return node
+
+    # step two
+    node = await get_next_step_expand_async(node, mcts_task)
+    return node
+
+# rollout
+async def get_rollout_actions_async(trace, state, mcts_task, step):
+    if mcts_task.roll_branch <= 0:
+        return []
+    if getattr(mcts_task, 'batch_proposals', False):
+        # 单次请求(n=roll_branch)采样全部候选
+        results = await mcts_task.get_next_actions_async(trace=trace, state=state, step=f"sim-{step}", n=mcts_task.roll_branch)
+    else:
+        results = await asyncio.gather(*[
+            generate_action_async(trace, state, f"sim-{step}", mcts_task) for _ in range(mcts_task.roll_branch)
+        ])
+    execute_action_list, action_list = [], []
+    for raw_action, execute_action in results:
+        if raw_action and execute_action not in execute_action_list:
+            action_list.append(raw_action)
+            execute_action_list.append(execute_action)
+    return action_list
+
+
+async def evaluate_action_async(trace, state, action, mcts_task):
+    new_trace = trace + action
+    new_state = await mcts_task.get_next_state_predict_async(state=state, action=action)
+    new_value, _ = await mcts_task.get_step_value_async(new_trace, new_state)
+    return new_trace, new_state, new_value
+
+
+def _is_resolved(trace, mcts_task):
+    if mcts_task.use_reflection == 'common':
+        return mcts_task.get_reflection(trace) is not None
+    return mcts_task.get_simple_reflection(trace) is not None
+
+
+@profiled('rollout', describe=describe_rollout)
+async def rollout_async(node: treeNode, mcts_task):
+    """
+        greedy: 对roll_branch个候选同时请求world/reward，选择价值最高者继续模拟
+        random: 随机选择一个候选继续模拟
+    """
+    max_V = mcts_task.low
+    trace = node.trace
+    state = node.state
+    cur_step = node.depth + 1
+
+    if _is_resolved(trace, mcts_task):
+        node.update_reflection("<end>")
+
+    if node.reflection == '<end>':
+        rollout_logger.debug('This step has been resolved and does not require simulation.\n')
+        return node.V
+
+    if mcts_task.roll_forward_steps == 0:
+        return node.V
+
+    for i in range(mcts_task.roll_forward_steps):
+        action_list = await get_rollout_actions_async(trace, state, mcts_task, cur_step)
+        if not action_list:
+            break
+        if mcts_task.roll_policy == 'greedy':
+            candidates = await asyncio.gather(*[
+                evaluate_action_async(trace, state, action, mcts_task) for action in action_list
+            ])
+            trace, state, value = max(candidates, key=lambda item: item[2])
+        else:
+            trace, state, value = await evaluate_action_async(trace, state, random.choice(action_list), mcts_task)
+        cur_step += 1
+
+        # 如果模拟时候已经存在了stop，那么终止模拟过程
+        if _is_resolved(trace, mcts_task):
+            break
+
+        if value > max_V:
+            max_V = value
+
+    return max_V
+
+
+async def executeRound_async(root: treeNode, mcts_task):
+
+    PROFILER.next_round()
+    logger.debug('%s\n选择节点阶段\n', '-' * 40)
+    flag, node = selectNode(root, mcts_task)
+
+    if flag:  # task finished
+        return True, node, root
+
+    logger.debug('%s\n扩充阶段\n', '-' * 40)
+    if node.reflection == '<end>':
+        logger.debug('跳过扩充阶段。\n')
+    else:
+        node = await expand_async(node, mcts_task)
+
+    logger.debug('%s\n模拟搜索阶段\n', '-' * 40)
+    roll_node = None
+    if node.reflection == '<end>':
+        logger.debug('跳过模拟阶段。\n')
+    else:
+        roll_node = getBestChild(node, mcts_task)
+        best_V = await rollout_async(roll_node, mcts_task)
+        roll_node.V = roll_node.V * (1 - mcts_task.alpha) + best_V * mcts_task.alpha
+        roll_node.numVisits += 1
+
+    logger.debug('%s\n反向传播阶段\n', '-' * 40)
+    back_propagate(node)
+    log_round(node, roll_node, mcts_task)
+
+    return False, node, root
+
+
+async def executeRound_parallel_async(root: treeNode, mcts_task):
+    """
+        并行worker的一轮：选择与回溯之间没有await，天然原子，无需加锁
+        :: return: (flag, node)，node为None表示选中的叶子正在被其他worker扩展
+    """
+    PROFILER.next_round()
+    path = []
+    flag, node = selectNode(root, mcts_task, path=path)
+    if flag:  # task finished
+        return True, node
+    if node.virtualLoss > 0:
+        return False, None
+    apply_virtual_loss(path)
+
+    roll_node, best_V = None, None
+    try:
+        if node.reflection == '<end>':
+            logger.debug('跳过扩充阶段。\n')
+        else:
+            node = await expand_async(node, mcts_task)
+
+        if node.reflection == '<end>':
+            logger.debug('跳过模拟阶段。\n')
+        else:
+            roll_node = getBestChild(node, mcts_task)
+            best_V = await rollout_async(roll_node, mcts_task)
+    except BaseException:
+        revert_virtual_loss(path)
+        raise
+
+    if roll_node is not None:
+        roll_node.V = roll_node.V * (1 - mcts_task.alpha) + best_V * mcts_task.alpha
+        roll_node.numVisits += 1
+    back_propagate(node, vl_path=path)
+    log_round(node, roll_node, mcts_task)
+    return False, node
+
+
+async def MCTS_search_parallel_async(mcts_task):
+    root, rounds_done, time_done = init_root(mcts_task)
+
+    stop_event = asyncio.Event()
+    # 每结束一轮通知等待中的worker，替代轮询
+    round_done = asyncio.Condition()
+    result = {'node': None, 'finish': None}
+    rounds = {'started': rounds_done, 'finished': 0}
+    time_start = time.time() - time_done
+    timeLimit = time_start + mcts_task.time_limit / 1000 if mcts_task.limit_type == 'time' else None
+
+    def take_round():
+        if timeLimit is not None:
+            return time.time() < timeLimit
+        if rounds['started'] >= mcts_task.iteration_limit:
+            return False
+        rounds['started'] += 1
+        return True
+
+    async def finish_round():
+        async with round_done:
+            rounds['finished'] += 1
+            round_done.notify_all()
+
+    async def worker(worker_id):
+        try:
+            while not stop_event.is_set() and take_round():
+                logger.info('<worker-%d 开始新搜索轮次，目前总时间:%s>\n', worker_id, time.time() - time_start)
+                finished = rounds['finished']
+                flag, node = await executeRound_parallel_async(root, mcts_task)
+                if flag:
+                    if not stop_event.is_set():
+                        result['node'] = node
+                        result['finish'] = time.time() - time_start if timeLimit is not None else rounds['started']
+                        stop_event.set()
+                    await finish_round()
+                elif node is None:
+                    # 叶子正在被其他worker扩展，该轮不计入预算，等到有其他轮次结束再重新选择
+                    if timeLimit is None:
+                        rounds['started'] -= 1
+                    async with round_done:
+                        await round_done.wait_for(lambda: rounds['finished'] != finished or stop_event.is_set())
+                else:
+                    await finish_round()
+        except Exception:
+            stop_event.set()
+            await finish_round()
+            raise
+
+    workers = [asyncio.ensure_future(worker(i)) for i in range(mcts_task.parallel_workers)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+
+    if result['finish'] is not None:
+        logger.info('已找到解决方案！\n')
+    return root, result['node'], result['finish']
+
+
+async def MCTS_search_async(mcts_task):
+    root, rounds_done, time_done = init_root(mcts_task)
+
+    if mcts_task.limit_type == 'time':
+        time_start = time.time() - time_done
+        timeLimit = time_start + mcts_task.time_limit / 1000
+        while time.time() < timeLimit:
+            logger.info('<开始新搜索轮次，目前总时间:%s>\n', time.time() - time_start)
+            flag, node, root = await executeRound_async(root, mcts_task)
+            if flag:
+                logger.info('已找到解决方案！\n')
+                return root, node, time.time() - time_start
+    else:
+        for i in range(rounds_done, mcts_task.iteration_limit):
+            logger.info('<开始新搜索轮次，目前已完成轮次数:%d>\n', i)
+            flag, node, root = await executeRound_async(root, mcts_task)
+            if flag:
+                logger.info('已找到解决方案！\n')
+                return root, node, i + 1
+    return root, None, None
+
+
+async def MCTS_async(mcts_task):
+    if getattr(mcts_task, 'parallel_workers', 1) > 1:
+        root, node, finish = await MCTS_search_parallel_async(mcts_task)
+    else:
+        root, node, finish = await MCTS_search_async(mcts_task)
+
+    if finish is not None:
+        logger.info('已找到最终解!\nSolution:%s\n', node.trace)
+        return root, node, finish
+
+    else:
+        best_node, best_V = root.getBestV()
+        logger.info('在规定时间/轮次内未找到满足要求价值的解答，采用最高价值价值解答代替。\nSolution:%s\n', best_node.trace)
+        return root, best_node, -1
@@ -1,60 +1,281 @@
-from utils.new_obs_opt import state_summary
+import heapq
+import itertools
+from threading import Lock
+from collections import OrderedDict
+
+from utils.new_obs_opt import ParsedState
 from utils.text_utils import parse_action_thinking
+from utils.state_store import STATE_STORE
+
+
+class ValueIndex(object):
+    """
+        整棵树的最大价值索引(惰性删除的大顶堆)：节点价值每次变化时压入一条记录，
+        查询时丢弃与节点当前价值不一致的过期记录，代替对整棵树的递归遍历
+        同价值时优先深度更大、创建更晚的节点(与递归版 `>=` 偏向更深节点的规则相近)
+        不另外保存节点列表：过期记录过多时从根节点遍历当前的树重建堆，未挂到树上的节点随之丢弃
+    """
+    def __init__(self) -> None:
+        self.heap: list = []
+        self.root = None                    # treeNode, 第一个登记的节点(创建索引的根节点)
+        self.size = 0                       # int, 树中的节点数(上次重建时统计，之后按登记累加)
+        self.counter = itertools.count()
+        self.lock = Lock()
+    
+    def register(self, node):
+        with self.lock:
+            node.index_seq = next(self.counter)
+            if self.root is None:
+                self.root = node
+            self.size += 1
+            self._push(node)
+    
+    def push(self, node):
+        with self.lock:
+            self._push(node)
+            if len(self.heap) > 4 * self.size + 64 and self.root is not None:
+                # 过期记录过多时按树中节点的当前价值重建
+                nodes = self._nodes()
+                self.size = len(nodes)
+                self.heap = [(-n.V, -n.depth, -n.index_seq, n) for n in nodes]
+                heapq.heapify(self.heap)
+    
+    def _nodes(self):
+        """从根节点遍历整棵树(DAG中共享的节点只计一次)"""
+        seen, nodes, stack = set(), [], [self.root]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            nodes.append(node)
+            stack.extend(list(node.children.values()))
+        return nodes
+    
+    def _push(self, node):
+        heapq.heappush(self.heap, (-node.V, -node.depth, -node.index_seq, node))
+    
+    def best(self):
+        with self.lock:
+            while self.heap:
+                neg_V, _, _, node = self.heap[0]
+                if -neg_V == node.V:
+                    return node, node.V
+                heapq.heappop(self.heap)
+        return None, None
+    
+    def clear(self):
+        """树释放时(`release_tree`)丢弃对节点的引用"""
+        with self.lock:
+            self.heap, self.root, self.size = [], None, 0
+
+
+class TraceCache(object):
+    """
+        物化后的完整轨迹字符串的有界缓存，按字符总数淘汰最久未使用的节点
+        节点只保存自身的轨迹片段(step_trace)，完整trace由祖先片段按需拼接，
+        扩展同一节点时的多次读取与兄弟节点共享的前缀都可以命中缓存
+        每棵树一个实例(由根节点创建，子节点继承)，树释放时(`release_tree`)清空，不会让已完成的树一直存活
+    """
+    def __init__(self, max_chars=8 * 2 ** 20) -> None:
+        self.max_chars = max_chars
+        self.entries = OrderedDict()        # OrderedDict{treeNode: str}
+        self.chars = 0
+        self.lock = Lock()
+    
+    def get(self, node):
+        with self.lock:
+            trace = self.entries.get(node)
+            if trace is not None:
+                self.entries.move_to_end(node)
+            return trace
+    
+    def put(self, node, trace):
+        if len(trace) > self.max_chars:
+            return
+        with self.lock:
+            previous = self.entries.pop(node, None)
+            if previous is not None:
+                self.chars -= len(previous)
+            self.entries[node] = trace
+            self.chars += len(trace)
+            while self.chars > self.max_chars:
+                _, evicted = self.entries.popitem(last=False)
+                self.chars -= len(evicted)
+    
+    def discard(self, node):
+        with self.lock:
+            previous = self.entries.pop(node, None)
+            if previous is not None:
+                self.chars -= len(previous)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.chars = 0
+
+
+def build_step_trace(action, depth, parsed_state: ParsedState):
+    """
+        生成深度为depth的子节点的轨迹片段；parsed_state为父节点状态，同一父节点的全部子节点共享一次a11y解析
+        "trace_template": <step-{index}>\n{step_trace}\n</step-{index}>\n 
+        "step_template": OBSERVATION:\n{observation}\nREASON FOR ACTION:\n{reason}\nACTION:\n{action}
+    """
+    # 解析action获取reason和action
+    thinking, step_action = parse_action_thinking(action)
+    # 对父节点状态进行压缩，提取观察信息
+    obs_summary = parsed_state.summary(step_action, sample_strategy='nearest')
+    step_trace = f"OBSERVATION:\n{obs_summary}\nREASON FOR ACTION:\n{thinking}\nACTION:\n{step_action}"
+    return f"<step-{depth}>\n{step_trace}\n</step-{depth}>\n"
+
 
 class treeNode(object):
+    # 固定字段，不为每个节点分配__dict__；长时间搜索与合并大量搜索树时节点数可达数十万
+    __slots__ = (
+        'step_trace', 'trace_is_absolute', 'action', 'state_key', 'parent', '_numVisits', '_V', 'V_desc',
+        'children', 'depth', 'isFullyExpanded', 'isTerminal', 'reflection', 'virtualLoss', 'parents',
+        'childValueSum', 'childVisitSum', 'journal_id', 'value_index', 'index_seq', 'traces',
+    )
+    
     def __init__(self, action, parent=None, depth=0) -> None:
         """
             构建一个节点需要知道节点的action(Policy model), 以及action之后的下一个状态(World model)
         """
-        self.trace = ''                     # str, trace, a set of `raw_action`
+        self.step_trace = ''                # str, 当前节点的轨迹片段，完整trace由祖先的片段拼接(见 `trace`)
+        self.trace_is_absolute = False      # bool, True时step_trace即为完整trace，不再拼接祖先片段
         self.action = action                        # str, execute action generated by the Policy model
-        self.state = None                                # str, generated by the World model
+        self.state_key = None                            # str, 页面在 STATE_STORE 中的key，页面由 `state` 按需解压
         self.parent = parent                 # treeNode
-        self.numVisits = 0                               # int, visiting frequency
-        self.V = 0                                       # float, value of node, generated by the World model
+        self._numVisits = 0                              # int, visiting frequency
+        self._V = 0                                      # float, value of node, generated by the World model
         self.V_desc = ''                    # string, the detailed reasons generated by the reward model
         self.children: dict = {}                         # dict[str: treeNode], set of child node
         self.depth = depth                          # int, tree depth
         self.isFullyExpanded = False                     # expanded, whether has childnode
         self.isTerminal = False                          # value acceptable, whether task finished
         self.reflection = ''                # string 节点当前的状态反思，//#! 通过请求reflection LLM得到一个response
+        self.virtualLoss = 0                             # int, 并行搜索时正在经过该节点的worker数量
+        self.parents: list = []                          # list[treeNode], 置换表引入的额外父节点(树变为DAG)
+        self.childValueSum = 0.0                         # float, sum(child.V * child.numVisits) over children
+        self.childVisitSum = 0                           # int, sum(child.numVisits) over children
+        self.journal_id = None                           # int, 搜索日志中的节点编号
+        self.value_index = parent.value_index if parent else ValueIndex()
+        self.value_index.register(self)
+        self.traces = parent.traces if parent else TraceCache()     # TraceCache, 整棵树共享的完整轨迹缓存
+    
+    # str, generated by the World model；节点只保存key，内容相同的页面只压缩保存一次
+    @property
+    def state(self):
+        return STATE_STORE.get(self.state_key)
+    
+    @state.setter
+    def state(self, state):
+        previous, self.state_key = self.state_key, STATE_STORE.put(state)
+        STATE_STORE.release(previous)
+    
+    # V 与 numVisits 的每次修改都以增量方式同步到父节点的子节点统计量中，回溯时无需遍历全部子节点
+    @property
+    def V(self):
+        return self._V
+    
+    @V.setter
+    def V(self, value):
+        self._update_stats(value, self._numVisits)
+    
+    @property
+    def numVisits(self):
+        return self._numVisits
+    
+    @numVisits.setter
+    def numVisits(self, numVisits):
+        self._update_stats(self._V, numVisits)
+    
+    def _update_stats(self, V, numVisits):
+        delta_value = V * numVisits - self._V * self._numVisits
+        delta_visits = numVisits - self._numVisits
+        changed = V != self._V
+        self._V, self._numVisits = V, numVisits
+        for parent in self.all_parents():
+            parent.childValueSum += delta_value
+            parent.childVisitSum += delta_visits
+        if changed:
+            self.value_index.push(self)
+    
+    @property
+    def trace(self):
+        """
+            完整轨迹 = 沿主父节点(parent)从根到当前节点的step_trace拼接；遇到已缓存的祖先时直接以其trace为前缀
+        """
+        trace = self.traces.get(self)
+        if trace is not None:
+            return trace
+        segments, prefix = [self.step_trace], ''
+        node = self
+        while not node.trace_is_absolute and node.parent is not None:
+            node = node.parent
+            cached = self.traces.get(node)
+            if cached is not None:
+                prefix = cached
+                break
+            segments.append(node.step_trace)
+        trace = prefix + ''.join(reversed(segments))
+        self.traces.put(self, trace)
+        return trace
+    
+    @trace.setter
+    def trace(self, trace):
+        # 以父节点trace为前缀时只保存差异部分，否则整体保存为绝对轨迹；只在节点创建时设置，不会使后代的缓存失效
+        parent_trace = self.parent.trace if self.parent is not None else ''
+        if self.parent is not None and trace.startswith(parent_trace):
+            self.step_trace, self.trace_is_absolute = trace[len(parent_trace):], False
+        else:
+            self.step_trace, self.trace_is_absolute = trace, self.parent is not None
+        self.traces.discard(self)
     
     # 当前节点下扩展子节点
-    def append_children(self, action):
+    def append_children(self, action, step_trace):
+        """
+            :: step_trace: str, 扩展阶段在树锁之外预先生成的轨迹片段(见 `build_step_trace`)；
+            ::     调用方通常持有树锁，这里不解析页面
+        """
         node = treeNode(action, self, self.depth+1)
-        node.update_trace_from_parent()
+        node.step_trace = step_trace
+        self.children.update({action: node})
+    
+    # 置换表命中时，将已有节点挂为当前节点的子节点(共享子树与访问统计)
+    def add_shared_child(self, action, node):
         self.children.update({action: node})
+        node.parents.append(self)
+        self.childValueSum += node.V * node.numVisits
+        self.childVisitSum += node.numVisits
+    
+    def all_parents(self):
+        if self.parent is None:
+            return []
+        return [self.parent] + self.parents
+    
+    def ancestors(self):
+        """
+            当前节点及其全部祖先(沿parent与置换表引入的parents)，子节点先于父节点
+        """
+        visited, order = set(), []
+        def visit(node):
+            visited.add(id(node))
+            for parent in node.all_parents():
+                if id(parent) not in visited:
+                    visit(parent)
+            order.append(node)
+        visit(self)
+        return order[::-1]
     
     # 当前节点下更新轨迹
     def update_trace_from_parent(self):
         """
             新的策略是继承父节点的轨迹，同时对父节点的状态进行压缩，提取作为当前节点的轨迹
-            "trace_template": <step-{index}>\n{step_trace}\n</step-{index}>\n 
-            "step_template": OBSERVATION:\n{observation}\nREASON FOR ACTION:\n{reason}\nACTION:\n{action}
+            父节点的轨迹不再复制，由 `trace` 按需拼接
         """
-        
-        # 继承父节点的轨迹
-        if self.parent:
-            self.trace = self.parent.trace
-        else:
-            self.trace = ""
-            
-        # 解析action获取reason和action（占位函数）
-        thinking, step_action = parse_action_thinking(self.action)
-        
-        # 对当前节点状态进行压缩，提取观察信息（占位函数）
-        obs_summary = state_summary(
-            item={'state': self.parent.state, 'output': step_action}, 
-            sample_strategy='nearest'
-        )
-        
-        # 生成当前步骤的轨迹片段
-        step_index = self.depth  # 使用节点深度作为步骤索引
-        step_trace = f"OBSERVATION:\n{obs_summary}\nREASON FOR ACTION:\n{thinking}\nACTION:\n{step_action}"
-        current_step = f"<step-{step_index}>\n{step_trace}\n</step-{step_index}>\n"
-        
-        # 将当前步骤添加到轨迹中
-        self.trace += current_step
+        self.step_trace = build_step_trace(self.action, self.depth, ParsedState(self.parent.state))
+        self.traces.discard(self)
         
     # 更新节点价值
     def update_value(self, value, V_desc):
@@ -69,14 +290,20 @@ class treeNode(object):
         self.reflection = reflection
     
     def getBestV(self):  # Gets the subtree maximum value node
+        if self.parent is None:
+            # 根节点直接查询整棵树的最大价值索引
+            return self.value_index.best()
+        return self._getBestV_recursive()
+    
+    def _getBestV_recursive(self):
         if not self.isFullyExpanded:
             return self, self.V
         max_V = self.V
         max_node = self
         for child in self.children.values():
-            subNode, subValue = child.getBestV()
+            subNode, subValue = child._getBestV_recursive()
             if subValue >= max_V:
                 max_V = subValue
                 max_node = subNode
         return max_node, max_V
-    
\ No newline at end of file
+    
@@ -0,0 +1,222 @@
+import os
+import glob
+import json
+import time
+import itertools
+from threading import Lock, Event, Thread
+
+from webMCTS.base import treeNode, build_step_trace
+from utils.new_obs_opt import ParsedState
+from utils.logger import get_logger
+
+"""
+    搜索日志(append-only JSONL)：搜索过程中每得到一次LLM结果就追加一条记录，进程崩溃/OOM/Ctrl-C后可从日志恢复搜索树
+    :: {"type": "meta", "intent"}                                                   第一行，记录任务指令
+    :: {"type": "node", "id", "parent", "action", "state", "value", "reason"}       新建节点(world/reward模型结果)
+    :: {"type": "link", "id", "parent", "action"}                                   置换表命中，已有节点挂到新的父节点下
+    :: {"type": "round", "elapsed", "nodes": [{"id", "V", "numVisits", "isFullyExpanded", "reflection"}]}
+    ::                                                                              一轮结束后被修改节点的统计量(绝对值，可重复应用)
+    节点的trace不写入日志，恢复时由父节点的trace与action重新计算
+    每条记录写入后立即flush(进程崩溃不丢失)；fsync每轮一次，由后台线程执行，不阻塞持有树锁的worker
+    不恢复(resume=False)时已有的日志不会被清空，而是重命名为 `{path}.{修改时间}` 保留(只保留最近的 keep_rotated 份)；
+    任务结果写出后由 `discard_journal` 删除日志及其保留的旧日志
+"""
+
+logger = get_logger('journal')
+
+
+def rotated_journals(path):
+    """`rotate` 改名保留的旧日志，按时间从早到晚排列"""
+    return sorted(glob.glob(glob.escape(path) + '.*'))
+
+
+def discard_journal(path):
+    """
+        任务结果已写出后删除搜索日志(含改名保留的旧日志与根并行各worker的 {base}.w{id}{ext} 日志)，
+        日志只用于恢复未完成的搜索
+    """
+    base, ext = os.path.splitext(path)
+    workers = glob.glob(f"{glob.escape(base)}.w*{glob.escape(ext)}*")
+    for old in [path] + rotated_journals(path) + workers:
+        if os.path.exists(old):
+            os.remove(old)
+
+
+class SearchJournal(object):
+    def __init__(self, path, intent, resume=False) -> None:
+        """
+            :: path: str, 日志文件路径
+            :: intent: str, 任务指令，恢复时用于校验日志属于同一个任务
+            :: resume: bool, True时读取已有日志并在其后继续追加；False时把已有日志改名保留(见 `rotate`)后新建日志
+        """
+        self.path = path
+        self.intent = intent
+        self.lock = Lock()
+        self.ids = itertools.count()
+        self.rounds = 0                 # int, 日志中已完成的搜索轮次
+        self.elapsed_before = 0.0       # float, 日志中已消耗的搜索时间(秒)
+        self.records = self.load() if resume else []
+
+        if self.records and self.records[0].get('intent') != intent:
+            raise ValueError(f"Journal {path} belongs to a different task")
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if not self.records:
+            self.rotate()
+        self.file = open(path, 'a' if self.records else 'w', encoding='utf-8')
+        self.closing = False
+        self.sync_event = Event()
+        self.syncer = Thread(target=self._sync_loop, name='journal-fsync', daemon=True)
+        self.syncer.start()
+        if not self.records:
+            self.write({'type': 'meta', 'intent': intent}, sync=True)
+        self.time_start = time.time()
+
+    def rotate(self, keep_rotated=1):
+        """不恢复时把已有的非空日志改名保留，而不是直接覆盖；更早保留的旧日志超过 keep_rotated 份时删除"""
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(os.path.getmtime(self.path)))
+            rotated = f"{self.path}.{stamp}"
+            os.replace(self.path, rotated)
+            logger.warning("已有搜索日志 %s 未使用 --resume，已改名为 %s", self.path, rotated)
+        kept = rotated_journals(self.path)
+        for old in kept[:max(len(kept) - keep_rotated, 0)]:
+            os.remove(old)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        # 崩溃时最后一行可能只写了一半：截断到最后一个完整的行，后续记录从新行开始追加
+        complete = content.rfind(b'\n') + 1
+        if complete < len(content):
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+        records = []
+        for line in content[:complete].decode('utf-8').splitlines():
+            if line.strip():
+                records.append(json.loads(line))
+        return records
+
+    def write(self, record, sync=False):
+        """
+            :: sync: bool, 请求后台线程fsync(每轮结束时)，调用方不等待磁盘
+        """
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+        if sync:
+            self.sync_event.set()
+
+    def _sync_loop(self):
+        while True:
+            self.sync_event.wait()
+            self.sync_event.clear()
+            if self.closing:
+                return
+            try:
+                os.fsync(self.file.fileno())
+            except (OSError, ValueError):
+                return
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.sync_event.set()
+        self.syncer.join()
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+
+    def elapsed(self):
+        return self.elapsed_before + time.time() - self.time_start
+
+    def node_id(self, node: treeNode):
+        if node.journal_id is None:
+            node.journal_id = next(self.ids)
+        return node.journal_id
+
+    def log_node(self, node: treeNode, parent=None):
+        self.write({
+            'type': 'node',
+            'id': self.node_id(node),
+            'parent': self.node_id(parent) if parent is not None else None,
+            'action': node.action,
+            'state': node.state,
+            'value': node.V,
+            'reason': node.V_desc,
+        })
+
+    def log_link(self, node: treeNode, parent: treeNode, action):
+        self.write({'type': 'link', 'id': self.node_id(node), 'parent': self.node_id(parent), 'action': action})
+
+    def log_round(self, nodes):
+        self.rounds += 1
+        record = {
+            'type': 'round',
+            'elapsed': self.elapsed(),
+            'nodes': [
+                {
+                    'id': self.node_id(node),
+                    'V': node.V,
+                    'numVisits': node.numVisits,
+                    'isFullyExpanded': node.isFullyExpanded,
+                    'reflection': node.reflection,
+                } for node in nodes
+            ],
+        }
+        self.write(record, sync=True)
+
+    def restore(self, mcts_task):
+        """
+            按日志顺序重建搜索树(不请求任何LLM)，返回根节点；日志中没有节点时返回None
+            :: 置换表开启时同时重新登记每个节点的 (state, action) 结果
+        """
+        nodes: dict = {}                # dict{int: treeNode}, [journal id: node]
+        parsed: dict = {}               # dict{int: ParsedState}, [父节点journal id: 解析后的父节点状态]
+        table = getattr(mcts_task, 'transposition_table', None)
+        for record in self.records:
+            if record['type'] == 'node':
+                if record['parent'] is None:
+                    node = treeNode(action=record['action'])
+                    node.update_state(record['state'])
+                else:
+                    parent = nodes[record['parent']]
+                    if record['parent'] not in parsed:
+                        parsed[record['parent']] = ParsedState(parent.state)
+                    step_trace = build_step_trace(record['action'], parent.depth+1, parsed[record['parent']])
+                    parent.append_children(record['action'], step_trace)
+                    node = parent.children[record['action']]
+                    node.update_state(record['state'])
+                    node.update_value(value=record['value'], V_desc=record['reason'])
+                    if table is not None and record['state']:
+                        table.register(parent.state, record['action'], node, record['state'], record['value'], record['reason'])
+                node.journal_id = record['id']
+                nodes[record['id']] = node
+            elif record['type'] == 'link':
+                nodes[record['parent']].add_shared_child(record['action'], nodes[record['id']])
+            elif record['type'] == 'round':
+                for stats in record['nodes']:
+                    node = nodes[stats['id']]
+                    node.V = stats['V']
+                    node.numVisits = stats['numVisits']
+                    node.isFullyExpanded = stats['isFullyExpanded']
+                    node.reflection = stats['reflection']
+                self.rounds += 1
+                self.elapsed_before = record['elapsed']
+
+        if not nodes:
+            return None
+        # 扩展中途崩溃的节点已有部分子节点，视为已扩展，避免重新请求
+        for node in nodes.values():
+            if node.children:
+                node.isFullyExpanded = True
+        self.ids = itertools.count(max(nodes.keys()) + 1)
+        self.records = []
+        logger.info(">>> 从日志%s恢复了%d个节点，%d轮搜索，已用时间%.1fs\n", self.path, len(nodes), self.rounds, self.elapsed_before)
+        return nodes[min(nodes.keys())]
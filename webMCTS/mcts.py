@@ -5,15 +5,44 @@ import numpy
 import random
 import random as rd
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from threading import Lock, Event, Condition
 
-from webMCTS.base import treeNode
+from webMCTS.base import treeNode, build_step_trace
+from utils.new_obs_opt import ParsedState
+from utils.profiler import PROFILER, profiled, in_context
+from utils.logger import get_logger
+
+logger = get_logger('search')
+select_logger = get_logger('select')
+ucb_logger = get_logger('ucb')
+rollout_logger = get_logger('rollout')
+backprop_logger = get_logger('backprop')
+
+
+def describe_node(args, kwargs, result):
+    return {'depth': args[0].depth}
+
+
+def describe_selected(args, kwargs, result):
+    return {'depth': result[1].depth}
+
+
+def describe_rollout(args, kwargs, result):
+    return {'depth': args[0].depth, 'best_V': result}
 
 # select
-def selectNode(node: treeNode, mcts_task):
+@profiled('selectNode', describe=describe_selected)
+def selectNode(node: treeNode, mcts_task, path=None):
+    """
+        :: path: list | None, 并行搜索时记录 root -> leaf 的选择路径，用于施加/撤销virtual loss
+    """
+    if path is not None:
+        path.append(node)
     while node.isFullyExpanded:
-        print(">> 当前节点未完全展开")
+        select_logger.debug(">> 当前节点未完全展开")
         node = getBestChild(node, mcts_task)
+        if path is not None:
+            path.append(node)
     if isTerminal(node, mcts_task):
         node.isTerminal = True
         return True, node
@@ -28,13 +57,23 @@ def getBestChild(node: treeNode, mcts_task):
         :: Hint: thus set mcts_task.INF = 1 to avoid this happen.
         :: Hint: If len(bestNodes) > 1, which means more than one node meet
         :: Hint: the UCB criteria, thus randomly select one node.
+        :: Hint: In parallel search, each in-flight worker on a child counts as a
+        :: Hint: virtual visit with value penalty `mcts_task.virtual_loss`, so that
+        :: Hint: concurrent selections spread across different leaves.
     """
-    best_UCB_value = 0
+    best_UCB_value = float('-inf')
     bestNodes: list = []
+    virtual_loss = getattr(mcts_task, 'virtual_loss', 0)
     
     for child in node.children.values():
-        nodeValue = child.V + mcts_task.exploration_constant * math.sqrt(
-            2 * math.log(node.numVisits) / child.numVisits) if child.numVisits > 0 else child.V + mcts_task.INF
+        if child.virtualLoss > 0:
+            num_visits = child.numVisits + child.virtualLoss
+            parent_visits = max(node.numVisits + node.virtualLoss, 1)
+            nodeValue = child.V - virtual_loss * child.virtualLoss + mcts_task.exploration_constant * math.sqrt(
+                2 * math.log(parent_visits) / num_visits)
+        else:
+            nodeValue = child.V + mcts_task.exploration_constant * math.sqrt(
+                2 * math.log(max(node.numVisits, 1)) / child.numVisits) if child.numVisits > 0 else child.V + mcts_task.INF
         if nodeValue > best_UCB_value:
             best_UCB_value = nodeValue
             bestNodes = [child]
@@ -42,7 +81,7 @@ def getBestChild(node: treeNode, mcts_task):
             bestNodes.append(child)
 
     best_node = rd.choice(bestNodes)
-    print(f"[getBestChild]: 当前节点行动:{best_node.action}\n当前节点UCB得分:{best_UCB_value}\n")
+    ucb_logger.debug("[getBestChild]: 当前节点行动:%s\n当前节点UCB得分:%s\n", best_node.action, best_UCB_value)
     return best_node
 
 
@@ -55,21 +94,62 @@ def isTerminal(node: treeNode, mcts_task):
         return False
 
 # expand
+def lookup_transposition(node: treeNode, action, mcts_task):
+    table = getattr(mcts_task, 'transposition_table', None)
+    if table is None:
+        return None
+    return table.lookup(node.state, action)
+
+
+def attach_child(node: treeNode, action, new_state, value, reason, mcts_task, entry, step_trace):
+    """
+        把一个扩展结果挂到node下：
+        :: entry非空(命中置换表)且已有节点比node更深时，直接复用已有节点，共享其子树与访问统计；
+        ::     所有边都指向更深的节点，因此不会成环，判断为O(1)，不需要遍历祖先
+        :: 否则新建子节点(命中时复用已预测的state/value)，并登记到置换表
+        :: step_trace: 在锁外预先生成的子节点轨迹片段，调用方持有树锁时只做O(1)的挂接
+    """
+    if action in node.children.keys():
+        return
+    journal = getattr(mcts_task, 'journal', None)
+    if entry is not None:
+        shared = entry['node']
+        if shared.depth > node.depth:
+            node.add_shared_child(action, shared)
+            if journal is not None:
+                journal.log_link(shared, node, action)
+            return
+        new_state, value, reason = entry['state'], entry['value'], entry['reason']
+    
+    node.append_children(action, step_trace)
+    child = node.children[action]
+    child.update_state(new_state)
+    child.update_value(value=value, V_desc=reason)
+    if journal is not None:
+        journal.log_node(child, node)
+    
+    table = getattr(mcts_task, 'transposition_table', None)
+    if table is not None and entry is None and new_state:
+        table.register(node.state, action, child, new_state, value, reason)
+
+
+def generate_action(trace, state, step, mcts_task):
+    raw_action, execute_action = '', ''
+    cnt = 3
+    while not raw_action and cnt:
+        raw_action, execute_action = mcts_task.get_next_action(trace=trace, state=state, step=step)
+        cnt -= 1
+    return raw_action, execute_action
+
+
+@profiled('get_next_step_expand', describe=describe_node)
 def get_next_step_expand(node: treeNode, mcts_task):
     
     action_list = []
     execute_action_list = []
-    lock = Lock()  # 线程安全锁
+    # 线程安全锁；并行搜索时使用整棵树的锁，保证子节点统计量的增量更新不会与其他worker的回溯交错
+    lock = getattr(mcts_task, 'tree_lock', None) or Lock()
     
-    # 并行生成Action
-    def generate_action():
-        raw_action = ''
-        cnt = 3
-        while not raw_action and cnt:
-            raw_action, execute_action = mcts_task.get_next_action(trace=node.trace, state=node.state, step=node.depth+1)
-            cnt -= 1
-        return raw_action, execute_action
-
     # 自定义去重检查函数
     def is_duplicate(execute_action) -> bool:
         # 如果mcts_task提供了自定义去重函数，则使用它
@@ -78,45 +158,68 @@ def get_next_step_expand(node: treeNode, mcts_task):
         # 默认去重规则：检查execute_action是否已存在
         return execute_action in execute_action_list
     
-    # 使用线程池并行生成Action（生成2倍branch数量以确保去重后足够）
-    with ThreadPoolExecutor(max_workers=mcts_task.branch) as executor:
-        futures = [executor.submit(generate_action) for _ in range(mcts_task.branch * 2)]
-        for future in as_completed(futures):
-            raw_action, execute_action = future.result()
-            if raw_action and not is_duplicate(execute_action):
-                with lock:
-                    action_list.append(raw_action)
-                    execute_action_list.append(execute_action)
-                if len(action_list) >= mcts_task.branch:
-                    break  # 达到所需数量后提前退出
-    
-    if not action_list:
-        node.update_reflection('<end>')
-        return node
+    # 全部子节点的轨迹片段共享父节点状态的一次a11y解析
+    parsed_state = ParsedState(node.state)
     
-    # 并行处理状态预测和奖励计算
+    # 状态预测和奖励计算
     def process_action(action):
+        # 子节点的观察摘要在worker线程中生成(不持有树锁)，与其余行动的LLM请求重叠；
+        # 置换表命中时也需要(可能新建子节点)，挂接时不再解析页面
+        step_trace = build_step_trace(action, node.depth+1, parsed_state)
+        # 置换表命中则复用已有结果，无需请求world/reward模型
+        entry = lookup_transposition(node, action, mcts_task)
+        if entry is not None:
+            return action, None, None, None, entry, step_trace
         # 状态预测
         new_state = mcts_task.get_next_state_predict(state=node.state, action=action)
         # 奖励计算
         value, reason = mcts_task.get_step_value(node.trace + action, new_state)
-        return action, new_state, value, reason
+        return action, new_state, value, reason, None, step_trace
     
-    with ThreadPoolExecutor(max_workers=len(action_list)) as executor:
-        futures = [executor.submit(process_action, action) for action in action_list]
-        for future in as_completed(futures):
-            action, new_state, value, reason = future.result()
+    # 流水线扩展：并行生成2倍branch数量的Action，每个通过去重的Action立即提交状态预测和奖励计算，
+    # 无需等待其余提案返回；收集到branch个Action后取消尚未开始的提案，正在进行的提案在后台结束后被丢弃
+    proposal_executor = None
+    with ThreadPoolExecutor(max_workers=mcts_task.branch) as eval_executor:
+        evaluations = []
+        try:
+            if getattr(mcts_task, 'batch_proposals', False):
+                # 单次请求(n=2*branch)采样全部候选，few-shot prompt只发送一次
+                proposals = mcts_task.get_next_actions(
+                    trace=node.trace, state=node.state, step=node.depth+1, n=mcts_task.branch * 2
+                )
+            else:
+                proposal_executor = ThreadPoolExecutor(max_workers=mcts_task.branch)
+                futures = [
+                    proposal_executor.submit(in_context(generate_action), node.trace, node.state, node.depth+1, mcts_task) 
+                    for _ in range(mcts_task.branch * 2)
+                ]
+                proposals = (future.result() for future in as_completed(futures))
+            for raw_action, execute_action in proposals:
+                if raw_action and not is_duplicate(execute_action):
+                    with lock:
+                        action_list.append(raw_action)
+                        execute_action_list.append(execute_action)
+                    evaluations.append(eval_executor.submit(in_context(process_action), raw_action))
+                    if len(action_list) >= mcts_task.branch:
+                        break  # 达到所需数量后提前退出
+        finally:
+            if proposal_executor is not None:
+                proposal_executor.shutdown(wait=False, cancel_futures=True)
+        
+        for future in as_completed(evaluations):
+            action, new_state, value, reason, entry, step_trace = future.result()
             with lock:
-                if action not in node.children.keys():
-                    node.append_children(action)
-                    child = node.children[action]
-                    child.update_state(new_state)
-                    child.update_value(value=value, V_desc=reason)
+                attach_child(node, action, new_state, value, reason, mcts_task, entry, step_trace)
+    
+    if not action_list:
+        node.update_reflection('<end>')
+        return node
     
     node.isFullyExpanded = True
     return node
 
 
+@profiled('expand', describe=describe_node)
 def expand(node: treeNode, mcts_task):
     """
         :: 这里分两步，预留出reflection的接口，用于后续加reflection；下一步是`get_next_step_expand`
@@ -138,29 +241,44 @@ def expand(node: treeNode, mcts_task):
     return node
 
 # rollout
-def get_next_step_random_rollout(trace, state, mcts_task, step):
-    # get next action
+def get_rollout_actions(trace, state, mcts_task, step):
+    """
+        获取至多roll_branch个不重复的候选行动：
+        :: batch_proposals 时单次请求(n=roll_branch)采样全部候选
+        :: 否则roll_branch个策略请求并发进行
+    """
+    if mcts_task.roll_branch <= 0:
+        return []
+    if getattr(mcts_task, 'batch_proposals', False):
+        proposals = mcts_task.get_next_actions(trace=trace, state=state, step=f"sim-{step}", n=mcts_task.roll_branch)
+    else:
+        with ThreadPoolExecutor(max_workers=mcts_task.roll_branch) as executor:
+            futures = [executor.submit(in_context(generate_action), trace, state, f"sim-{step}", mcts_task) for _ in range(mcts_task.roll_branch)]
+            proposals = [future.result() for future in futures]
+    
     execute_action_list, action_list = [], []
-    for i in range(mcts_task.roll_branch):
-        raw_action = ''
-        cnt = 3
-        while not raw_action and cnt:
-            raw_action, execute_action = mcts_task.get_next_action(trace=trace, state=state, step=f"sim-{step}")
-            cnt -= 1
-        if not raw_action:
-            continue
-        
-        if execute_action not in execute_action_list:
+    for raw_action, execute_action in proposals:
+        if raw_action and execute_action not in execute_action_list:
             action_list.append(raw_action)
             execute_action_list.append(execute_action)
-    
-    action = random.choice(action_list)
+    return action_list
+
+
+def evaluate_action(trace, state, action, mcts_task):
     new_trace = trace + action
     new_state = mcts_task.get_next_state_predict(state=state, action=action)
-    new_value, res = mcts_task.get_step_value(new_trace, new_state)
+    new_value, _ = mcts_task.get_step_value(new_trace, new_state)
     return new_trace, new_state, new_value
+
+
+def get_next_step_random_rollout(trace, state, mcts_task, step):
+    action_list = get_rollout_actions(trace, state, mcts_task, step)
+    if not action_list:
+        return None
+    return evaluate_action(trace, state, random.choice(action_list), mcts_task)
     
 
+@profiled('randomPolicy', describe=describe_rollout)
 def randomPolicy(node: treeNode, mcts_task):
     max_V = mcts_task.low
     trace = node.trace
@@ -176,14 +294,17 @@ def randomPolicy(node: treeNode, mcts_task):
         node.update_reflection("<end>")
 
     if node.reflection == '<end>':
-        print('This step has been resolved and does not require simulation.\n')
+        rollout_logger.debug('This step has been resolved and does not require simulation.\n')
         return node.V
     
     if mcts_task.roll_forward_steps == 0:
         return node.V
     
     for i in range(mcts_task.roll_forward_steps):
-        trace, state, value = get_next_step_random_rollout(trace, state, mcts_task, cur_step)
+        result = get_next_step_random_rollout(trace, state, mcts_task, cur_step)
+        if result is None:
+            break
+        trace, state, value = result
         cur_step += 1
         
         # 如果模拟时候已经存在了stop，那么终止模拟过程
@@ -201,32 +322,22 @@ def randomPolicy(node: treeNode, mcts_task):
 
 
 def get_next_step_greedy_rollout(trace, state, mcts_task, step):
-    # get next action
-    execute_action_list, action_list = [], []
-    for i in range(mcts_task.roll_branch):
-        raw_action = ''
-        cnt = 3
-        while not raw_action and cnt:
-            raw_action, execute_action = mcts_task.get_next_action(trace=trace, state=state, step=f"sim-{step}")
-            cnt -= 1
-        if not raw_action:
-            continue
-        
-        if execute_action not in execute_action_list:
-            action_list.append(raw_action)
-            execute_action_list.append(execute_action)
-            
-    new_traces = [trace + action for action in action_list]
-    
-    # get next state predict
-    new_states = [mcts_task.get_next_state_predict(state=state, action=action) for action in action_list]
+    action_list = get_rollout_actions(trace, state, mcts_task, step)
+    if not action_list:
+        return [], [], []
     
-    # get step value
-    new_values = [mcts_task.get_step_value(t, s) for t, s in zip(new_traces, new_states)]
+    # 并发请求每个候选的状态预测与奖励计算
+    with ThreadPoolExecutor(max_workers=len(action_list)) as executor:
+        futures = [executor.submit(in_context(evaluate_action), trace, state, action, mcts_task) for action in action_list]
+        results = [future.result() for future in futures]
     
+    new_traces = [new_trace for new_trace, _, _ in results]
+    new_states = [new_state for _, new_state, _ in results]
+    new_values = [new_value for _, _, new_value in results]
     return new_traces, new_states, new_values
 
 
+@profiled('greedyPolicy', describe=describe_rollout)
 def greedyPolicy(node: treeNode, mcts_task):
     max_V = mcts_task.low
     trace = node.trace
@@ -242,7 +353,7 @@ def greedyPolicy(node: treeNode, mcts_task):
         node.update_reflection("<end>")
 
     if node.reflection == '<end>':
-        print('This step has been resolved and does not require simulation.\n')
+        rollout_logger.debug('This step has been resolved and does not require simulation.\n')
         return node.V
     
     if mcts_task.roll_forward_steps == 0:
@@ -250,6 +361,8 @@ def greedyPolicy(node: treeNode, mcts_task):
     
     for i in range(mcts_task.roll_forward_steps):
         new_traces, new_states, new_values = get_next_step_greedy_rollout(trace, state, mcts_task, cur_step)
+        if not new_traces:
+            break
         cur_step += 1
         idx = numpy.argmax(new_values)
         trace, state, value = new_traces[idx], \
@@ -270,80 +383,254 @@ def greedyPolicy(node: treeNode, mcts_task):
     return max_V
         
 # back propagate
-def back_propagate(node: treeNode):
-    while node is not None:
+def apply_virtual_loss(path):
+    for node in path:
+        node.virtualLoss += 1
+
+
+def revert_virtual_loss(path):
+    for node in path:
+        node.virtualLoss -= 1
+
+
+@profiled('back_propagate', describe=describe_node)
+def back_propagate(node: treeNode, vl_path=None):
+    """
+        :: vl_path: list | None, 并行搜索时该轮选择路径，回溯时撤销其virtual loss
+    """
+    if vl_path is not None:
+        revert_virtual_loss(vl_path)
+    # 置换表使树成为DAG：沿全部父节点回溯，每个祖先只更新一次，子节点先于父节点
+    # 每个祖先的价值由其维护的子节点统计量(childValueSum / childVisitSum)常数时间得到
+    for node in node.ancestors():
         node.numVisits += 1
-        if node.isFullyExpanded:
-            child_Vs = [child.V * child.numVisits for child in node.children.values()]
-            total_num_visits = sum([child.numVisits for child in node.children.values()])
-            if total_num_visits > 0:
-                node.V = sum(child_Vs) / total_num_visits
-                print(f"[回溯阶段]: \n当前节点轨迹:{node.trace}\n当前节点价值:{node.V}\n")
-        node = node.parent
+        if node.isFullyExpanded and node.childVisitSum > 0:
+            node.V = node.childValueSum / node.childVisitSum
+            backprop_logger.debug("[回溯阶段]: 当前节点深度:%d 当前节点价值:%s\n", node.depth, node.V)
+
+
+def log_round(node: treeNode, roll_node, mcts_task):
+    """
+        一轮结束后把被修改的节点(回溯经过的祖先与模拟节点)的统计量追加到搜索日志
+    """
+    journal = getattr(mcts_task, 'journal', None)
+    if journal is None:
+        return
+    nodes = node.ancestors()
+    if roll_node is not None:
+        nodes.append(roll_node)
+    journal.log_round(nodes)
 
 
 def executeRound(root: treeNode, mcts_task):
     
-    print('-' * 40, '\n选择节点阶段\n')
+    PROFILER.next_round()
+    logger.debug('%s\n选择节点阶段\n', '-' * 40)
     flag, node = selectNode(root, mcts_task)
     
     if flag:  # task finished
         return True, node, root
     
-    print('-' * 40, '\n扩充阶段\n')
+    logger.debug('%s\n扩充阶段\n', '-' * 40)
     if node.reflection == '<end>':
-        print('跳过扩充阶段。\n')
+        logger.debug('跳过扩充阶段。\n')
     else:
         node = expand(node, mcts_task)
     
-    print('-' * 40, '\n模拟搜索阶段\n')
+    logger.debug('%s\n模拟搜索阶段\n', '-' * 40)
+    roll_node = None
     if node.reflection == '<end>':
-        print('跳过模拟阶段。\n')
+        logger.debug('跳过模拟阶段。\n')
     else:
         roll_node = getBestChild(node, mcts_task)
-        best_V = greedyPolicy(roll_node, mcts_task) if mcts_task.roll_policy == 'greedy' else randomPolicy(roll_node, mcts_task)
+        best_V = rollout(roll_node, mcts_task)
         roll_node.V = roll_node.V * (1 - mcts_task.alpha) + best_V * mcts_task.alpha
         roll_node.numVisits += 1
     
-    print('-' * 40, '\n反向传播阶段\n')
+    logger.debug('%s\n反向传播阶段\n', '-' * 40)
     back_propagate(node)
+    log_round(node, roll_node, mcts_task)
     
     return False, node, root
+
+
+def rollout(node: treeNode, mcts_task):
+    return greedyPolicy(node, mcts_task) if mcts_task.roll_policy == 'greedy' else randomPolicy(node, mcts_task)
+
+
+def executeRound_parallel(root: treeNode, mcts_task, tree_lock):
+    """
+        并行搜索中单个worker执行的一轮：
+        :: 选择、virtual loss 与反向传播在 tree_lock 内完成(纯CPU，耗时很短)
+        :: 扩展与模拟需要等待LLM，在锁外进行，其他worker可同时搜索树的其他部分
+        :: return: (flag, node)，node为None表示选中的叶子正在被其他worker扩展
+    """
+    PROFILER.next_round()
+    path = []
+    with tree_lock:
+        flag, node = selectNode(root, mcts_task, path=path)
+        if flag:  # task finished
+            return True, node
+        if node.virtualLoss > 0:
+            return False, None
+        apply_virtual_loss(path)
     
+    roll_node, best_V = None, None
+    try:
+        if node.reflection == '<end>':
+            logger.debug('跳过扩充阶段。\n')
+        else:
+            node = expand(node, mcts_task)
+        
+        if node.reflection == '<end>':
+            logger.debug('跳过模拟阶段。\n')
+        else:
+            with tree_lock:
+                roll_node = getBestChild(node, mcts_task)
+            best_V = rollout(roll_node, mcts_task)
+    except Exception:
+        with tree_lock:
+            revert_virtual_loss(path)
+        raise
+    
+    with tree_lock:
+        if roll_node is not None:
+            roll_node.V = roll_node.V * (1 - mcts_task.alpha) + best_V * mcts_task.alpha
+            roll_node.numVisits += 1
+        back_propagate(node, vl_path=path)
+        log_round(node, roll_node, mcts_task)
+    
+    return False, node
 
-def MCTS_search(mcts_task):
+
+def init_root(mcts_task):
+    """
+        创建搜索树根节点；开启搜索日志时优先从日志重建已有的搜索树
+        :: return: (root, 已完成轮次, 已消耗时间(秒))
+    """
+    journal = getattr(mcts_task, 'journal', None)
+    if journal is not None:
+        root = journal.restore(mcts_task)
+        if root is not None:
+            return root, journal.rounds, journal.elapsed_before
+    
     root = treeNode(action='')
     root.update_state(state=mcts_task.init_state)   # update the initial state
+    if journal is not None:
+        journal.log_node(root)
+    return root, 0, 0.0
+
+
+def MCTS_search_parallel(mcts_task):
+    """
+        在同一棵树上运行 mcts_task.parallel_workers 个并发worker，
+        依靠virtual loss使同时进行的选择分散到不同叶子上
+    """
+    root, rounds_done, time_done = init_root(mcts_task)
+    
+    tree_lock = Lock()
+    mcts_task.tree_lock = tree_lock
+    # 每结束一轮(virtual loss已撤销)通知等待中的worker，替代轮询
+    round_done = Condition(tree_lock)
+    stop_event = Event()
+    result = {'node': None, 'finish': None}
+    rounds = {'started': rounds_done, 'finished': 0}
+    time_start = time.time() - time_done
+    timeLimit = time_start + mcts_task.time_limit / 1000 if mcts_task.limit_type == 'time' else None
+    
+    def take_round():
+        with tree_lock:
+            if timeLimit is not None:
+                return time.time() < timeLimit
+            if rounds['started'] >= mcts_task.iteration_limit:
+                return False
+            rounds['started'] += 1
+            return True
+    
+    def refund_round():
+        if timeLimit is None:
+            with tree_lock:
+                rounds['started'] -= 1
+    
+    def finish_round():
+        with round_done:
+            rounds['finished'] += 1
+            round_done.notify_all()
+    
+    def worker(worker_id):
+        try:
+            while not stop_event.is_set() and take_round():
+                logger.info('<worker-%d 开始新搜索轮次，目前总时间:%s>\n', worker_id, time.time() - time_start)
+                with tree_lock:
+                    finished = rounds['finished']
+                flag, node = executeRound_parallel(root, mcts_task, tree_lock)
+                if flag:
+                    with tree_lock:
+                        if not stop_event.is_set():
+                            result['node'] = node
+                            result['finish'] = time.time() - time_start if timeLimit is not None else rounds['started']
+                            stop_event.set()
+                    finish_round()
+                elif node is None:
+                    # 叶子正在被其他worker扩展，该轮不计入预算，等到有其他轮次结束再重新选择
+                    refund_round()
+                    with round_done:
+                        round_done.wait_for(lambda: rounds['finished'] != finished or stop_event.is_set())
+                else:
+                    finish_round()
+        except Exception:
+            stop_event.set()
+            finish_round()
+            raise
+    
+    try:
+        with ThreadPoolExecutor(max_workers=mcts_task.parallel_workers) as executor:
+            futures = [executor.submit(worker, i) for i in range(mcts_task.parallel_workers)]
+            for future in futures:
+                future.result()
+    finally:
+        mcts_task.tree_lock = None
+    
+    if result['finish'] is not None:
+        logger.info('已找到解决方案！\n')
+    return root, result['node'], result['finish']
+    
+
+def MCTS_search(mcts_task):
+    root, rounds_done, time_done = init_root(mcts_task)
 
     if mcts_task.limit_type == 'time':
-        timeLimit = time.time() + mcts_task.time_limit / 1000
-        time_start = time.time()
-        print(timeLimit)
+        time_start = time.time() - time_done
+        timeLimit = time_start + mcts_task.time_limit / 1000
+        logger.debug('时间上限: %s', timeLimit)
         while time.time() < timeLimit:
-            print(f'<开始新搜索轮次，目前总时间:{time.time() - time_start}>\n')
+            logger.info('<开始新搜索轮次，目前总时间:%s>\n', time.time() - time_start)
             flag, node, root = executeRound(root, mcts_task)
             if flag:
-                print('已找到解决方案！\n')
+                logger.info('已找到解决方案！\n')
                 return root, node, time.time() - time_start
     else:
-        for i in range(mcts_task.iteration_limit):
-            print(f'<开始新搜索轮次，目前已完成轮次数:{i}>\n')
+        for i in range(rounds_done, mcts_task.iteration_limit):
+            logger.info('<开始新搜索轮次，目前已完成轮次数:%d>\n', i)
             flag, node, root = executeRound(root, mcts_task)
             if flag:
-                print('已找到解决方案！\n')
+                logger.info('已找到解决方案！\n')
                 return root, node, i + 1
     return root, None, None
 
 
 def MCTS(mcts_task):
-    root, node, finish = MCTS_search(mcts_task)
+    if getattr(mcts_task, 'parallel_workers', 1) > 1:
+        root, node, finish = MCTS_search_parallel(mcts_task)
+    else:
+        root, node, finish = MCTS_search(mcts_task)
 
     if finish is not None:
-        print(f'已找到最终解!\nSolution:{node.trace}\n')
+        logger.info('已找到最终解!\nSolution:%s\n', node.trace)
         return root, node, finish
 
     else:
         best_node, best_V = root.getBestV()
-        print(f'在规定时间/轮次内未找到满足要求价值的解答，采用最高价值价值解答代替。\nSolution:{best_node.trace}\n')
+        logger.info('在规定时间/轮次内未找到满足要求价值的解答，采用最高价值价值解答代替。\nSolution:%s\n', best_node.trace)
         return root, best_node, -1
         
\ No newline at end of file
@@ -0,0 +1,197 @@
+import os
+import random
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from webMCTS.base import treeNode
+from webMCTS.transposition import normalize_action
+from utils.profiler import PROFILER, set_profiler
+from utils.logger import get_logger, configure_logging, logging_settings
+from utils.prune_mcts import LLM_CACHE, LLM_CACHE_LOCK
+
+"""
+    根并行(root-parallel) MCTS：同一任务在 root_workers 个进程中各自独立搜索一棵树，结束后合并统计量
+    :: 每个进程使用不同的随机种子(seed + worker_id)与策略模型轮转起点，得到更多样的轨迹
+    :: a11y摘要等CPU计算分散到多个进程，不再受GIL限制；进程内仍可使用 parallel_workers / async 引擎
+    :: 合并：按 root -> 节点 的规范化行动路径对齐各棵树的节点，访问次数相加，价值按访问次数加权平均
+    :: 子进程以扁平的节点列表返回搜索树，避免递归pickle整棵树；置换表共享的节点只导出一次，额外的父节点以link记录，
+    ::     合并时用 `add_shared_child` 重建，访问次数不会按父节点路径重复计算
+    :: 搜索日志按worker分别写入 {journal}.w{id}.jsonl
+"""
+
+logger = get_logger('search')
+
+
+def export_tree(root: treeNode):
+    """
+        把搜索树(置换表开启时为DAG)展开为记录列表，每个节点只记录一次：
+        :: {"type": "node", "id", "parent", "action", ...}   节点及其主父节点(node.parent)
+        :: {"type": "link", "id", "parent", "action"}        置换表引入的额外父节点(见 `add_shared_child`)
+        节点按深度排序(所有边都指向更深的节点)，父节点总在子节点之前；link记录在全部节点之后
+        :: return: (records, {id(node): 记录编号})
+    """
+    nodes, links, seen = [], [], set()
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        nodes.append(node)
+        for action, child in node.children.items():
+            if child.parent is not node:
+                links.append((node, action, child))
+            queue.append(child)
+    nodes.sort(key=lambda node: node.depth)         # 稳定排序，同深度保持BFS顺序
+
+    records, ids = [], {}
+    for node in nodes:
+        ids[id(node)] = len(records)
+        records.append({
+            'type': 'node',
+            'id': len(records),
+            'parent': ids[id(node.parent)] if node.parent is not None else None,
+            'action': node.action,
+            'state': node.state,
+            'step_trace': node.step_trace,
+            'trace_is_absolute': node.trace_is_absolute,
+            'V': node.V,
+            'numVisits': node.numVisits,
+            'V_desc': node.V_desc,
+            'isFullyExpanded': node.isFullyExpanded,
+            'isTerminal': node.isTerminal,
+            'reflection': node.reflection,
+        })
+    for parent, action, child in links:
+        records.append({'type': 'link', 'id': ids[id(child)], 'parent': ids[id(parent)], 'action': action})
+    return records, ids
+
+
+def run_root_worker(mcts_task, worker_id, settings, profile):
+    """
+        子进程中运行一棵独立的搜索树
+        :: return: (节点记录列表, 解答节点的记录编号, finish, profile span列表, 模糊匹配缓存)
+    """
+    configure_logging(**settings)
+    if profile is not None:
+        set_profiler(profile['path'])
+        PROFILER.time_origin = profile['time_origin']
+
+    mcts_task.root_workers = 1
+    mcts_task.seed += worker_id
+    mcts_task.current_model_index = worker_id
+    random.seed(mcts_task.seed)
+    if mcts_task.journal_path is not None:
+        base, ext = os.path.splitext(mcts_task.journal_path)
+        mcts_task.journal_path = f"{base}.w{worker_id}{ext}"
+    # 模糊匹配缓存由父进程合并后统一写回，避免多个进程互相覆盖fuzzy_match.json
+    mcts_task.save_llm_cache = lambda: None
+
+    root, node, finish = mcts_task.run()
+    records, ids = export_tree(root)
+    events = PROFILER.events if PROFILER.enabled else []
+    return records, ids.get(id(node)), finish, events, dict(LLM_CACHE)
+
+
+class _Stats(object):
+    def __init__(self) -> None:
+        self.value_sum = 0.0
+        self.visits = 0
+        self.max_V = None
+
+
+def merge_trees(results):
+    """
+        按规范化行动路径合并多棵树的节点记录
+        :: results: list[list[dict]], 每个worker的记录(`export_tree` 的格式)
+        :: return: (合并后的根节点, {(worker, 记录编号): 合并后的节点})
+        每个worker中的节点只计一次访问统计；置换表共享的节点用 `add_shared_child` 挂到额外的父节点下，
+        该行动路径已被其他worker的不同节点占用时不再挂接(统计量已计入该节点本身，不会重复)
+    """
+    merged_root = treeNode(action='')
+    mapping, slots, stats = {}, {}, {}
+    for worker, records in enumerate(results):
+        for record in records:
+            if record['type'] == 'link':
+                parent, child = mapping[(worker, record['parent'])], mapping[(worker, record['id'])]
+                key = (id(parent), normalize_action(record['action']))
+                if key not in slots and child.depth > parent.depth:
+                    parent.add_shared_child(record['action'], child)
+                    slots[key] = child
+                continue
+            if record['parent'] is None:
+                node = merged_root
+                if node.state is None:
+                    node.update_state(record['state'])
+            else:
+                parent = mapping[(worker, record['parent'])]
+                key = (id(parent), normalize_action(record['action']))
+                node = slots.get(key)
+                if node is None:
+                    node = treeNode(record['action'], parent, parent.depth + 1)
+                    node.step_trace = record['step_trace']
+                    node.trace_is_absolute = record['trace_is_absolute']
+                    node.update_state(record['state'])
+                    node.V_desc = record['V_desc']
+                    node.reflection = record['reflection']
+                    parent.children[record['action']] = node
+                    slots[key] = node
+            mapping[(worker, record['id'])] = node
+
+            node.isFullyExpanded = node.isFullyExpanded or record['isFullyExpanded']
+            node.isTerminal = node.isTerminal or record['isTerminal']
+            if record['reflection'] == '<end>':
+                node.reflection = '<end>'
+            stat = stats.setdefault(id(node), (node, _Stats()))[1]
+            stat.value_sum += record['V'] * record['numVisits']
+            stat.visits += record['numVisits']
+            stat.max_V = record['V'] if stat.max_V is None else max(stat.max_V, record['V'])
+
+    for node, stat in stats.values():
+        node.numVisits = stat.visits
+        node.V = stat.value_sum / stat.visits if stat.visits else stat.max_V
+    return merged_root, mapping
+
+
+def MCTS_root_parallel(mcts_task):
+    """
+        在 mcts_task.root_workers 个进程中并行搜索并合并结果
+        :: return: (合并后的根节点, 解答节点, finish)，与 `MCTS` 的返回值一致
+    """
+    workers = mcts_task.root_workers
+    settings = logging_settings()
+    profile = {'path': PROFILER.path, 'time_origin': PROFILER.time_origin} if PROFILER.enabled else None
+    context = multiprocessing.get_context(getattr(mcts_task, 'root_start_method', None))
+
+    outputs = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(run_root_worker, mcts_task, i, settings, profile) for i in range(workers)]
+        for worker_id, future in enumerate(futures):
+            try:
+                outputs.append(future.result())
+            except Exception as e:
+                logger.warning("[root-parallel] worker-%d 搜索失败: %s", worker_id, e)
+    if not outputs:
+        raise RuntimeError("All root-parallel workers failed")
+
+    for _, _, _, events, llm_cache in outputs:
+        if events:
+            with PROFILER.lock:
+                PROFILER.events.extend(events)
+        with LLM_CACHE_LOCK:
+            LLM_CACHE.update(llm_cache)
+
+    root, mapping = merge_trees([records for records, _, _, _, _ in outputs])
+    logger.info("[root-parallel] 合并了%d棵搜索树，共%d次访问", len(outputs), root.numVisits)
+
+    solved = [(finish, worker) for worker, (_, node_id, finish, _, _) in enumerate(outputs) if finish != -1 and node_id is not None]
+    if solved:
+        finish, worker = min(solved)
+        node = mapping[(worker, outputs[worker][1])]
+        logger.info('已找到最终解!\nSolution:%s\n', node.trace)
+        return root, node, finish
+
+    best_node, best_V = root.getBestV()
+    logger.info('在规定时间/轮次内未找到满足要求价值的解答，采用最高价值价值解答代替。\nSolution:%s\n', best_node.trace)
+    return root, best_node, -1
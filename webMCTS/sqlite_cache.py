@@ -0,0 +1,150 @@
+import os
+import time
+import sqlite3
+from threading import Lock
+from itertools import groupby
+from collections import OrderedDict
+
+"""
+    奖励模型缓存与世界模型转移缓存共用的基类：内存LRU + 磁盘sqlite存储
+    :: 内存LRU按字节数淘汰(页面状态与打分理由的长度差别很大，按条目数无法约束内存)
+    :: 磁盘写入(含读取时更新 last_used)先进入内存队列，每 commit_every 条或 commit_interval 秒
+    ::     按原顺序批量执行并commit一次；异步搜索中事件循环不再为每次读写等待一次磁盘同步
+    :: 同一进程内相同路径的缓存共享一个实例(`shared`)，搜索结束时调用 `flush`
+    子类提供 SCHEMA(建表语句)与 `entry_bytes`(一个条目占用的内存)
+"""
+
+ENTRY_OVERHEAD = 160        # int, 字典槽位/元组/列表等的固定开销(字节)
+
+
+class SqliteCache(object):
+    SCHEMA = None           # str, CREATE TABLE 语句
+
+    def __init__(self, path=None, max_bytes=64 << 20, commit_every=64, commit_interval=5.0) -> None:
+        """
+            :: path: str | None, sqlite文件路径，None时只使用内存LRU
+            :: max_bytes: int, 内存LRU占用的最大字节数
+            :: commit_every: int, 积累多少条写入后批量写入磁盘
+            :: commit_interval: float, 写入在内存队列中最多停留的秒数
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.memory = OrderedDict()         # OrderedDict{str: object}, [key: 子类的条目]
+        self.sizes: dict = {}               # dict{str: int}, [key: 放入LRU时条目的字节数]
+        self.bytes = 0                      # int, 内存LRU当前占用的字节数
+        self.pending = []                   # list[(str, tuple)], 尚未写入磁盘的 (sql, 参数)
+        self.last_commit = time.monotonic()
+        self.lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = None
+        if path is not None:
+            self.open()
+
+    def entry_bytes(self, key, entry) -> int:
+        raise NotImplementedError
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(self.SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self._flush()
+                self.conn.close()
+                self.conn = None
+
+    def _queue(self, sql, params):
+        """在持有锁时调用"""
+        if self.conn is None:
+            return
+        self.pending.append((sql, params))
+        if len(self.pending) >= self.commit_every or time.monotonic() - self.last_commit >= self.commit_interval:
+            self._flush()
+
+    def _flush(self):
+        if self.pending and self.conn is not None:
+            for sql, group in groupby(self.pending, key=lambda item: item[0]):
+                self.conn.executemany(sql, [params for _, params in group])
+            self.conn.commit()
+        self.pending = []
+        self.last_commit = time.monotonic()
+
+    def flush(self):
+        """把内存队列中的写入提交到磁盘"""
+        with self.lock:
+            self._flush()
+
+    def _evicted(self, key):
+        """条目被LRU淘汰时调用，子类可清理与key相关的状态"""
+
+    def _remember(self, key, entry):
+        self.bytes -= self.sizes.pop(key, 0)
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        self.sizes[key] = self.entry_bytes(key, entry)
+        self.bytes += self.sizes[key]
+        while self.bytes > self.max_bytes and len(self.memory) > 1:
+            evicted, _ = self.memory.popitem(last=False)
+            self.bytes -= self.sizes.pop(evicted)
+            self._evicted(evicted)
+            self.evictions += 1
+
+    def config(self):
+        """构造参数，子类有额外参数时扩展"""
+        return {
+            'path': self.path, 'max_bytes': self.max_bytes,
+            'commit_every': self.commit_every, 'commit_interval': self.commit_interval,
+        }
+
+    def __getstate__(self):
+        # 根并行搜索把任务发送到子进程：只携带路径与配置，内存LRU(最多max_bytes)不复制到每个子进程，
+        # 子进程重新打开sqlite并从磁盘读取；父进程尚未提交的写入先提交，子进程可以读到
+        self.flush()
+        return self.config()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'entries': len(self.memory),
+                'bytes': self.bytes,
+                'evictions': self.evictions,
+            }
+
+    def grow(self, max_bytes, **options):
+        """共享实例被另一个任务再次打开时取较大的配置"""
+        self.max_bytes = max(self.max_bytes, max_bytes)
+
+    @classmethod
+    def shared(cls, path, max_bytes=64 << 20, **options):
+        """
+            同一进程内相同路径的任务共享一个缓存实例(批量运行时内存LRU也可跨任务复用)
+        """
+        if path is None:
+            return cls(None, max_bytes, **options)
+        with _caches_lock:
+            cache = _caches.get((cls, path))
+            if cache is None:
+                cache = _caches[(cls, path)] = cls(path, max_bytes, **options)
+            cache.grow(max_bytes, **options)
+            return cache
+
+
+_caches: dict = {}                  # dict{(type, str): SqliteCache}, [(缓存类型, path): cache]
+_caches_lock = Lock()
@@ -1,22 +1,29 @@
 import re
 import os
+import asyncio
 import random as rd
 
 from webMCTS.mcts import MCTS
+from webMCTS.async_mcts import MCTS_async
+from webMCTS.transposition import TranspositionTable
+from webMCTS.journal import SearchJournal
+from webMCTS.value_cache import ValueCache, open_value_cache, value_key
+from webMCTS.world_cache import WorldCache, open_world_cache, world_key
+from webMCTS.root_parallel import MCTS_root_parallel
+from utils.profiler import PROFILER, text_size
 from models.get_response import *
 from utils.search_utils import *
 from utils.query_llm import *
 from utils.prune_mcts import *
+from utils.logger import get_logger
+from utils.state_store import tree_memory
 
+policy_logger = get_logger('llm.policy')
+world_logger = get_logger('llm.world')
+reward_logger = get_logger('llm.reward')
+cache_logger = get_logger('cache')
+search_logger = get_logger('search')
 
-if os.path.exists("./fuzzy_match.json"):
-    # Load the existing dictionary from the JSON file
-    print("Loading LLM_CACHE from fuzzy_match file...")
-    with open("./fuzzy_match.json", "r") as f:
-        loaded = json.load(f)
-    LLM_CACHE = {tuple(k.split("|||")): v for k, v in loaded.items()}
-else:
-    LLM_CACHE: Dict[Tuple[str, str], bool] = {}   # {(action1, action2): bool}
 
 class SearchTask(object):
     def __init__(self, data, policy_method, reward_method, world_method) -> None:
@@ -25,17 +32,20 @@ class SearchTask(object):
             :: policy_method: str, default: ['gpt', 'deepseek', 'qwen2.5']
             :: reward_method: str, default: ['gpt', 'deepseek', 'qwen2.5']
             :: world_method: str, default: ['gpt', 'deepseek', 'qwen2.5']
-            :: value_cache: dict{str: float}, ['action': value]
+            :: value_cache: ValueCache, 奖励模型缓存 [hash(intent, trace, state): (value, reason)]
+            :: world_cache: WorldCache, 世界模型转移缓存 [(state, action): [next_state, ...]]
         """
         super().__init__()
         self.question = data
         self.policy_method = policy_method
         self.reward_method = reward_method
         self.world_method = world_method
-        self.value_cache = {}
+        self.value_cache = ValueCache()
+        self.world_cache = WorldCache()
     
     def clear_cache(self):
-        self.value_cache = {}
+        # 奖励模型缓存按内容寻址，跨轮次/跨运行都有效，不随搜索清空
+        pass
     
     @staticmethod
     def get_next_action_prompt_wrap(intent: str, trace: str, state: str, mode: str = "chat") -> str:
@@ -176,6 +186,20 @@ class MCTS_Task(SearchTask):
         truncation = True, 
         do_sample = True, 
         max_new_tokens = 4096, 
+        engine='thread',                            # str, search engine ('thread', 'async')
+        parallel_workers=1,                         # int, number of concurrent workers on the shared tree
+        virtual_loss=1.0,                           # float, UCB penalty per in-flight worker on a node
+        batch_proposals=False,                      # bool, sample all policy candidates in one request (n=k)
+        use_transposition=False,                    # bool, share world/reward results across identical (state, action)
+        journal_path=None,                          # str, append-only JSONL search journal (None: disabled)
+        resume=False,                               # bool, rebuild the tree from journal_path and continue the search
+        value_cache_path=None,                      # str, on-disk reward cache shared across runs (None: memory only, fresh per task)
+        value_cache_bytes=64 << 20,                 # int, max bytes of the in-memory reward LRU
+        world_cache_path=None,                      # str, on-disk world-model transition cache shared across tasks (None: memory only, fresh per task)
+        world_cache_bytes=64 << 20,                 # int, max bytes of the in-memory transition LRU
+        world_cache_samples=1,                      # int, sampled next states kept per (state, action) before reusing them (1: transitions are deterministic)
+        root_workers=1,                             # int, independent trees searched in separate processes and merged (root-parallel)
+        root_start_method=None,                     # str, multiprocessing start method for root_workers (None: platform default)
         
         ) -> None:
         super().__init__(data, policy_method, reward_method, world_method)
@@ -210,10 +234,23 @@ class MCTS_Task(SearchTask):
         self.alpha = alpha
         self.exploration_constant = exploration_constant
         self.current_model_index = 0        # 用于polciy 模型的轮转索引
+        self.engine = engine
+        self.parallel_workers = parallel_workers
+        self.virtual_loss = virtual_loss
+        self.batch_proposals = batch_proposals
+        self.transposition_table = TranspositionTable() if use_transposition else None
+        self.journal_path = journal_path
+        self.resume = resume
+        self.journal = None
+        self.value_cache = open_value_cache(value_cache_path, value_cache_bytes)
+        self.world_cache = open_world_cache(world_cache_path, world_cache_bytes, world_cache_samples)
+        self.root_workers = root_workers
+        self.root_start_method = root_start_method
         
     def clear_cache(self):
-        self.value_cache = {}
         self.node_count = 1
+        if self.transposition_table is not None:
+            self.transposition_table.clear()
     
     def set_limit_type(self):
         if self.time_limit is not None:
@@ -229,6 +266,13 @@ class MCTS_Task(SearchTask):
                 raise ValueError("Iteration limit must be greater than one")
             self.limit_type = 'iterations'
     
+    def next_policy_method(self):
+        # 策略模型轮转
+        policy_model_list = ['gpt-4o', 'gpt-4.1-mini', 'gpt-4.1']
+        policy_method = policy_model_list[self.current_model_index % len(policy_model_list)]
+        self.current_model_index = (self.current_model_index + 1) % len(policy_model_list)
+        return policy_method
+    
     def get_next_action(self, trace, state, step):
         """
             output:
@@ -238,24 +282,62 @@ class MCTS_Task(SearchTask):
                 :: node.state: current state of web page
         """
         prompt = self.get_next_action_prompt_wrap(self.question, trace, state, mode=self.mode)
-        
-        # 策略模型轮转
-        policy_model_list = ['gpt-4o', 'gpt-4.1-mini', 'gpt-4.1']
-        policy_method = policy_model_list[self.current_model_index]
-        self.current_model_index = (self.current_model_index + 1) % len(policy_model_list)
+        policy_method = self.next_policy_method()
 
-        response = get_proposal(
-            prompt, policy_method, 
-            temperature=self.policy_temperature, 
-            max_tokens=self.max_tokens, 
-            seed=self.seed, max_length=self.max_length, 
-            truncation=self.truncation, do_sample=self.do_sample, 
-            max_new_tokens=self.max_new_tokens
-        )            
-        response, action = washing_action_4_policy_model(response, state)        
-        print(f"第<{step}>轮 {policy_method} 采取的行动是: {response}\n")
+        with PROFILER.span('policy', 'llm', model=policy_method, step=str(step)) as span:
+            response = get_proposal(
+                prompt, policy_method, 
+                temperature=self.policy_temperature, 
+                max_tokens=self.max_tokens, 
+                seed=self.seed, max_length=self.max_length, 
+                truncation=self.truncation, do_sample=self.do_sample, 
+                max_new_tokens=self.max_new_tokens
+            )
+            span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(response)            
+        with PROFILER.span('wash_action', 'cpu', state_chars=text_size(state)):
+            response, action = washing_action_4_policy_model(response, state)
+        policy_logger.info("第<%s>轮 %s 采取的行动是: %s\n", step, policy_method, response)
         return response, action
     
+    def wash_proposals(self, responses, state, step, policy_method):
+        """
+            清洗一批策略模型回复，按execute action精确去重，返回[(raw_action, execute_action)]
+        """
+        proposals, execute_action_list = [], []
+        for response in responses:
+            with PROFILER.span('wash_action', 'cpu', state_chars=text_size(state)):
+                response, action = washing_action_4_policy_model(response, state)
+            policy_logger.info("第<%s>轮 %s 采取的行动是: %s\n", step, policy_method, response)
+            if response and action not in execute_action_list:
+                proposals.append((response, action))
+                execute_action_list.append(action)
+        return proposals
+    
+    def get_next_actions(self, trace, state, step, n):
+        """
+            output:
+                >>> [(child.action, execute_action), ...] = Policy_model(node.trace, node.state, n)
+            单次请求采样n个候选，替代n次独立的 `get_next_action` 请求
+        """
+        prompt = self.get_next_action_prompt_wrap(self.question, trace, state, mode=self.mode)
+        proposals = []
+        cnt = 3
+        while not proposals and cnt:
+            policy_method = self.next_policy_method()
+            with PROFILER.span('policy', 'llm', model=policy_method, step=str(step), n=n) as span:
+                responses = get_proposals(
+                    prompt, policy_method, n=n, 
+                    temperature=self.policy_temperature, 
+                    max_tokens=self.max_tokens, 
+                    seed=self.seed, max_length=self.max_length, 
+                    truncation=self.truncation, do_sample=self.do_sample, 
+                    max_new_tokens=self.max_new_tokens
+                )
+                span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(responses)
+            proposals = self.wash_proposals(responses, state, step, policy_method)
+            cnt -= 1
+        return proposals
+    
     def get_next_state_predict(self, state, action):
         """
             output:
@@ -268,17 +350,26 @@ class MCTS_Task(SearchTask):
         if 'stop' in action:
             return state
         
+        key = world_key(self.world_method, state, action)
+        cached = self.world_cache.get(key)
+        if cached is not None:
+            world_logger.debug("下一帧网页预测为(缓存): %s\n", cached)
+            return cached
+        
         prompt = self.get_next_state_predict_prompt_wrap(state, action, mode=self.mode)
-        response = get_state(
-            prompt, self.world_method, 
-            temperature=self.world_temperature, 
-            max_tokens=self.max_tokens, 
-            seed=self.seed, max_length=self.max_length, 
-            truncation=self.truncation, do_sample=self.do_sample, 
-            max_new_tokens=self.max_new_tokens
-        )
+        with PROFILER.span('world', 'llm', model=self.world_method) as span:
+            response = get_state(
+                prompt, self.world_method, 
+                temperature=self.world_temperature, 
+                max_tokens=self.max_tokens, 
+                seed=self.seed, max_length=self.max_length, 
+                truncation=self.truncation, do_sample=self.do_sample, 
+                max_new_tokens=self.max_new_tokens
+            )
+            span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(response)
         response = washing_response_4_world_model(response)
-        print(f"下一帧网页预测为: {response}\n")
+        world_logger.debug("下一帧网页预测为: %s\n", response)
+        self.world_cache.put(key, response)
         return response
     
     def get_step_value(self, trace, state):
@@ -289,18 +380,130 @@ class MCTS_Task(SearchTask):
                 :: child.trace: action history till child
                 :: child.state: next state of web page
         """
+        key = value_key(self.reward_method, self.question, trace, state)
+        cached = self.value_cache.get(key)
+        if cached is not None:
+            value, reason = cached
+            reward_logger.info("当前行动的得分为(缓存): %s\n", value)
+            return value, reason
+        
         prompt = self.get_step_value_prompt_wrap(self.question, trace, state, mode=self.mode)
-        response = get_value(
-            prompt, reward_model=self.reward_method, 
-            temperature=self.reward_temperature, 
-            max_tokens=self.max_tokens, 
-            seed=self.seed, max_length=self.max_length, 
-            truncation=self.truncation, do_sample=self.do_sample, 
-            max_new_tokens=self.max_new_tokens
-        )
+        with PROFILER.span('reward', 'llm', model=self.reward_method) as span:
+            response = get_value(
+                prompt, reward_model=self.reward_method, 
+                temperature=self.reward_temperature, 
+                max_tokens=self.max_tokens, 
+                seed=self.seed, max_length=self.max_length, 
+                truncation=self.truncation, do_sample=self.do_sample, 
+                max_new_tokens=self.max_new_tokens
+            )
+            span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(response)
         reason, value = washing_value_4_reward_model(response, low=self.low, high=5)
-        print(f"当前行动的得分: {reason}")
-        print(f"当前行动的得分为: {value}\n")
+        reward_logger.debug("当前行动的得分: %s", reason)
+        reward_logger.info("当前行动的得分为: %s\n", value)
+        self.value_cache.put(key, value, reason)
+        return value, reason
+    
+    async def get_next_action_async(self, trace, state, step):
+        """
+            `get_next_action` 的协程版本，在事件循环中等待策略模型的响应
+        """
+        prompt = self.get_next_action_prompt_wrap(self.question, trace, state, mode=self.mode)
+        policy_method = self.next_policy_method()
+
+        with PROFILER.span('policy', 'llm', model=policy_method, step=str(step)) as span:
+            response = await get_proposal_async(
+                prompt, policy_method, 
+                temperature=self.policy_temperature, 
+                max_tokens=self.max_tokens, 
+                seed=self.seed, max_length=self.max_length, 
+                truncation=self.truncation, do_sample=self.do_sample, 
+                max_new_tokens=self.max_new_tokens
+            )
+            span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(response)
+        with PROFILER.span('wash_action', 'cpu', state_chars=text_size(state)):
+            response, action = washing_action_4_policy_model(response, state)
+        policy_logger.info("第<%s>轮 %s 采取的行动是: %s\n", step, policy_method, response)
+        return response, action
+    
+    async def get_next_actions_async(self, trace, state, step, n):
+        """
+            `get_next_actions` 的协程版本
+        """
+        prompt = self.get_next_action_prompt_wrap(self.question, trace, state, mode=self.mode)
+        proposals = []
+        cnt = 3
+        while not proposals and cnt:
+            policy_method = self.next_policy_method()
+            with PROFILER.span('policy', 'llm', model=policy_method, step=str(step), n=n) as span:
+                responses = await get_proposals_async(
+                    prompt, policy_method, n=n, 
+                    temperature=self.policy_temperature, 
+                    max_tokens=self.max_tokens, 
+                    seed=self.seed, max_length=self.max_length, 
+                    truncation=self.truncation, do_sample=self.do_sample, 
+                    max_new_tokens=self.max_new_tokens
+                )
+                span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(responses)
+            proposals = self.wash_proposals(responses, state, step, policy_method)
+            cnt -= 1
+        return proposals
+    
+    async def get_next_state_predict_async(self, state, action):
+        """
+            `get_next_state_predict` 的协程版本
+        """
+        if 'stop' in action:
+            return state
+        
+        key = world_key(self.world_method, state, action)
+        cached = self.world_cache.get(key)
+        if cached is not None:
+            world_logger.debug("下一帧网页预测为(缓存): %s\n", cached)
+            return cached
+        
+        prompt = self.get_next_state_predict_prompt_wrap(state, action, mode=self.mode)
+        with PROFILER.span('world', 'llm', model=self.world_method) as span:
+            response = await get_state_async(
+                prompt, self.world_method, 
+                temperature=self.world_temperature, 
+                max_tokens=self.max_tokens, 
+                seed=self.seed, max_length=self.max_length, 
+                truncation=self.truncation, do_sample=self.do_sample, 
+                max_new_tokens=self.max_new_tokens
+            )
+            span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(response)
+        response = washing_response_4_world_model(response)
+        world_logger.debug("下一帧网页预测为: %s\n", response)
+        self.world_cache.put(key, response)
+        return response
+    
+    async def get_step_value_async(self, trace, state):
+        """
+            `get_step_value` 的协程版本
+        """
+        key = value_key(self.reward_method, self.question, trace, state)
+        cached = self.value_cache.get(key)
+        if cached is not None:
+            value, reason = cached
+            reward_logger.info("当前行动的得分为(缓存): %s\n", value)
+            return value, reason
+        
+        prompt = self.get_step_value_prompt_wrap(self.question, trace, state, mode=self.mode)
+        with PROFILER.span('reward', 'llm', model=self.reward_method) as span:
+            response = await get_value_async(
+                prompt, reward_model=self.reward_method, 
+                temperature=self.reward_temperature, 
+                max_tokens=self.max_tokens, 
+                seed=self.seed, max_length=self.max_length, 
+                truncation=self.truncation, do_sample=self.do_sample, 
+                max_new_tokens=self.max_new_tokens
+            )
+            span['prompt_chars'], span['response_chars'] = text_size(prompt), text_size(response)
+        reason, value = washing_value_4_reward_model(response, low=self.low, high=5)
+        reward_logger.debug("当前行动的得分: %s", reason)
+        reward_logger.info("当前行动的得分为: %s\n", value)
+        self.value_cache.put(key, value, reason)
         return value, reason
     
     def get_reflection(self, trace):
@@ -326,14 +529,69 @@ class MCTS_Task(SearchTask):
                     return True
             return False
     
+    def save_llm_cache(self):
+        # LLM_CACHE 由 `is_same_action` 在 utils.prune_mcts 中维护，同一进程内的所有任务共享
+        cache_logger.info('>>> 将LLM_CACHE保存到fuzzy_match.json')
+        save_llm_cache("./fuzzy_match.json")
+    
+    def open_journal(self):
+        if self.journal_path is not None:
+            self.journal = SearchJournal(self.journal_path, self.question, resume=self.resume)
+    
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+    
+    def run_root_parallel(self):
+        """
+            root_workers 个进程各自搜索一棵树(进程内按 engine / parallel_workers 搜索)，返回合并后的树
+        """
+        try:
+            root, node, finish = MCTS_root_parallel(self)
+        finally:
+            self.save_llm_cache()
+        search_logger.info(">>> 搜索树内存: %s", tree_memory(root))
+        return root, node, finish
+    
     def run(self):
+        if self.root_workers > 1:
+            return self.run_root_parallel()
+        if self.engine == 'async':
+            return asyncio.run(self.run_async())
+        
         self.clear_cache()
         self.set_limit_type()
-        root, node, finish = MCTS(self)     # input mcts_task
-        
-        print('>>> 将LLM_CACHE保存到fuzzy_match.json')
-        json_ready = {f"{k[0]}|||{k[1]}": v for k, v in LLM_CACHE.items()}
-        with open("./fuzzy_match.json", "w") as f:
-            json.dump(json_ready, f, indent=4)
-        
+        self.open_journal()
+        try:
+            root, node, finish = MCTS(self)     # input mcts_task
+        finally:
+            self.finish_run()
+        search_logger.info(">>> 搜索树内存: %s", tree_memory(root))
+        return root, node, finish
+    
+    def finish_run(self):
+        """搜索结束(含异常退出)后关闭日志、保存LLM缓存并提交奖励/世界模型缓存的写入"""
+        self.close_journal()
+        self.save_llm_cache()
+        self.value_cache.flush()
+        self.world_cache.flush()
+        cache_logger.info(">>> 奖励模型缓存: %s", self.value_cache.stats())
+        cache_logger.info(">>> 世界模型缓存: %s", self.world_cache.stats())
+    
+    async def run_async(self):
+        """
+            在当前事件循环中运行搜索，三个LLM角色均以协程方式调用
+        """
+        if self.root_workers > 1:
+            return await asyncio.to_thread(self.run_root_parallel)
+        self.clear_cache()
+        self.set_limit_type()
+        self.open_journal()
+        try:
+            root, node, finish = await MCTS_async(self)
+        finally:
+            # 保存fuzzy_match.json、提交缓存与关闭日志都是同步磁盘I/O，在线程中执行，不阻塞共享事件循环的其他任务
+            await asyncio.to_thread(self.finish_run)
+        search_logger.info(">>> 搜索树内存: %s", await asyncio.to_thread(tree_memory, root))
         return root, node, finish
\ No newline at end of file
@@ -0,0 +1,92 @@
+import re
+import hashlib
+from threading import Lock
+
+from utils.text_utils import parse_action_thinking
+
+"""
+    置换表(transposition table)：
+    :: 不同的行动序列经常到达同一个页面，同一 (state, action) 的世界模型/奖励模型结果可以直接复用
+    :: key = hash(规范化的a11y状态) + 规范化的可执行动作
+    :: value = {'state', 'value', 'reason', 'node'}，node为第一次得到该结果的treeNode，
+    ::         命中时新的父节点直接引用该节点(树变为DAG)，从而共享访问统计
+"""
+
+_SPACES = re.compile(r"[ \t]+")
+
+
+def canonical_state(state: str) -> str:
+    """
+        规范化a11y状态文本：统一缩进(4空格→TAB)，去掉行尾空白与空行，折叠行内连续空白
+    """
+    if not state:
+        return ''
+    lines = []
+    for raw in state.splitlines():
+        line = raw.replace("    ", "\t").rstrip()
+        if not line.strip():
+            continue
+        content = line.lstrip("\t")
+        lines.append("\t" * (len(line) - len(content)) + _SPACES.sub(" ", content))
+    return "\n".join(lines)
+
+
+def normalize_action(action: str) -> str:
+    """
+        从raw action(含thinking)中提取可执行动作，并折叠空白；无法解析时使用原文本
+    """
+    _, step_action = parse_action_thinking(action)
+    if not step_action:
+        step_action = action
+    return _SPACES.sub(" ", step_action.strip())
+
+
+def state_hash(state: str) -> str:
+    return hashlib.sha1(canonical_state(state).encode('utf-8')).hexdigest()
+
+
+def transition_key(state: str, action: str) -> str:
+    return f"{state_hash(state)}|{normalize_action(action)}"
+
+
+class TranspositionTable(object):
+    def __init__(self) -> None:
+        self.table: dict = {}               # dict{str: dict}, [transition_key: entry]
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, state, action):
+        key = transition_key(state, action)
+        with self.lock:
+            entry = self.table.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def register(self, state, action, node, next_state, value, reason):
+        key = transition_key(state, action)
+        with self.lock:
+            if key not in self.table:
+                self.table[key] = {'state': next_state, 'value': value, 'reason': reason, 'node': node}
+
+    def clear(self):
+        with self.lock:
+            self.table = {}
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    # 根并行搜索在进程之间传递任务与搜索树，锁不能被pickle，接收方重新创建
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
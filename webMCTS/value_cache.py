@@ -0,0 +1,64 @@
+import sys
+import json
+import time
+import hashlib
+
+from webMCTS.transposition import canonical_state
+from webMCTS.sqlite_cache import SqliteCache, ENTRY_OVERHEAD
+from utils.logger import get_logger
+
+"""
+    奖励模型缓存：同一 (intent, trace, state) 在不同轮次、模拟阶段与重复运行中会被反复打分
+    :: key = sha1(奖励模型, 指令, 行动轨迹, 规范化的a11y状态)
+    :: 内存LRU未命中时查询磁盘上的sqlite存储，两者都未命中才请求奖励模型(LRU与批量写入见 `SqliteCache`)
+    :: 磁盘存储在多次 `run.py` 运行(以及多进程)之间共享；请求失败/回复无法解析的结果不写入缓存
+"""
+
+logger = get_logger('cache')
+
+
+def value_key(reward_method, intent, trace, state) -> str:
+    payload = json.dumps([reward_method, intent, trace, canonical_state(state)], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ValueCache(SqliteCache):
+    SCHEMA = "CREATE TABLE IF NOT EXISTS step_value (key TEXT PRIMARY KEY, value REAL, reason TEXT, created REAL)"
+
+    def entry_bytes(self, key, entry) -> int:
+        # entry: (float, str), [(value, reason)]
+        return sys.getsizeof(key) + sys.getsizeof(entry[1]) + ENTRY_OVERHEAD
+
+    def get(self, key):
+        """
+            return: (value, reason) | None
+        """
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry
+            if self.conn is not None:
+                row = self.conn.execute("SELECT value, reason FROM step_value WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, value, reason):
+        if not reason:
+            return
+        with self.lock:
+            self._remember(key, (value, reason))
+            self._queue(
+                "INSERT OR REPLACE INTO step_value (key, value, reason, created) VALUES (?, ?, ?, ?)",
+                (key, value, reason, time.time())
+            )
+
+
+def open_value_cache(path, max_bytes=64 << 20):
+    return ValueCache.shared(path, max_bytes)
@@ -0,0 +1,134 @@
+import sys
+import time
+
+from webMCTS.transposition import transition_key
+from webMCTS.sqlite_cache import SqliteCache, ENTRY_OVERHEAD
+from utils.logger import get_logger
+
+"""
+    世界模型转移缓存：812个任务反复访问相同的商城/后台页面，同一 (页面, 行动) 的下一帧预测可以跨任务复用
+    :: key = 世界模型 + 规范化a11y状态的hash + 规范化的可执行动作 (与置换表相同的规范化)
+    :: 每个key最多保存 samples_per_key 个采样结果；不足时仍请求世界模型并追加新的采样，
+    ::     存满后按轮转顺序返回，保留一定的预测多样性；samples_per_key=1 时同一 (页面, 行动) 总是得到第一次的预测，
+    ::     转移变为确定性的(不再按世界模型的temperature采样)
+    :: 磁盘sqlite存储在任务/进程/多次运行之间共享，超过 max_disk_keys 时淘汰最久未使用的key；
+    ::     每次命中(内存或磁盘)时的 last_used 更新与新的采样一起批量写入(LRU与批量写入见 `SqliteCache`)；
+    ::     未命中不缓存，之后每次都重新查询磁盘
+    与置换表的区别：置换表只在单次搜索内复用节点(含子树统计)，转移缓存只复用世界模型的预测结果
+"""
+
+logger = get_logger('cache')
+
+
+def world_key(world_method, state, action) -> str:
+    return f"{world_method}|{transition_key(state, action)}"
+
+
+class WorldCache(SqliteCache):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS transition "
+        "(key TEXT, sample INTEGER, next_state TEXT, last_used REAL, PRIMARY KEY (key, sample))"
+    )
+
+    def __init__(self, path=None, max_bytes=64 << 20, samples_per_key=1, max_disk_keys=200000, **options) -> None:
+        """
+            :: samples_per_key: int, 每个key保存的采样结果数
+            :: max_disk_keys: int, 磁盘存储的最大key数
+        """
+        self.samples_per_key = samples_per_key
+        self.max_disk_keys = max_disk_keys
+        self.cursor: dict = {}              # dict{str: int}, [key: 下一个返回的采样位置]
+        self.puts = 0
+        super().__init__(path, max_bytes, **options)
+
+    def entry_bytes(self, key, entry) -> int:
+        # entry: list[str], [采样得到的下一帧状态]
+        return sys.getsizeof(key) + sum(sys.getsizeof(sample) for sample in entry) + ENTRY_OVERHEAD
+
+    def config(self):
+        return {**super().config(), 'samples_per_key': self.samples_per_key, 'max_disk_keys': self.max_disk_keys}
+
+    def _evicted(self, key):
+        self.cursor.pop(key, None)
+
+    def grow(self, max_bytes, samples_per_key=1, **options):
+        super().grow(max_bytes)
+        self.samples_per_key = max(self.samples_per_key, samples_per_key)
+
+    def _touch(self, key):
+        # last_used 决定磁盘存储的淘汰顺序，内存命中与磁盘命中都要更新(随其他写入批量提交)
+        self._queue("UPDATE transition SET last_used = ? WHERE key = ?", (time.time(), key))
+
+    def _samples(self, key):
+        """
+            return: (list[str], bool), [采样结果, 是否从磁盘读取]
+            内存中采样不足时重新查询磁盘，其他任务/进程之后写入的采样可以被读到；未命中的key不放入内存
+        """
+        samples = self.memory.get(key)
+        if samples is not None and len(samples) >= self.samples_per_key:
+            self.memory.move_to_end(key)
+            self._touch(key)
+            return samples, False
+        samples, from_disk = samples or [], False
+        if self.conn is not None:
+            rows = self.conn.execute(
+                "SELECT next_state FROM transition WHERE key = ? ORDER BY sample", (key,)
+            ).fetchall()
+            if len(rows) > len(samples):
+                samples, from_disk = [row[0] for row in rows], True
+                self._touch(key)
+        if samples:
+            self._remember(key, samples)
+        return samples, from_disk
+
+    def get(self, key):
+        """
+            return: str | None, 采样数不足 samples_per_key 时返回None(需要请求世界模型)
+        """
+        with self.lock:
+            samples, from_disk = self._samples(key)
+            if len(samples) < self.samples_per_key:
+                self.misses += 1
+                return None
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.hits += 1
+            position = self.cursor.get(key, 0)
+            self.cursor[key] = position + 1
+            return samples[position % len(samples)]
+
+    def put(self, key, next_state):
+        if not next_state:
+            return
+        with self.lock:
+            samples, _ = self._samples(key)
+            if len(samples) >= self.samples_per_key:
+                return
+            samples.append(next_state)
+            self._remember(key, samples)
+            if self.conn is not None:
+                self._queue(
+                    "INSERT OR REPLACE INTO transition (key, sample, next_state, last_used) VALUES (?, ?, ?, ?)",
+                    (key, len(samples) - 1, next_state, time.time())
+                )
+                self.puts += 1
+                if self.puts % 256 == 0:
+                    self._flush()
+                    self._trim_disk()
+
+    def _trim_disk(self):
+        (count,) = self.conn.execute("SELECT COUNT(DISTINCT key) FROM transition").fetchone()
+        if count <= self.max_disk_keys:
+            return
+        self.conn.execute(
+            "DELETE FROM transition WHERE key IN "
+            "(SELECT key FROM transition GROUP BY key ORDER BY MAX(last_used) LIMIT ?)",
+            (count - self.max_disk_keys,)
+        )
+        self.conn.commit()
+        logger.info(">>> 世界模型缓存淘汰了%d个key", count - self.max_disk_keys)
+
+
+def open_world_cache(path, max_bytes=64 << 20, samples_per_key=1, max_disk_keys=200000):
+    return WorldCache.shared(path, max_bytes, samples_per_key=samples_per_key, max_disk_keys=max_disk_keys)